@@ -0,0 +1,390 @@
+# loadtest.py — offline gateway-event replay harness for Hazsbot
+# Builds synthetic guilds, members, channels and messages as real discord.py
+# models on top of a stubbed HTTP client, then replays an event stream through
+# main.py's own handlers (on_message, on_member_join, on_message_delete and the
+# command pipeline). No token or network access is needed.
+#
+# Usage:
+#   python loadtest.py --rate 200 --duration 30            # synthetic, 200 events/s
+#   python loadtest.py --events 20000 --rate 0             # as fast as possible
+#   python loadtest.py --events 5000 --save-stream s.jsonl # write the synthetic stream
+#   python loadtest.py --stream s.jsonl --speed 10         # replay a recording at 10x
+#   python loadtest.py --rest-latency 0.08 --json          # slower fake Discord, JSON report
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import itertools
+from collections import Counter
+from datetime import datetime, timezone
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# ---------------- STUBBED HTTP ----------------
+_ids = itertools.count(1_100_000_000_000_000_000)
+
+def snowflake() -> int:
+    return next(_ids)
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def user_payload(uid: int, name: str, bot: bool = False) -> dict:
+    return {"id": str(uid), "username": name, "discriminator": "0", "global_name": name, "avatar": None, "bot": bot}
+
+class StubHTTP:
+    # Stands in for discord.http.HTTPClient: every endpoint method returns a
+    # plausible payload after `latency` seconds and is counted by name.
+    def __init__(self, bot_user: dict, latency: float = 0.0):
+        self.bot_user = bot_user
+        self.latency = latency
+        self.calls = Counter()
+
+    async def _delay(self, name: str):
+        self.calls[name] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    def _message(self, channel_id, content=None, embeds=None) -> dict:
+        return {
+            "id": str(snowflake()), "channel_id": str(channel_id), "author": self.bot_user,
+            "content": content or "", "timestamp": _now_iso(), "edited_timestamp": None,
+            "tts": False, "mention_everyone": False, "mentions": [], "mention_roles": [],
+            "attachments": [], "embeds": embeds or [], "pinned": False, "type": 0,
+        }
+
+    async def send_message(self, channel_id, *, params, **_):
+        await self._delay("send_message")
+        payload = params.payload or {}
+        return self._message(channel_id, payload.get("content"), payload.get("embeds"))
+
+    async def get_message(self, channel_id, message_id, **_):
+        await self._delay("get_message")
+        return self._message(channel_id)
+
+    async def get_user(self, user_id, **_):
+        await self._delay("get_user")
+        return user_payload(int(user_id), f"user{user_id}")
+
+    async def create_role(self, guild_id, **fields):
+        await self._delay("create_role")
+        return {"id": str(snowflake()), "name": fields.get("name", "role"), "permissions": "0", "position": 1,
+                "color": 0, "hoist": False, "managed": False, "mentionable": False}
+
+    async def logs_from(self, *_, **__):
+        await self._delay("logs_from")
+        return []
+
+    async def get_audit_logs(self, *_, **__):
+        await self._delay("get_audit_logs")
+        return {"audit_log_entries": [], "users": [], "integrations": [], "webhooks": [], "threads": [],
+                "application_commands": [], "auto_moderation_rules": [], "guild_scheduled_events": []}
+
+    async def channel_webhooks(self, *_, **__):
+        await self._delay("channel_webhooks")
+        return []
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        async def endpoint(*_, **__):
+            await self._delay(name)
+            return None
+        return endpoint
+
+# ---------------- SYNTHETIC WORLD ----------------
+ADMIN_PERMS = str(0x8)
+MEMBER_PERMS = str(0x0000_0000_0006_4C40)  # view, send, embed, attach, history, add reactions
+
+class SyntheticWorld:
+    def __init__(self, main, guilds: int, members: int, channels: int, rest_latency: float):
+        import discord
+        self.discord = discord
+        self.main = main
+        self.bot = main.bot
+        self.bot_id = snowflake()
+        bot_user = user_payload(self.bot_id, "Hazsbot", bot=True)
+        self.http = StubHTTP(bot_user, rest_latency)
+        state = self.bot._connection
+        state.http = self.http
+        self.bot.http = self.http
+        state.user = discord.ClientUser(state=state, data=dict(bot_user, verified=True, mfa_enabled=False))
+        self.state = state
+        self.guilds = []    # discord.Guild
+        self.members = []   # per guild: [Member]
+        self.channels = []  # per guild: [TextChannel]
+        for gi in range(guilds):
+            self._add_guild(gi, members, channels)
+
+    def _add_guild(self, index: int, members: int, channels: int):
+        gid = snowflake()
+        admin_role = snowflake()
+        chan_ids = [snowflake() for _ in range(channels)]
+        member_ids = [snowflake() for _ in range(members)]
+        payload = {
+            "id": str(gid), "name": f"guild-{index}", "owner_id": str(member_ids[0]), "member_count": members + 1,
+            "roles": [
+                {"id": str(gid), "name": "@everyone", "permissions": MEMBER_PERMS, "position": 0, "color": 0,
+                 "hoist": False, "managed": False, "mentionable": False},
+                {"id": str(admin_role), "name": "Admin", "permissions": ADMIN_PERMS, "position": 1, "color": 0,
+                 "hoist": False, "managed": False, "mentionable": False},
+            ],
+            "channels": [
+                {"id": str(cid), "type": 0, "name": f"chat-{i}", "position": i, "permission_overwrites": [],
+                 "guild_id": str(gid), "nsfw": False, "topic": None, "rate_limit_per_user": 0}
+                for i, cid in enumerate(chan_ids)
+            ],
+            "members": [
+                {"user": user_payload(mid, f"user{index}_{i}"), "roles": [str(admin_role)] if i == 0 else [],
+                 "joined_at": _now_iso(), "deaf": False, "mute": False, "flags": 0}
+                for i, mid in enumerate(member_ids)
+            ] + [{"user": self.http.bot_user, "roles": [str(admin_role)], "joined_at": _now_iso(), "deaf": False, "mute": False, "flags": 0}],
+            "emojis": [], "stickers": [], "features": [], "threads": [], "voice_states": [], "presences": [],
+            "system_channel_id": str(chan_ids[0]), "large": members > 250, "unavailable": False,
+        }
+        guild = self.state._add_guild_from_data(payload)
+        self.guilds.append(guild)
+        self.members.append([guild.get_member(mid) for mid in member_ids])
+        self.channels.append([guild.get_channel(cid) for cid in chan_ids])
+
+    def message(self, gi: int, ci: int, ai: int, content: str):
+        guild = self.guilds[gi]
+        channel = self.channels[gi][ci]
+        author = self.members[gi][ai]
+        mentions = []
+        for token in content.split():
+            if token.startswith("<@") and token.endswith(">"):
+                m = guild.get_member(int(token.strip("<@!>")))
+                if m is not None:
+                    mentions.append(dict(user_payload(m.id, m.name), member={"roles": [], "joined_at": _now_iso(), "deaf": False, "mute": False, "flags": 0}))
+        data = {
+            "id": str(snowflake()), "channel_id": str(channel.id), "guild_id": str(guild.id),
+            "author": user_payload(author.id, author.name),
+            "member": {"roles": [str(r.id) for r in author.roles[1:]], "joined_at": _now_iso(), "deaf": False, "mute": False, "flags": 0},
+            "content": content, "timestamp": _now_iso(), "edited_timestamp": None, "tts": False,
+            "mention_everyone": False, "mentions": mentions, "mention_roles": [], "attachments": [],
+            "embeds": [], "pinned": False, "type": 0,
+        }
+        return self.discord.Message(state=self.state, channel=channel, data=data)
+
+    def join(self, gi: int):
+        guild = self.guilds[gi]
+        uid = snowflake()
+        member = self.discord.Member(data={"user": user_payload(uid, f"joiner{uid % 100000}"), "roles": [],
+                                           "joined_at": _now_iso(), "deaf": False, "mute": False, "flags": 0},
+                                     guild=guild, state=self.state)
+        guild._add_member(member)
+        self.members[gi].append(member)
+        return member
+
+# ---------------- EVENT STREAMS ----------------
+CHAT = ["hello there", "lol", "anyone up?", "gg", "that was a good game", "brb", "what time is it", "nice"]
+MUSIC_LINKS = [
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ", "https://youtu.be/9bZkp7q19f0",
+    "https://open.spotify.com/track/4cOdK2wGLETKBW3PvgPWqT", "https://soundcloud.com/artist/track",
+]
+COMMANDS = ["?dice 20", "?coinflip", "?rps rock", "?ship {a} {b}", "?wordle", "?guess crane", "?snipe",
+            "?userinfo", "?avatar", "?musicstats", "?version", "?warn {a} spam"]
+# event kind -> weight
+DEFAULT_MIX = {"chat": 70, "command": 15, "music": 8, "automod": 4, "delete": 2, "join": 1}
+
+def synthetic_stream(count: int, rate: float, guilds: int, channels: int, members: int, seed: int = 1, mix=None):
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    kinds, weights = zip(*mix.items())
+    t = 0.0
+    for _ in range(count):
+        kind = rng.choices(kinds, weights)[0]
+        ev = {"t": round(t, 6), "guild": rng.randrange(guilds), "channel": rng.randrange(channels), "author": rng.randrange(members)}
+        if kind == "join":
+            ev["type"] = "member_join"
+        elif kind == "delete":
+            ev["type"] = "message_delete"
+            ev["content"] = rng.choice(CHAT)
+        else:
+            ev["type"] = "message"
+            if kind == "chat":
+                ev["content"] = rng.choice(CHAT)
+            elif kind == "music":
+                ev["content"] = f"listen to this {rng.choice(MUSIC_LINKS)}"
+            elif kind == "automod":
+                ev["content"] = "WHY IS EVERYONE SHOUTING"
+            else:
+                ev["content"] = rng.choice(COMMANDS)
+                ev["mentions"] = [rng.randrange(members), rng.randrange(members)]
+        yield ev
+        if rate > 0:
+            t += rng.expovariate(rate)
+
+def load_stream(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+def save_stream(path: str, events):
+    with open(path, "w", encoding="utf-8") as f:
+        for ev in events:
+            f.write(json.dumps(ev, separators=(",", ":")) + "\n")
+
+# ---------------- REPLAY ----------------
+def _pct(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q / 100 * len(sorted_values)))]
+
+class Replayer:
+    def __init__(self, world: SyntheticWorld, speed: float = 1.0, max_in_flight: int = 10000):
+        self.world = world
+        self.main = world.main
+        self.speed = speed
+        self.latencies = {}  # event type -> [seconds]
+        self.errors = Counter()
+        self._sem = asyncio.Semaphore(max_in_flight)
+
+    def _materialize(self, ev):
+        gi = ev["guild"] % len(self.world.guilds)
+        members = self.world.members[gi]
+        if ev["type"] == "member_join":
+            return self.main.on_member_join, self.world.join(gi)
+        content = ev.get("content", "")
+        if "{a}" in content or "{b}" in content:
+            a, b = (ev.get("mentions") or [0, 1])[:2]
+            content = content.format(a=members[a % len(members)].mention, b=members[b % len(members)].mention)
+        msg = self.world.message(gi, ev["channel"] % len(self.world.channels[gi]), ev["author"] % len(members), content)
+        if ev["type"] == "message_delete":
+            return self.main.on_message_delete, msg
+        return self.main.on_message, msg
+
+    async def _run_one(self, ev, due: float):
+        async with self._sem:
+            handler, arg = self._materialize(ev)
+            try:
+                await handler(arg)
+            except Exception as e:
+                self.errors[f"{ev['type']}: {type(e).__name__}: {e}"[:160]] += 1
+            self.latencies.setdefault(ev["type"], []).append(time.perf_counter() - due)
+
+    async def run(self, events):
+        tasks = []
+        start = time.perf_counter()
+        for ev in events:
+            due = start + ev.get("t", 0.0) / self.speed if self.speed > 0 else time.perf_counter()
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif self.speed <= 0 and len(tasks) % 256 == 0:
+                await asyncio.sleep(0)  # let handlers make progress when unthrottled
+            tasks.append(asyncio.ensure_future(self._run_one(ev, due)))
+        await asyncio.gather(*tasks)
+        # let fire-and-forget work spawned by handlers (command dispatch etc.) settle
+        for _ in range(5):
+            await asyncio.sleep(0)
+        return time.perf_counter() - start
+
+def build_report(replayer: Replayer, wall: float, http: StubHTTP) -> dict:
+    all_lat = sorted(x for v in replayer.latencies.values() for x in v)
+    total = len(all_lat)
+    report = {
+        "events": total,
+        "wall_seconds": round(wall, 3),
+        "throughput_eps": round(total / wall, 1) if wall else 0.0,
+        "latency_ms": {
+            "p50": round(_pct(all_lat, 50) * 1000, 3),
+            "p95": round(_pct(all_lat, 95) * 1000, 3),
+            "p99": round(_pct(all_lat, 99) * 1000, 3),
+            "max": round((all_lat[-1] if all_lat else 0.0) * 1000, 3),
+        },
+        "by_type": {},
+        "rest_calls": dict(http.calls.most_common()),
+        "rest_calls_total": sum(http.calls.values()),
+        "rest_calls_per_event": round(sum(http.calls.values()) / total, 3) if total else 0.0,
+        "errors": dict(replayer.errors.most_common(10)),
+    }
+    for kind, values in sorted(replayer.latencies.items()):
+        values.sort()
+        report["by_type"][kind] = {
+            "count": len(values),
+            "p50_ms": round(_pct(values, 50) * 1000, 3),
+            "p99_ms": round(_pct(values, 99) * 1000, 3),
+        }
+    return report
+
+def print_report(report: dict):
+    lat = report["latency_ms"]
+    print(f"events       {report['events']} in {report['wall_seconds']}s  ->  {report['throughput_eps']} events/s")
+    print(f"latency ms   p50 {lat['p50']}  p95 {lat['p95']}  p99 {lat['p99']}  max {lat['max']}")
+    for kind, row in report["by_type"].items():
+        print(f"  {kind:<15} n={row['count']:<7} p50 {row['p50_ms']:>9.3f}  p99 {row['p99_ms']:>9.3f}")
+    print(f"REST calls   {report['rest_calls_total']} ({report['rest_calls_per_event']}/event)")
+    for name, n in report["rest_calls"].items():
+        print(f"  {name:<22} {n}")
+    if report["errors"]:
+        print("errors:")
+        for err, n in report["errors"].items():
+            print(f"  {n:>6}  {err}")
+
+def load_main(workdir: str):
+    # main.py keeps its data files relative to the cwd; run it in a scratch dir
+    # so a load test never touches the real servers.json.
+    if HERE not in sys.path:
+        sys.path.insert(0, HERE)
+    os.chdir(workdir)
+    import main
+    return main
+
+async def _amain(args):
+    main = load_main(args.workdir or tempfile.mkdtemp(prefix="hazsbot-loadtest-"))
+    await main.bot._async_setup_hook()  # binds bot.loop as login() would
+    world = SyntheticWorld(main, args.guilds, args.members, args.channels, args.rest_latency)
+
+    async def fake_oembed(url, template, timeout=6.0):
+        if args.oembed_latency:
+            await asyncio.sleep(args.oembed_latency)
+        world.http.calls["oembed (external)"] += 1
+        return {"title": f"Track {abs(hash(url)) % 1000}", "author_name": "Artist"}
+    main._fetch_oembed = fake_oembed
+
+    if args.stream:
+        events = list(load_stream(args.stream))
+    else:
+        count = args.events or max(1, int(args.rate * args.duration))
+        events = list(synthetic_stream(count, args.rate, args.guilds, args.channels, args.members, args.seed))
+    if args.save_stream:
+        save_stream(args.save_stream, events)
+    replayer = Replayer(world, speed=args.speed if args.stream else (1.0 if args.rate > 0 else 0.0))
+    wall = await replayer.run(events)
+    report = build_report(replayer, wall, world.http)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return report
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Replay gateway events through Hazsbot's handlers offline.")
+    p.add_argument("--rate", type=float, default=100.0, help="synthetic events per second (0 = as fast as possible)")
+    p.add_argument("--duration", type=float, default=10.0, help="synthetic stream length in seconds")
+    p.add_argument("--events", type=int, default=0, help="synthetic event count (overrides --duration)")
+    p.add_argument("--stream", help="replay a recorded JSONL event stream")
+    p.add_argument("--speed", type=float, default=1.0, help="time scale for --stream (0 = as fast as possible)")
+    p.add_argument("--save-stream", help="write the event stream used to this JSONL file")
+    p.add_argument("--guilds", type=int, default=5)
+    p.add_argument("--members", type=int, default=200, help="members per guild")
+    p.add_argument("--channels", type=int, default=10, help="text channels per guild")
+    p.add_argument("--rest-latency", type=float, default=0.03, help="simulated Discord REST latency in seconds")
+    p.add_argument("--oembed-latency", type=float, default=0.15, help="simulated oEmbed provider latency in seconds")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--workdir", help="directory for main.py's data files (default: a temp dir)")
+    p.add_argument("--json", action="store_true", help="print the report as JSON")
+    return p.parse_args(argv)
+
+if __name__ == "__main__":
+    asyncio.run(_amain(parse_args()))
@@ -1,6 +1,6 @@
 # main.py — Hazsbot (single-file)
 # Features: Control Panel, Music link detection, Automod, Wordle, Ship, Moderation, AI (?ask)
-# Requirements: discord.py, aiohttp, psutil (optional), openai
+# Requirements: discord.py, aiohttp, psutil (optional), openai, PyNaCl + ffmpeg (local music playback)
 #
 # Usage:
 # 1. Install deps: pip install -r requirements.txt
@@ -10,14 +10,33 @@
 import os
 import sys
 import json
+import math
+import gzip
+import io
+import queue
+import atexit
+import heapq
+import contextvars
+import tracemalloc
 import random
 import asyncio
 import time
 import platform
 import traceback
 import re
-from datetime import datetime, timedelta
-from urllib.parse import urlparse
+import shutil
+import hashlib
+import sqlite3
+import subprocess
+import statistics
+from array import array
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+import threading
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse, parse_qs
 
 # Optional deps (may be absent)
 try:
@@ -30,8 +49,14 @@ try:
 except Exception:
     aiohttp = None
 
+try:
+    import aiohttp.web as aiohttp_web  # health server only
+except Exception:
+    aiohttp_web = None
+
 import discord
 from discord.ext import commands
+from discord.oggparse import OggStream
 
 # try to import OpenAI client (OpenRouter/DeepSeek usage)
 try:
@@ -39,14 +64,6 @@ try:
 except Exception:
     OpenAI = None
 
-# optional keep-alive helper for Replit (simple Flask ping endpoint)
-try:
-    from keep_alive import keep_alive
-except Exception:
-    def keep_alive():
-        # noop if keep_alive isn't provided
-        return
-
 # ---------------- CONFIG ----------------
 VERSION = "1.1.1"
 DATA_FILE = "servers.json"
@@ -64,6 +81,22 @@ def _int_env(name: str, default: int) -> int:
     except Exception:
         return default
 
+def _float_env(name: str, default: float, lo: float | None = None, hi: float | None = None) -> float:
+    v = os.getenv(name)
+    if v is None:
+        return default
+    try:
+        f = float(v)
+    except Exception:
+        return default
+    if not math.isfinite(f):
+        return default
+    if lo is not None:
+        f = max(lo, f)
+    if hi is not None:
+        f = min(hi, f)
+    return f
+
 # Panel ownership / binding (set these if you want a control server)
 PANEL_GUILD_ID = _int_env("PANEL_GUILD_ID", 0)
 PANEL_OWNER_ID = _int_env("PANEL_OWNER_ID", 0)
@@ -84,6 +117,164 @@ intents.members = True
 intents.message_content = True
 intents.presences = True
 
+# ---------------- METRICS ----------------
+# Prometheus text-format metrics. Children for every known label set are
+# allocated up front (or once on first use for open-ended labels such as
+# command names) and updated with plain attribute arithmetic from the event
+# loop; the scrape thread only reads them. Gauges are computed at scrape time.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v: float):
+        self.counts[bisect_left(self.bounds, v)] += 1
+        self.sum += v
+        self.count += 1
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class MetricFamily:
+    def __init__(self, name: str, help_text: str, kind: str, labelnames=(), buckets=LATENCY_BUCKETS, prealloc=()):
+        self.name = name
+        self.help = help_text
+        self.kind = kind  # "counter" | "histogram"
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._children = {}
+        for values in prealloc:
+            self.labels(*values)
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = _CounterChild() if self.kind == "counter" else _HistogramChild(self.buckets)
+            self._children[values] = child
+        return child
+
+    def _fmt_labels(self, values, extra=None):
+        pairs = list(zip(self.labelnames, values))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in pairs) + "}"
+
+    def render(self, out: list):
+        out.append(f"# HELP {self.name} {self.help}")
+        out.append(f"# TYPE {self.name} {self.kind}")
+        for values, child in list(self._children.items()):
+            if self.kind == "counter":
+                out.append(f"{self.name}{self._fmt_labels(values)} {child.value}")
+                continue
+            cumulative = 0
+            for bound, n in zip(self.buckets, child.counts):
+                cumulative += n
+                out.append(f"{self.name}_bucket{self._fmt_labels(values, ('le', bound))} {cumulative}")
+            out.append(f"{self.name}_bucket{self._fmt_labels(values, ('le', '+Inf'))} {child.count}")
+            out.append(f"{self.name}_sum{self._fmt_labels(values)} {child.sum}")
+            out.append(f"{self.name}_count{self._fmt_labels(values)} {child.count}")
+
+class MetricsRegistry:
+    def __init__(self):
+        self.families = []
+        self.gauges = []  # (name, help, labelname or None, fn, kind)
+
+    def counter(self, name, help_text, labelnames=(), prealloc=()):
+        fam = MetricFamily(name, help_text, "counter", labelnames, prealloc=prealloc)
+        self.families.append(fam)
+        return fam
+
+    def histogram(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS, prealloc=()):
+        fam = MetricFamily(name, help_text, "histogram", labelnames, buckets, prealloc)
+        self.families.append(fam)
+        return fam
+
+    def gauge(self, name, help_text, fn, labelname=None):
+        # fn() returns a number, or {label value: number} when labelname is set
+        self.gauges.append((name, help_text, labelname, fn, "gauge"))
+
+    def counter_fn(self, name, help_text, fn, labelname=None):
+        # like gauge(), for totals that only grow but are kept by another object;
+        # exported as a counter so rate() and reset detection work
+        self.gauges.append((name, help_text, labelname, fn, "counter"))
+
+    def render(self) -> str:
+        out = []
+        for fam in self.families:
+            fam.render(out)
+        for name, help_text, labelname, fn, kind in self.gauges:
+            try:
+                value = fn()
+            except Exception:
+                continue
+            if value is None:
+                continue
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {kind}")
+            if labelname:
+                for k, v in value.items():
+                    out.append(f'{name}{{{labelname}="{_escape_label(k)}"}} {v}')
+            else:
+                out.append(f"{name} {value}")
+        return "\n".join(out) + "\n"
+
+metrics = MetricsRegistry()
+MESSAGE_STAGES = ("received", "automod", "music", "commands")
+AUTOMOD_RULES = ("profanity", "caps", "invite")
+M_MESSAGES = metrics.counter("hazsbot_messages_total", "Messages processed per on_message stage.", ("stage",), [(s,) for s in MESSAGE_STAGES])
+M_COMMAND_LATENCY = metrics.histogram("hazsbot_command_latency_seconds", "Command wall time by command name.", ("command", "outcome"))
+M_AUTOMOD_HITS = metrics.counter("hazsbot_automod_hits_total", "Messages removed by automod per rule.", ("rule",), [(r,) for r in AUTOMOD_RULES])
+M_STORAGE_FLUSH = metrics.histogram("hazsbot_storage_flush_seconds", "Time spent writing a persistence file.", ("store",), prealloc=[("servers",), ("music_stats",)])
+M_LOOP_LAG = metrics.histogram("hazsbot_event_loop_lag_seconds", "Event loop scheduling lag.", buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0), prealloc=[()])
+_m_stage = {s: M_MESSAGES.labels(s) for s in MESSAGE_STAGES}
+_m_automod = {r: M_AUTOMOD_HITS.labels(r) for r in AUTOMOD_RULES}
+_m_flush_servers = M_STORAGE_FLUSH.labels("servers")
+_m_flush_music = M_STORAGE_FLUSH.labels("music_stats")
+_m_loop_lag = M_LOOP_LAG.labels()
+_last_loop_lag = [0.0]
+
+# Per-command wait accounting: before_invoke installs a CommandTrace in this
+# context variable and the REST, file and AI wrappers add their elapsed time.
+# The trace is also the single clock for a command: `started` is stamped in
+# before_invoke and `wall` in after_invoke, and the latency histogram, the
+# perf report and the event log all read those.
+class CommandTrace:
+    __slots__ = ("command", "started", "rest", "rest_calls", "io", "ai", "done", "wall")
+
+    def __init__(self, command: str):
+        self.command = command
+        self.started = time.perf_counter()
+        self.rest = 0.0
+        self.rest_calls = 0
+        self.io = 0.0
+        self.ai = 0.0
+        self.done = False
+        self.wall = None  # seconds, set in after_invoke
+
+_current_trace = contextvars.ContextVar("hazsbot_trace", default=None)
+
+def _trace_add(field: str, seconds: float):
+    t = _current_trace.get()
+    if t is not None and not t.done:
+        setattr(t, field, getattr(t, field) + seconds)
+
 # ---------------- PERSISTENCE ----------------
 def load_data():
     if not os.path.exists(DATA_FILE):
@@ -96,11 +287,116 @@ def load_data():
             return {}
 
 def save_data(data):
+    started = time.perf_counter()
     with open(DATA_FILE, "w", encoding="utf-8") as f:
         json.dump(data, f, indent=2)
+    elapsed = time.perf_counter() - started
+    _m_flush_servers.observe(elapsed)
+    _trace_add("io", elapsed)
 
 server_data = load_data()
 
+# ---------------- EVENT LOG ----------------
+# Structured diagnostics as gzip-compressed JSONL segments under EVENT_LOG_DIR.
+# Callers only pay for one SimpleQueue.put; a daemon thread serialises records
+# in batches, rotates a segment once it holds EVENT_LOG_SEGMENT_BYTES of JSON
+# and keeps the newest EVENT_LOG_KEEP_SEGMENTS files.
+EVENT_LOG_DIR = os.getenv("EVENT_LOG_DIR", "events")
+EVENT_LOG_SEGMENT_BYTES = _int_env("EVENT_LOG_SEGMENT_BYTES", 8 * 1024 * 1024)
+EVENT_LOG_KEEP_SEGMENTS = _int_env("EVENT_LOG_KEEP_SEGMENTS", 20)
+EVENT_LOG_BATCH = 512
+
+class EventLog:
+    def __init__(self, directory: str, segment_bytes: int, keep_segments: int):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.keep_segments = keep_segments
+        self._q = queue.SimpleQueue()
+        self._thread = None
+        self._file = None
+        self._written = 0
+        self._seq = 0
+        self.records = 0
+
+    def emit(self, event: str, guild_id=None, latency_ms=None, outcome: str = "ok", **fields):
+        if self._thread is None:
+            self.start()
+        self._q.put((time.time(), event, guild_id, latency_ms, outcome, fields))
+
+    @property
+    def backlog(self) -> int:
+        return self._q.qsize()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="event-log", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def close(self, timeout: float = 5.0):
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._q.put(None)
+        self._thread.join(timeout)
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.close()
+        os.makedirs(self.directory, exist_ok=True)
+        self._seq += 1
+        name = f"events-{datetime.utcnow():%Y%m%d-%H%M%S}-{os.getpid()}-{self._seq:04d}.jsonl.gz"
+        self._file = gzip.open(os.path.join(self.directory, name), "wb", compresslevel=6)
+        self._written = 0
+        segments = sorted(f for f in os.listdir(self.directory) if f.startswith("events-") and f.endswith(".jsonl.gz"))
+        for old in segments[:-self.keep_segments]:
+            try:
+                os.remove(os.path.join(self.directory, old))
+            except OSError:
+                pass
+
+    def _run(self):
+        while True:
+            batch = [self._q.get()]
+            try:
+                while len(batch) < EVENT_LOG_BATCH:
+                    batch.append(self._q.get_nowait())
+            except queue.Empty:
+                pass
+            stop = False
+            lines = []
+            for item in batch:
+                if item is None:
+                    stop = True
+                    continue
+                ts, event, guild_id, latency_ms, outcome, fields = item
+                rec = {"ts": round(ts, 3), "event": event, "outcome": outcome}
+                if guild_id is not None:
+                    rec["guild_id"] = guild_id
+                if latency_ms is not None:
+                    rec["latency_ms"] = round(latency_ms, 2)
+                rec.update(fields)
+                lines.append(json.dumps(rec, default=str, separators=(",", ":")))
+            try:
+                if lines:
+                    data = ("\n".join(lines) + "\n").encode("utf-8")
+                    if self._file is None or self._written + len(data) > self.segment_bytes:
+                        self._rotate()
+                    self._file.write(data)
+                    self._file.flush()
+                    self._written += len(data)
+                    self.records += len(lines)
+                if stop and self._file is not None:
+                    self._file.close()
+                    self._file = None
+            except Exception as e:
+                print(f"[event_log] write failed: {e}")
+            if stop:
+                return
+
+event_log = EventLog(EVENT_LOG_DIR, EVENT_LOG_SEGMENT_BYTES, EVENT_LOG_KEEP_SEGMENTS)
+elog = event_log.emit
+
 # ---------------- BOT SETUP ----------------
 async def _prefix_callable(bot, message):
     if not message.guild:
@@ -110,7 +406,18 @@ async def _prefix_callable(bot, message):
         return server_data[gid]["prefix"]
     return DEFAULT_PREFIX
 
-bot = commands.Bot(command_prefix=_prefix_callable, intents=intents)
+class HazsBot(commands.Bot):
+    # the health server (see HEALTH SERVER) starts and stops with the bot
+    async def setup_hook(self):
+        await super().setup_hook()
+        await health_server.start()
+
+    async def close(self):
+        _gateway_connected[0] = False
+        await health_server.stop()
+        await super().close()
+
+bot = HazsBot(command_prefix=_prefix_callable, intents=intents)
 start_time = time.time()
 
 # OpenRouter/DeepSeek client (best-effort; may be None)
@@ -126,15 +433,16 @@ if DEEPSEEK_API_KEY and OpenAI is not None:
 # ---------------- HELPERS ----------------
 def ensure_guild(guild_id: int):
     gid = str(guild_id)
-    if gid not in server_data:
+    created = gid not in server_data
+    if created:
         server_data[gid] = {}
     g = server_data[gid]
+    keys = len(g)
     g.setdefault("warnings", {})
     g.setdefault("mod_roles", [])
     g.setdefault("auto_mod_enabled", True)
-    g.setdefault("scheduled_unbans", [])
-    g.setdefault("scheduled_unmutes", [])
     g.setdefault("prefix", DEFAULT_PREFIX)
+    g.setdefault("mute_mode", "role")
     g.setdefault("categories", {"music": True, "fun": True, "utility": True})
     g.setdefault("welcome_message", "Welcome {user}!")
     g.setdefault("leave_message", "{user} left.")
@@ -146,12 +454,16 @@ def ensure_guild(guild_id: int):
         "dashboard": 0,
         "joins": 0,
     })
+    changed = created or len(g) != keys
     # pre-seed panel guild channels
     if PANEL_GUILD_ID and guild_id == PANEL_GUILD_ID:
         for k, v in PRESEED_LOG_CHANNELS.items():
             if v and g["log_channels"].get(k) != v:
                 g["log_channels"][k] = v
-    save_data(server_data)
+                changed = True
+    # runs on every message; only rewrite servers.json when defaults were added
+    if changed:
+        save_data(server_data)
     return g
 
 last_deleted_message = {}
@@ -165,6 +477,7 @@ async def safe_send(destination, content=None, embed=None):
             return await destination.send(content)
     except Exception as e:
         print(f"[safe_send] Error sending message: {e}")
+        elog("safe_send", getattr(getattr(destination, "guild", None), "id", None), outcome="error", error=str(e))
         return None
 
 def is_owner_member(member: discord.Member):
@@ -192,29 +505,263 @@ def is_panel_owner_ctx(ctx: commands.Context) -> bool:
         and ctx.author.id == PANEL_OWNER_ID
     )
 
-async def _get_panel_channel(kind: str):
-    if not PANEL_GUILD_ID:
-        return None
-    guild = bot.get_guild(PANEL_GUILD_ID)
-    if not guild:
-        return None
-    ensure_guild(PANEL_GUILD_ID)
-    chan_id = server_data[str(PANEL_GUILD_ID)]["log_channels"].get(kind, 0)
-    if not chan_id:
-        return None
-    return guild.get_channel(int(chan_id))
+# (guild id, kind) -> resolved log channel (or None when unset); cleared by
+# invalidate_log_channels() whenever the mapping or the guild changes
+_log_channels = {}
 
-async def log_event(kind: str, content: str, embed: discord.Embed | None = None):
-    ch = await _get_panel_channel(kind)
-    if not ch:
+def invalidate_log_channels(guild_id: int | None = None):
+    if guild_id is None:
+        _log_channels.clear()
         return
+    for key in [k for k in _log_channels if k[0] == guild_id]:
+        del _log_channels[key]
+
+async def _get_log_channel(guild_id: int, kind: str):
     try:
-        if embed:
-            await ch.send(content=content or discord.utils.utcnow().isoformat(), embed=embed)
+        return _log_channels[(guild_id, kind)]
+    except KeyError:
+        pass
+    if not guild_id:
+        return None
+    guild = bot.get_guild(guild_id)
+    if not guild or guild.unavailable:
+        return None  # not cached: the guild may still become available
+    g = server_data.get(str(guild_id))
+    if g is None:
+        g = ensure_guild(guild_id)
+    chan_id = g.get("log_channels", {}).get(kind, 0)
+    ch = guild.get_channel(int(chan_id)) if chan_id else None
+    _log_channels[(guild_id, kind)] = ch
+    return ch
+
+async def _get_panel_channel(kind: str):
+    return await _get_log_channel(PANEL_GUILD_ID, kind)
+
+# Log delivery goes through one bot-owned webhook per channel, created on first
+# use and reused afterwards. Webhook executions have their own rate-limit
+# buckets, so logging does not eat into the bot's channel send budget. Channels
+# where the bot cannot manage webhooks fall back to a normal send and are
+# retried after LOG_WEBHOOK_RETRY seconds, so a later permission grant is seen.
+LOG_WEBHOOK_NAME = "Hazsbot Logs"
+LOG_WEBHOOK_RETRY = 600.0
+
+class WebhookPool:
+    def __init__(self):
+        self._hooks = {}   # channel id -> Webhook
+        self._misses = {}  # channel id -> monotonic time to try again
+
+    def discard(self, channel_id: int):
+        self._hooks.pop(channel_id, None)
+        self._misses.pop(channel_id, None)
+
+    def discard_guild(self, guild: discord.Guild):
+        for ch in guild.channels:
+            self.discard(ch.id)
+
+    def _miss(self, channel_id: int):
+        self._hooks.pop(channel_id, None)
+        self._misses[channel_id] = time.monotonic() + LOG_WEBHOOK_RETRY
+
+    async def get(self, channel):
+        hook = self._hooks.get(channel.id)
+        if hook is not None:
+            return hook
+        retry_at = self._misses.get(channel.id)
+        if retry_at is not None and time.monotonic() < retry_at:
+            return None
+        me = channel.guild.me
+        if me is not None and channel.permissions_for(me).manage_webhooks:
+            try:
+                for h in await channel.webhooks():
+                    if h.name == LOG_WEBHOOK_NAME and h.user and h.user.id == me.id and h.token:
+                        hook = h
+                        break
+                if hook is None:
+                    hook = await channel.create_webhook(name=LOG_WEBHOOK_NAME, reason="Hazsbot log delivery")
+            except Exception as e:
+                print(f"[webhook_pool] webhook setup failed for #{channel}: {e}")
+                hook = None
+        if hook is None:
+            self._miss(channel.id)
         else:
-            await ch.send(content)
-    except Exception as e:
-        print(f"[log_event:{kind}] send failed: {e}")
+            self._misses.pop(channel.id, None)
+            self._hooks[channel.id] = hook
+        return hook
+
+    async def send(self, channel, content: str, embeds: list):
+        hook = await self.get(channel)
+        if hook is not None:
+            try:
+                await hook.send(
+                    content=content or discord.utils.MISSING,
+                    embeds=embeds,
+                    username=bot.user.display_name if bot.user else LOG_WEBHOOK_NAME,
+                    avatar_url=bot.user.display_avatar.url if bot.user else discord.utils.MISSING,
+                )
+                return
+            except discord.NotFound:
+                self.discard(channel.id)  # deleted behind our back; recreated next time
+            except discord.Forbidden:
+                self._miss(channel.id)
+        await channel.send(content=content or None, embeds=embeds)
+
+webhook_pool = WebhookPool()
+
+# Log lines are queued and flushed every LOG_FLUSH_INTERVAL seconds, packed per
+# kind into as few messages as Discord allows (2000 chars of content, 10 embeds
+# and 6000 embed chars per message). The queue is bounded; when it is full the
+# oldest line of the lowest priority present is dropped and counted.
+#
+# Kinds have a priority (0 = high). High-priority lines are never dropped or
+# shed. Under backpressure (queue past the watermark, or the last flush took
+# longer than the flush interval) low-priority kinds keep one line in
+# LOG_SHED_SAMPLE and the rest are folded into a per-kind count.
+LOG_FLUSH_INTERVAL = 2.0
+LOG_QUEUE_MAX = 1000
+LOG_PRIORITIES = {"errors": 0, "moderation": 0, "joins": 1, "dashboard": 1, "commands": 2, "music": 2}
+LOG_PRIORITY_LOW = 2
+LOG_SHED_WATERMARK = 0.5  # fraction of LOG_QUEUE_MAX
+LOG_SHED_SAMPLE = 10
+LOG_SHED_WINDOW = 60.0    # seconds covered by shed_rate()
+MSG_CONTENT_LIMIT = 2000
+MSG_EMBEDS_LIMIT = 10
+MSG_EMBED_CHARS_LIMIT = 6000
+
+class LogSink:
+    def __init__(self, interval: float, max_pending: int):
+        self.interval = interval
+        self.max_pending = max_pending
+        self._queues = [deque() for _ in range(LOG_PRIORITY_LOW + 1)]  # per priority: (kind, content, embed, guild_id)
+        self._size = 0
+        self._slow = False
+        self._task = None
+        self.dropped = 0
+        self._dropped_reported = 0
+        self.sent_messages = 0
+        self.shed_total = 0
+        self._shed = Counter()        # kind -> lines shed since last flush
+        self._sample_seq = Counter()  # kind -> low-priority lines seen while shedding
+        self._offered = 0             # since last flush
+        self._window = deque()        # (monotonic time, offered, shed) per flush
+
+    @property
+    def pending(self) -> int:
+        return self._size
+
+    def under_pressure(self) -> bool:
+        return self._slow or self._size >= self.max_pending * LOG_SHED_WATERMARK
+
+    def _trim_window(self, now: float):
+        # the flush task stops when the queue is idle, so age out by time
+        # rather than by flush count
+        while self._window and now - self._window[0][0] > LOG_SHED_WINDOW:
+            self._window.popleft()
+
+    def shed_rate(self) -> float:
+        self._trim_window(time.monotonic())
+        offered = self._offered + sum(o for _, o, _ in self._window)
+        shed = sum(self._shed.values()) + sum(n for _, _, n in self._window)
+        return shed / offered if offered else 0.0
+
+    def _evict(self, prio: int) -> bool:
+        # drop the oldest line from the lowest priority that is not above the
+        # incoming one; high-priority lines are never evicted
+        for p in range(LOG_PRIORITY_LOW, max(prio, 1) - 1, -1):
+            if self._queues[p]:
+                self._queues[p].popleft()
+                self._size -= 1
+                self.dropped += 1
+                return True
+        return False
+
+    def emit(self, kind: str, content: str, embed: discord.Embed | None = None, guild_id: int | None = None):
+        prio = LOG_PRIORITIES.get(kind, 1)
+        self._offered += 1
+        if prio >= LOG_PRIORITY_LOW and self.under_pressure():
+            self._sample_seq[kind] += 1
+            if self._sample_seq[kind] % LOG_SHED_SAMPLE:
+                self._shed[kind] += 1
+                self.shed_total += 1
+                return
+        if self._size >= self.max_pending and not self._evict(prio) and prio > 0:
+            self.dropped += 1
+            return
+        self._queues[prio].append((kind, content, embed, guild_id))
+        self._size += 1
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while self._size or self._shed:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    @staticmethod
+    def pack(entries):
+        # entries: [(content, embed)] -> [(content, [embeds])]
+        messages = []
+        lines, embeds, embed_chars, length = [], [], 0, 0
+        for content, embed in entries:
+            line = (content or "")[:MSG_CONTENT_LIMIT]
+            size = len(embed) if embed is not None else 0
+            if lines or embeds:
+                too_long = line and length + len(line) + 1 > MSG_CONTENT_LIMIT
+                too_many = embed is not None and (len(embeds) >= MSG_EMBEDS_LIMIT or embed_chars + size > MSG_EMBED_CHARS_LIMIT)
+                if too_long or too_many:
+                    messages.append(("\n".join(lines), embeds))
+                    lines, embeds, embed_chars, length = [], [], 0, 0
+            if line:
+                length += len(line) + (1 if lines else 0)
+                lines.append(line)
+            if embed is not None:
+                embeds.append(embed)
+                embed_chars += size
+        if lines or embeds:
+            messages.append(("\n".join(lines), embeds))
+        return messages
+
+    async def flush(self):
+        started = time.perf_counter()
+        # (destination guild id, kind) -> entries; every line goes to the panel
+        # and, when it belongs to another guild, to that guild's own channel too
+        by_dest = {}
+        for q in self._queues:  # high priority first
+            while q:
+                kind, content, embed, guild_id = q.popleft()
+                by_dest.setdefault((PANEL_GUILD_ID, kind), []).append((content, embed))
+                if guild_id and guild_id != PANEL_GUILD_ID:
+                    by_dest.setdefault((guild_id, kind), []).append((content, embed))
+        self._size = 0
+        if self.dropped != self._dropped_reported:
+            n = self.dropped - self._dropped_reported
+            self._dropped_reported = self.dropped
+            by_dest.setdefault((PANEL_GUILD_ID, "errors"), []).append((f"\u26A0 log queue full: dropped {n} line(s) ({self.dropped} total)", None))
+        for kind, n in self._shed.items():
+            by_dest.setdefault((PANEL_GUILD_ID, kind), []).append((f"\u26A0 {n} {kind} line(s) shed under load", None))
+        now = time.monotonic()
+        self._trim_window(now)
+        self._window.append((now, self._offered, sum(self._shed.values())))
+        self._offered = 0
+        self._shed.clear()
+        for (guild_id, kind), entries in by_dest.items():
+            ch = await _get_log_channel(guild_id, kind)
+            if not ch:
+                continue
+            for content, embeds in self.pack(entries):
+                try:
+                    await webhook_pool.send(ch, content, embeds)
+                    self.sent_messages += 1
+                except Exception as e:
+                    print(f"[log_event:{kind}] send to guild {guild_id} failed: {e}")
+        self._slow = (time.perf_counter() - started) > self.interval
+
+log_sink = LogSink(LOG_FLUSH_INTERVAL, LOG_QUEUE_MAX)
+
+async def log_event(kind: str, content: str, embed: discord.Embed | None = None, guild_id: int | None = None):
+    # guild_id also routes the line to that guild's own log channel for `kind`
+    if embed:
+        content = content or discord.utils.utcnow().isoformat()
+    log_sink.emit(kind, content, embed, guild_id)
 
 # ---------------- AUTOMOD ----------------
 def check_profanity(text: str):
@@ -246,22 +793,704 @@ MUSIC_PROVIDERS = {
 
 URL_REGEX = re.compile(r"(https?://[^\s<>]+)")
 
+# ---------------- OEMBED CACHE ----------------
+# Two tiers: a small in-memory LRU in front of a SQLite file so restarts start warm.
+# The database is only opened on the first memory miss, so startup cost does not
+# depend on how large the cache file has grown.
+OEMBED_CACHE_FILE = os.getenv("OEMBED_CACHE_FILE", "oembed_cache.sqlite3")
+OEMBED_CACHE_TTL = _int_env("OEMBED_CACHE_TTL", 7 * 24 * 3600)            # seconds
+OEMBED_CACHE_MEM_ENTRIES = _int_env("OEMBED_CACHE_MEM_ENTRIES", 512)
+OEMBED_CACHE_DISK_BYTES = _int_env("OEMBED_CACHE_DISK_BYTES", 32 * 1024 * 1024)
+
+class OEmbedCache:
+    def __init__(self, path: str, mem_entries: int, ttl: int, disk_bytes: int):
+        self.path = path
+        self.mem_entries = mem_entries
+        self.ttl = ttl
+        self.disk_bytes = disk_bytes
+        self._mem = OrderedDict()  # key -> (expires_at, data)
+        self._db = None
+        self._db_failed = False
+        self._db_size = 0
+        self._lock = threading.Lock()  # disk tier runs on executor threads
+        self.hits = {"memory": 0, "disk": 0, "miss": 0}
+
+    # --- memory tier ---
+    def _mem_get(self, key: str):
+        item = self._mem.get(key)
+        if item is None:
+            return None
+        if item[0] <= time.time():
+            del self._mem[key]
+            return None
+        self._mem.move_to_end(key)
+        return item
+
+    def _mem_put(self, key: str, expires_at: float, data: dict):
+        self._mem[key] = (expires_at, data)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.mem_entries:
+            self._mem.popitem(last=False)
+
+    # --- disk tier (blocking; call through run_in_executor) ---
+    def _open(self):
+        if self._db is not None or self._db_failed:
+            return self._db
+        try:
+            db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS oembed ("
+                "key TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL, "
+                "used_at REAL NOT NULL, size INTEGER NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS oembed_used ON oembed(used_at)")
+            db.execute("CREATE INDEX IF NOT EXISTS oembed_expires ON oembed(expires_at)")
+            db.execute("DELETE FROM oembed WHERE expires_at <= ?", (time.time(),))
+            self._db_size = db.execute("SELECT COALESCE(SUM(size), 0) FROM oembed").fetchone()[0]
+            self._db = db
+        except Exception as e:
+            print(f"[oembed_cache] disk tier disabled: {e}")
+            self._db_failed = True
+        return self._db
+
+    def _disk_get(self, key: str):
+        with self._lock:
+            db = self._open()
+            if db is None:
+                return None
+            row = db.execute("SELECT data, expires_at, size FROM oembed WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            data, expires_at, size = row
+            now = time.time()
+            if expires_at <= now:
+                db.execute("DELETE FROM oembed WHERE key = ?", (key,))
+                self._db_size -= size
+                return None
+            db.execute("UPDATE oembed SET used_at = ? WHERE key = ?", (now, key))
+            return expires_at, json.loads(data)
+
+    def _disk_put(self, key: str, expires_at: float, data: dict):
+        blob = json.dumps(data, separators=(",", ":"))
+        size = len(key) + len(blob)
+        if size > self.disk_bytes:
+            return
+        with self._lock:
+            db = self._open()
+            if db is None:
+                return
+            old = db.execute("SELECT size FROM oembed WHERE key = ?", (key,)).fetchone()
+            if old:
+                self._db_size -= old[0]
+            db.execute(
+                "INSERT OR REPLACE INTO oembed (key, data, expires_at, used_at, size) VALUES (?, ?, ?, ?, ?)",
+                (key, blob, expires_at, time.time(), size),
+            )
+            self._db_size += size
+            if self._db_size > self.disk_bytes:
+                self._evict(db)
+
+    def _evict(self, db):
+        # drop expired rows first, then least recently used until 90% of the budget
+        now = time.time()
+        freed = db.execute("SELECT COALESCE(SUM(size), 0) FROM oembed WHERE expires_at <= ?", (now,)).fetchone()[0]
+        db.execute("DELETE FROM oembed WHERE expires_at <= ?", (now,))
+        self._db_size -= freed
+        target = int(self.disk_bytes * 0.9)
+        victims = []
+        for key, size in db.execute("SELECT key, size FROM oembed ORDER BY used_at"):
+            if self._db_size <= target:
+                break
+            victims.append((key,))
+            self._db_size -= size
+        db.executemany("DELETE FROM oembed WHERE key = ?", victims)
+
+    # --- public async API ---
+    async def get(self, key: str):
+        item = self._mem_get(key)
+        if item is not None:
+            self.hits["memory"] += 1
+            return item[1]
+        try:
+            item = await asyncio.get_running_loop().run_in_executor(None, self._disk_get, key)
+        except Exception as e:
+            print(f"[oembed_cache] disk read failed: {e}")
+            item = None
+        if item is None:
+            self.hits["miss"] += 1
+            return None
+        self.hits["disk"] += 1
+        self._mem_put(key, item[0], item[1])
+        return item[1]
+
+    async def put(self, key: str, data: dict):
+        expires_at = time.time() + self.ttl
+        self._mem_put(key, expires_at, data)
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._disk_put, key, expires_at, data)
+        except Exception as e:
+            print(f"[oembed_cache] disk write failed: {e}")
+
+oembed_cache = OEmbedCache(OEMBED_CACHE_FILE, OEMBED_CACHE_MEM_ENTRIES, OEMBED_CACHE_TTL, OEMBED_CACHE_DISK_BYTES)
+
 async def _fetch_oembed(url: str, oembed_template: str, timeout: float = 6.0):
     if not oembed_template or not aiohttp:
         return None
+    cached = await oembed_cache.get(url)
+    if cached is not None:
+        return cached
+    started = time.perf_counter()
     try:
         async with aiohttp.ClientSession() as session:
             ourl = oembed_template.format(url=url)
             async with session.get(ourl, timeout=timeout) as resp:
                 if resp.status == 200:
                     try:
-                        return await resp.json()
+                        data = await resp.json()
                     except Exception:
+                        elog("oembed_fetch", latency_ms=(time.perf_counter() - started) * 1000, outcome="bad_json", url=url)
                         return None
+                    if isinstance(data, dict):
+                        await oembed_cache.put(url, data)
+                    elog("oembed_fetch", latency_ms=(time.perf_counter() - started) * 1000, url=url)
+                    return data
+                elog("oembed_fetch", latency_ms=(time.perf_counter() - started) * 1000, outcome=f"http_{resp.status}", url=url)
     except Exception as e:
         print(f"[_fetch_oembed] failed for {url}: {e}")
+        elog("oembed_fetch", latency_ms=(time.perf_counter() - started) * 1000, outcome="error", url=url, error=str(e))
     return None
 
+# ---------------- MUSIC STATS ----------------
+# Per-guild link counters kept in fixed-size time buckets (hourly ring for the
+# last day, daily ring for the last month). Each ring keeps a running rollup so
+# ?musicstats reads a Counter instead of scanning history; expired buckets are
+# subtracted from the rollup as the ring advances.
+MUSIC_STATS_FILE = "music_stats.json"
+MUSIC_STATS_FLUSH_INTERVAL = 60  # seconds
+MUSIC_STATS_DIMENSIONS = ("provider", "track", "poster")
+MUSIC_STATS_WINDOWS = {"day": (3600, 24), "month": (86400, 30)}  # name -> (bucket seconds, buckets)
+MUSIC_STATS_TITLES_MAX = 2000
+
+def canonical_track(provider_name: str, url: str) -> str:
+    parsed = urlparse(url)
+    host = parsed.netloc.lower()
+    path = parsed.path.rstrip("/")
+    if provider_name == "YouTube":
+        if host.endswith("youtu.be"):
+            vid = path.lstrip("/")
+        else:
+            vid = (parse_qs(parsed.query).get("v") or [""])[0] or path.rsplit("/", 1)[-1]
+        return f"youtube:{vid}"
+    if provider_name == "Spotify":
+        # drop locale prefixes such as /intl-de/track/<id>
+        parts = [p for p in path.split("/") if p and not p.startswith("intl-")]
+        return "spotify:" + ":".join(parts[-2:])
+    if host.startswith("www."):
+        host = host[4:]
+    return f"{host}{path.lower()}"
+
+class _BucketRing:
+    def __init__(self, span: int, size: int):
+        self.span = span
+        self.size = size
+        self.buckets = deque()  # (start, {dim: Counter})
+        self.rollup = {d: Counter() for d in MUSIC_STATS_DIMENSIONS}
+
+    def _advance(self, now: float):
+        oldest_kept = (now - now % self.span) - self.span * (self.size - 1)
+        while self.buckets and self.buckets[0][0] < oldest_kept:
+            _, expired = self.buckets.popleft()
+            for dim, counts in expired.items():
+                roll = self.rollup[dim]
+                for key, n in counts.items():
+                    left = roll[key] - n
+                    if left > 0:
+                        roll[key] = left
+                    else:
+                        del roll[key]
+
+    def add(self, ts: float, keys: dict):
+        self._advance(ts)
+        start = int(ts - ts % self.span)
+        if not self.buckets or self.buckets[-1][0] != start:
+            self.buckets.append((start, {d: Counter() for d in MUSIC_STATS_DIMENSIONS}))
+        bucket = self.buckets[-1][1]
+        for dim, key in keys.items():
+            bucket[dim][key] += 1
+            self.rollup[dim][key] += 1
+
+    def top(self, dim: str, n: int, now: float):
+        self._advance(now)
+        return self.rollup[dim].most_common(n)
+
+    def to_dict(self):
+        return [[start, {d: dict(c) for d, c in b.items()}] for start, b in self.buckets]
+
+    @classmethod
+    def from_dict(cls, span: int, size: int, raw):
+        ring = cls(span, size)
+        for start, b in raw or []:
+            counts = {d: Counter(b.get(d, {})) for d in MUSIC_STATS_DIMENSIONS}
+            ring.buckets.append((int(start), counts))
+            for d in MUSIC_STATS_DIMENSIONS:
+                ring.rollup[d].update(counts[d])
+        return ring
+
+class MusicStats:
+    def __init__(self, path: str):
+        self.path = path
+        self.guilds = {}   # gid(str) -> {window: _BucketRing}
+        self.titles = OrderedDict()  # track key -> display title (bounded)
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except Exception as e:
+            print(f"[music_stats] load failed: {e}")
+            return
+        for gid, windows in raw.get("guilds", {}).items():
+            self.guilds[gid] = {
+                name: _BucketRing.from_dict(span, size, windows.get(name))
+                for name, (span, size) in MUSIC_STATS_WINDOWS.items()
+            }
+        self.titles.update(raw.get("titles", {}))
+
+    def _rings(self, guild_id: int):
+        gid = str(guild_id)
+        rings = self.guilds.get(gid)
+        if rings is None:
+            rings = {name: _BucketRing(span, size) for name, (span, size) in MUSIC_STATS_WINDOWS.items()}
+            self.guilds[gid] = rings
+        return rings
+
+    def record(self, guild_id: int, provider: str, track: str, poster_id: int, title: str | None = None, ts: float | None = None):
+        ts = ts or time.time()
+        keys = {"provider": provider, "track": track, "poster": str(poster_id)}
+        for ring in self._rings(guild_id).values():
+            ring.add(ts, keys)
+        if title:
+            self.titles[track] = title[:100]
+            self.titles.move_to_end(track)
+            while len(self.titles) > MUSIC_STATS_TITLES_MAX:
+                self.titles.popitem(last=False)
+        self._dirty = True
+
+    def top(self, guild_id: int, dim: str, window: str = "day", n: int = 10):
+        rings = self.guilds.get(str(guild_id))
+        if not rings:
+            return []
+        return rings[window].top(dim, n, time.time())
+
+    def _snapshot(self):
+        return {
+            "guilds": {gid: {name: ring.to_dict() for name, ring in rings.items()} for gid, rings in self.guilds.items()},
+            "titles": dict(self.titles),
+        }
+
+    def _write(self, snapshot):
+        started = time.perf_counter()
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+        _m_flush_music.observe(time.perf_counter() - started)
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        self._dirty = False
+        snapshot = self._snapshot()
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, snapshot)
+        except Exception as e:
+            self._dirty = True
+            print(f"[music_stats] flush failed: {e}")
+
+music_stats = MusicStats(MUSIC_STATS_FILE)
+_music_stats_task = None
+
+async def _music_stats_flusher():
+    while True:
+        await asyncio.sleep(MUSIC_STATS_FLUSH_INTERVAL)
+        await music_stats.flush()
+
+# ---------------- MUSIC PLAYER (local library) ----------------
+# Tracks are transcoded to 20ms Ogg/Opus frames by ffmpeg on a small worker pool
+# and held as packet lists in a byte-bounded LRU. Each guild gets one continuous
+# opus AudioSource that switches to the prefetched next track the moment the
+# current one runs out, so the voice thread never waits on an encoder and the
+# event loop never touches audio data. Encoded files on disk are keyed by path,
+# size and mtime; every library rescan deletes files whose source is gone or
+# changed and then trims the directory to MUSIC_ENCODE_DIR_BYTES, least
+# recently used first.
+MUSIC_LIBRARY_DIR = os.getenv("MUSIC_LIBRARY_DIR", "music")
+MUSIC_ENCODE_DIR = os.getenv("MUSIC_ENCODE_DIR", ".opus_cache")
+MUSIC_ENCODE_WORKERS = _int_env("MUSIC_ENCODE_WORKERS", 2)
+MUSIC_ENCODED_CACHE_BYTES = _int_env("MUSIC_ENCODED_CACHE_BYTES", 256 * 1024 * 1024)
+MUSIC_ENCODE_DIR_BYTES = _int_env("MUSIC_ENCODE_DIR_BYTES", 2 * 1024 * 1024 * 1024)
+MUSIC_AUDIO_EXTS = {".mp3", ".flac", ".ogg", ".opus", ".wav", ".m4a", ".aac"}
+MUSIC_FRAME_SECONDS = 0.02
+MUSIC_LIBRARY_RESCAN = 300  # seconds
+
+class EncodedTrack:
+    __slots__ = ("path", "title", "packets", "size")
+
+    def __init__(self, path: str, title: str, packets: list):
+        self.path = path
+        self.title = title
+        self.packets = packets
+        self.size = sum(len(p) for p in packets)
+
+    @property
+    def duration(self) -> float:
+        return len(self.packets) * MUSIC_FRAME_SECONDS
+
+def _encode_key(path: str, st: os.stat_result) -> str:
+    return hashlib.sha1(f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}".encode()).hexdigest()
+
+def _encode_track(path: str) -> EncodedTrack:
+    # blocking: runs on the encoder pool
+    out = os.path.join(MUSIC_ENCODE_DIR, _encode_key(path, os.stat(path)) + ".opus")
+    if os.path.exists(out):
+        try:
+            os.utime(out)  # mtime is the LRU clock for _prune_encode_dir
+        except OSError:
+            pass
+    else:
+        ffmpeg = shutil.which("ffmpeg")
+        if not ffmpeg:
+            raise RuntimeError("ffmpeg is not installed")
+        os.makedirs(MUSIC_ENCODE_DIR, exist_ok=True)
+        tmp = out + ".part"
+        subprocess.run(
+            [ffmpeg, "-nostdin", "-loglevel", "error", "-y", "-i", path, "-vn",
+             "-c:a", "libopus", "-b:a", "128k", "-ar", "48000", "-ac", "2",
+             "-frame_duration", "20", "-application", "audio", "-f", "ogg", tmp],
+            check=True, capture_output=True, timeout=600,
+        )
+        os.replace(tmp, out)
+    with open(out, "rb") as f:
+        packets = [p for p in OggStream(f).iter_packets() if not p.startswith((b"OpusHead", b"OpusTags"))]
+    return EncodedTrack(path, os.path.splitext(os.path.basename(path))[0], packets)
+
+class OpusTrackCache:
+    def __init__(self, max_bytes: int, workers: int):
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self._tracks = OrderedDict()  # path -> EncodedTrack
+        self._bytes = 0
+        self._inflight = {}           # path -> Future, dedupes concurrent requests
+        self._pool = None
+
+    def _executor(self):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="opus-encode")
+        return self._pool
+
+    def peek(self, path: str):
+        return self._tracks.get(path)
+
+    async def get(self, path: str) -> EncodedTrack:
+        track = self._tracks.get(path)
+        if track is not None:
+            self._tracks.move_to_end(path)
+            return track
+        fut = self._inflight.get(path)
+        if fut is None:
+            fut = asyncio.get_running_loop().run_in_executor(self._executor(), _encode_track, path)
+            self._inflight[path] = fut
+            fut.add_done_callback(lambda _f, p=path: self._inflight.pop(p, None))
+        track = await asyncio.shield(fut)
+        self._store(track)
+        return track
+
+    def _store(self, track: EncodedTrack):
+        if track.path in self._tracks:
+            return
+        self._tracks[track.path] = track
+        self._bytes += track.size
+        while self._bytes > self.max_bytes and len(self._tracks) > 1:
+            _, old = self._tracks.popitem(last=False)
+            self._bytes -= old.size
+
+opus_cache = OpusTrackCache(MUSIC_ENCODED_CACHE_BYTES, MUSIC_ENCODE_WORKERS)
+
+class QueueSource(discord.AudioSource):
+    # read() is called from the voice thread every 20ms
+    def __init__(self, player):
+        self.player = player
+        self.packets = None
+        self.pos = 0
+        self._skip = False
+
+    def is_opus(self) -> bool:
+        return True
+
+    def skip(self):
+        self._skip = True
+
+    def read(self) -> bytes:
+        if self._skip or self.packets is None or self.pos >= len(self.packets):
+            self._skip = False
+            track = self.player.take_ready()
+            if track is None:
+                return b""
+            self.packets = track.packets
+            self.pos = 0
+            if not self.packets:
+                return b""
+        pkt = self.packets[self.pos]
+        self.pos += 1
+        return pkt
+
+class GuildPlayer:
+    def __init__(self, guild_id: int, loop: asyncio.AbstractEventLoop):
+        self.guild_id = guild_id
+        self.loop = loop
+        self.queue = deque()       # paths not yet encoded for playback
+        self.now_playing = None
+        self.voice = None
+        self.source = None
+        self._ready = None         # EncodedTrack handed to the source next
+        self._prefetching = None   # path currently being encoded as the next track
+        self._lock = threading.Lock()
+
+    @property
+    def up_next(self):
+        return self._ready.title if self._ready else (os.path.basename(self._prefetching) if self._prefetching else None)
+
+    def take_ready(self):
+        with self._lock:
+            track, self._ready = self._ready, None
+        if track is not None:
+            self.loop.call_soon_threadsafe(self._on_track_started, track)
+        return track
+
+    def _on_track_started(self, track: EncodedTrack):
+        self.now_playing = track
+        self._prefetch_next()
+
+    def _prefetch_next(self):
+        if self._ready is not None or self._prefetching or not self.queue:
+            return
+        self._prefetching = self.queue.popleft()
+        self.loop.create_task(self._prefetch(self._prefetching))
+
+    async def _prefetch(self, path: str):
+        try:
+            track = await opus_cache.get(path)
+        except Exception as e:
+            self._prefetching = None
+            await log_event("errors", f"\u274C music encode failed for `{os.path.basename(path)}`: {e}", guild_id=self.guild_id)
+            self._prefetch_next()
+            return
+        if self._prefetching != path:
+            return  # queue was cleared while encoding
+        with self._lock:
+            self._ready = track
+        self._prefetching = None
+        self._start()
+
+    def _start(self):
+        if self.voice is None or not self.voice.is_connected() or self.voice.is_playing():
+            return
+        self.source = QueueSource(self)
+        self.voice.play(self.source, after=self._after)
+
+    def _after(self, error):
+        if error:
+            print(f"[music] player error in guild {self.guild_id}: {error}")
+        self.loop.call_soon_threadsafe(self._on_source_end)
+
+    def _on_source_end(self):
+        self.now_playing = None
+        self.source = None
+        if self._ready is not None:
+            self._start()
+        else:
+            self._prefetch_next()
+
+    def enqueue(self, path: str):
+        self.queue.append(path)
+        self._prefetch_next()
+
+    def skip(self) -> bool:
+        if self.source is None:
+            return False
+        self.source.skip()
+        return True
+
+    async def stop(self):
+        self.queue.clear()
+        self._prefetching = None
+        with self._lock:
+            self._ready = None
+        if self.voice is not None:
+            self.voice.stop()
+            await self.voice.disconnect(force=False)
+            self.voice = None
+
+music_players = {}  # guild id -> GuildPlayer
+
+def get_player(guild_id: int) -> GuildPlayer:
+    player = music_players.get(guild_id)
+    if player is None:
+        player = GuildPlayer(guild_id, bot.loop)
+        music_players[guild_id] = player
+    return player
+
+_library_index = {"built": 0.0, "files": []}
+
+def _scan_library() -> list:
+    root = os.path.abspath(MUSIC_LIBRARY_DIR)
+    files = []
+    for dirpath, _, names in os.walk(root):
+        for name in names:
+            if os.path.splitext(name)[1].lower() in MUSIC_AUDIO_EXTS:
+                files.append(os.path.relpath(os.path.join(dirpath, name), root))
+    files.sort()
+    return files
+
+def _prune_encode_dir(library: list, budget: int) -> tuple:
+    # blocking: drop encodings of tracks that left the library (renamed,
+    # replaced, deleted), leftovers of interrupted encodes, then the least
+    # recently used files until the directory fits the budget
+    root = os.path.abspath(MUSIC_LIBRARY_DIR)
+    keep = None
+    if os.path.isdir(root):  # no library dir: nothing to compare against
+        keep = set()
+        for rel in library:
+            path = os.path.join(root, rel)
+            try:
+                keep.add(_encode_key(path, os.stat(path)))
+            except OSError:
+                pass
+    try:
+        names = os.listdir(MUSIC_ENCODE_DIR)
+    except OSError:
+        return 0, 0
+    now = time.time()
+    files, removed, freed = [], 0, 0
+    for name in names:
+        path = os.path.join(MUSIC_ENCODE_DIR, name)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        stem, ext = os.path.splitext(name)
+        stale = (ext == ".part" and now - st.st_mtime > 3600) or (ext == ".opus" and keep is not None and stem not in keep)
+        if stale:
+            try:
+                os.remove(path)
+                removed += 1
+                freed += st.st_size
+            except OSError:
+                pass
+        elif ext == ".opus":
+            files.append((st.st_mtime, st.st_size, path))
+    total = sum(size for _, size, _ in files)
+    files.sort()
+    for _, size, path in files:
+        if total <= budget:
+            break
+        try:
+            os.remove(path)
+            removed += 1
+            freed += size
+            total -= size
+        except OSError:
+            pass
+    return removed, freed
+
+async def find_library_track(query: str):
+    now = time.time()
+    if now - _library_index["built"] > MUSIC_LIBRARY_RESCAN:
+        loop = asyncio.get_running_loop()
+        _library_index["files"] = await loop.run_in_executor(None, _scan_library)
+        _library_index["built"] = now
+        removed, freed = await loop.run_in_executor(None, _prune_encode_dir, _library_index["files"], MUSIC_ENCODE_DIR_BYTES)
+        if removed:
+            print(f"[music] pruned {removed} encoded file(s), {freed / 1e6:.1f} MB, from {MUSIC_ENCODE_DIR}")
+    q = query.lower().strip()
+    files = _library_index["files"]
+    match = next((f for f in files if f.lower() == q), None) \
+        or next((f for f in files if os.path.splitext(os.path.basename(f))[0].lower() == q), None) \
+        or next((f for f in files if q in f.lower()), None)
+    if match is None:
+        return None
+    return os.path.join(os.path.abspath(MUSIC_LIBRARY_DIR), match)
+
+class FakeVoiceSink:
+    # Stand-in for discord.VoiceClient: drains a source on its own thread with the
+    # same 20ms pacing as discord.player.AudioPlayer and records when every frame
+    # was taken, so frames/second and jitter can be measured without Discord.
+    def __init__(self, frame_seconds: float = MUSIC_FRAME_SECONDS):
+        self.frame_seconds = frame_seconds
+        self.frame_times = []
+        self.frame_bytes = 0
+        self._thread = None
+        self._end = threading.Event()
+        self._connected = True
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    def is_playing(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def play(self, source, *, after=None):
+        self._end.clear()
+        self._thread = threading.Thread(target=self._run, args=(source, after), daemon=True)
+        self._thread.start()
+
+    def _run(self, source, after):
+        loops = 0
+        start = time.perf_counter()
+        error = None
+        try:
+            while not self._end.is_set():
+                data = source.read()
+                if not data:
+                    break
+                self.frame_times.append(time.perf_counter())
+                self.frame_bytes += len(data)
+                loops += 1
+                time.sleep(max(0.0, start + self.frame_seconds * loops - time.perf_counter()))
+        except Exception as e:
+            error = e
+        if after is not None:
+            after(error)
+
+    def stop(self):
+        self._end.set()
+
+    async def disconnect(self, force: bool = False):
+        self.stop()
+        self._connected = False
+
+    def wait(self, timeout: float | None = None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        times = self.frame_times
+        if len(times) < 2:
+            return {"frames": len(times), "fps": 0.0, "jitter_ms": 0.0, "max_gap_ms": 0.0, "kbps": 0.0}
+        gaps = [b - a for a, b in zip(times, times[1:])]
+        return {
+            "frames": len(times),
+            "fps": (len(times) - 1) / (times[-1] - times[0]),
+            "jitter_ms": statistics.pstdev(gaps) * 1000,
+            "max_gap_ms": max(gaps) * 1000,
+            "kbps": self.frame_bytes * 8 / 1000 / max(1e-9, times[-1] - times[0]),
+        }
+
 # ---------------- WORDLE ----------------
 WORDLE_WORDS = [
 "oxide","creek","chair","ocean","amber","drink","stone","blaze","nudge","eagle",
@@ -280,12 +1509,968 @@ WORDLE_WORDS = [
 "river","roast","gamma","shiny","usher","joust","lunch","lapse","youth"
 ]
 
+# ---------------- LOOP MONITOR ----------------
+# A heartbeat task measures scheduling lag every LOOP_MONITOR_TICK. A watchdog
+# thread notices when the heartbeat goes stale for longer than
+# SLOW_CALLBACK_THRESHOLD and samples the loop thread's stack (the coroutine
+# frames of whatever is holding the loop are on it). Once the loop comes back
+# the most frequently sampled stack is reported to the errors log and metrics.
+LOOP_MONITOR_TICK = 0.1
+LOOP_WATCHDOG_POLL = 0.05
+SLOW_CALLBACK_THRESHOLD = _float_env("SLOW_CALLBACK_THRESHOLD", 0.25, 0.01, 60.0)  # seconds
+SLOW_CALLBACK_REPORT_INTERVAL = 10.0  # at most one errors-log report per window
+SLOW_CALLBACK_STACK_DEPTH = 12
+_ASYNCIO_DIR = os.path.dirname(asyncio.__file__)  # loop internals are dropped from samples
+
+M_SLOW_CALLBACKS = metrics.counter("hazsbot_slow_callbacks_total", "Times the event loop was blocked past the threshold.", prealloc=[()])
+M_LOOP_BLOCKED = metrics.histogram("hazsbot_event_loop_blocked_seconds", "Duration of event loop stalls past the threshold.",
+                                   buckets=(0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0), prealloc=[()])
+
+class LoopMonitor:
+    def __init__(self, tick: float, threshold: float):
+        self.tick = tick
+        self.threshold = threshold
+        self.last_tick = time.perf_counter()
+        self.slow_callbacks = 0
+        self.worst_block = 0.0
+        self.last_offender = None
+        self._loop_thread = None
+        self._watchdog = None
+        self._samples = Counter()  # stack text -> samples during the current stall
+        self._lock = threading.Lock()
+        self._last_report = 0.0
+        self._suppressed = 0
+
+    async def run(self):
+        self._loop_thread = threading.get_ident()
+        if self._watchdog is None:
+            self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+            self._watchdog.start()
+        while True:
+            started = time.perf_counter()
+            self.last_tick = started
+            await asyncio.sleep(self.tick)
+            now = time.perf_counter()
+            self.last_tick = now
+            lag = max(0.0, now - started - self.tick)
+            _last_loop_lag[0] = lag
+            _m_loop_lag.observe(lag)
+            with self._lock:
+                samples, self._samples = self._samples, Counter()
+            if lag >= self.threshold:
+                await self._report(lag, samples)
+
+    def _watch(self):
+        while True:
+            time.sleep(LOOP_WATCHDOG_POLL)
+            if time.perf_counter() - self.last_tick - self.tick < self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            try:
+                stack = [fs for fs in traceback.extract_stack(frame) if not fs.filename.startswith(_ASYNCIO_DIR)]
+            finally:
+                del frame
+            stack = stack[-SLOW_CALLBACK_STACK_DEPTH:]
+            text = "".join(traceback.format_list(stack))
+            with self._lock:
+                self._samples[text] += 1
+
+    async def _report(self, blocked: float, samples: Counter):
+        self.slow_callbacks += 1
+        self.worst_block = max(self.worst_block, blocked)
+        M_SLOW_CALLBACKS.labels().inc()
+        M_LOOP_BLOCKED.labels().observe(blocked)
+        stack, hits = samples.most_common(1)[0] if samples else ("(no stack sample captured)\n", 0)
+        last_line = stack.rstrip().splitlines()[-2].strip() if stack.count("\n") >= 2 else stack.strip()
+        self.last_offender = last_line
+        elog("slow_callback", latency_ms=blocked * 1000, outcome="blocked", samples=sum(samples.values()), stack=stack)
+        now = time.time()
+        if now - self._last_report < SLOW_CALLBACK_REPORT_INTERVAL:
+            self._suppressed += 1
+            return
+        self._last_report = now
+        extra = f" (+{self._suppressed} more since last report)" if self._suppressed else ""
+        self._suppressed = 0
+        await log_event(
+            "errors",
+            f"\U0001F422 Event loop blocked for {blocked * 1000:.0f} ms{extra}; {hits}/{sum(samples.values())} samples in:\n```py\n{stack[-1700:]}```",
+        )
+
+loop_monitor = LoopMonitor(LOOP_MONITOR_TICK, SLOW_CALLBACK_THRESHOLD)
+
+# ---------------- SYSTEM SAMPLER ----------------
+# Samples process/bot health every SYSTEM_SAMPLE_INTERVAL seconds into fixed-size
+# ring buffers so ?dashboard can render current values and short trends without
+# blocking (psutil.cpu_percent(interval=None) reports usage since the last call).
+SYSTEM_SAMPLE_INTERVAL = _int_env("SYSTEM_SAMPLE_INTERVAL", 10)
+SYSTEM_SAMPLE_HISTORY = 60  # samples per series
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+
+def sparkline(values) -> str:
+    values = [v for v in values if v is not None]
+    if not values:
+        return ""
+    lo, hi = min(values), max(values)
+    span = (hi - lo) or 1
+    return "".join(SPARK_CHARS[min(len(SPARK_CHARS) - 1, int((v - lo) / span * len(SPARK_CHARS)))] for v in values)
+
+class SystemSampler:
+    SERIES = ("cpu_pct", "rss_mb", "sys_mem_pct", "guilds", "members", "latency_ms", "loop_lag_ms", "log_queue", "pending_jobs")
+
+    def __init__(self, interval: int, history: int):
+        self.interval = interval
+        self.series = {name: deque(maxlen=history) for name in self.SERIES}
+        self.sys_mem_total_mb = None
+        self._proc = psutil.Process() if psutil else None
+
+    def latest(self, name: str):
+        ring = self.series[name]
+        return ring[-1] if ring else None
+
+    def trend(self, name: str, n: int = 20) -> str:
+        return sparkline(list(self.series[name])[-n:])
+
+    def sample(self):
+        cpu = rss = mem_pct = None
+        if self._proc is not None:
+            try:
+                cpu = psutil.cpu_percent(interval=None)
+                rss = self._proc.memory_info().rss / (1024 * 1024)
+                vm = psutil.virtual_memory()
+                mem_pct = vm.percent
+                self.sys_mem_total_mb = vm.total // (1024 * 1024)
+            except Exception:
+                pass
+        latency = bot.latency * 1000 if math.isfinite(bot.latency) else None
+        values = {
+            "cpu_pct": cpu,
+            "rss_mb": rss,
+            "sys_mem_pct": mem_pct,
+            "guilds": len(bot.guilds),
+            "members": sum((g.member_count or 0) for g in bot.guilds),
+            "latency_ms": latency,
+            "loop_lag_ms": _last_loop_lag[0] * 1000,
+            "log_queue": log_sink.pending,
+            "pending_jobs": sum(_pending_jobs().values()),
+        }
+        for name, value in values.items():
+            self.series[name].append(value)
+
+    async def run(self):
+        if psutil:
+            psutil.cpu_percent(interval=None)  # prime the counter
+        while True:
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"[system_sampler] sample failed: {e}")
+            await asyncio.sleep(self.interval)
+
+system_sampler = SystemSampler(SYSTEM_SAMPLE_INTERVAL, SYSTEM_SAMPLE_HISTORY)
+_system_sampler_task = None
+
+# ---------------- MEMORY ACCOUNTING ----------------
+# Entry counts and approximate deep sizes of the bot's in-memory registries,
+# refreshed every MEMORY_REFRESH_INTERVAL seconds on the loop (so nothing is
+# walked while it is being mutated) and exported as gauges. Large containers are
+# sized from a sample of MEMORY_SAMPLE_ITEMS entries and extrapolated.
+MEMORY_REFRESH_INTERVAL = _int_env("MEMORY_REFRESH_INTERVAL", 60)
+MEMORY_SAMPLE_ITEMS = 200
+MEMORY_MAX_NODES = 20000
+
+def deep_sizeof(obj, _seen=None, _budget=None) -> int:
+    seen = _seen if _seen is not None else set()
+    budget = _budget if _budget is not None else [MEMORY_MAX_NODES]
+    stack = [obj]
+    total = 0
+    while stack and budget[0] > 0:
+        o = stack.pop()
+        if id(o) in seen:
+            continue
+        seen.add(id(o))
+        budget[0] -= 1
+        try:
+            total += sys.getsizeof(o)
+        except TypeError:
+            continue
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset, deque)):
+            stack.extend(o)
+        elif hasattr(o, "__slots__") and type(o).__module__ == __name__:
+            # only our own record types; library objects (discord models, the
+            # loop) point into shared state that would swamp the estimate
+            stack.extend(getattr(o, a) for a in o.__slots__ if hasattr(o, a))
+    return total
+
+def approx_sizeof(container) -> int:
+    # sample-and-extrapolate for big dicts/lists; exact walk otherwise
+    try:
+        n = len(container)
+    except TypeError:
+        return deep_sizeof(container)
+    if n <= MEMORY_SAMPLE_ITEMS:
+        return deep_sizeof(container)
+    items = container.items() if isinstance(container, dict) else container
+    sample = []
+    for i, item in enumerate(items):
+        if i >= MEMORY_SAMPLE_ITEMS:
+            break
+        sample.append(item)
+    seen = {id(container)}
+    per_item = sum(deep_sizeof(item, seen) for item in sample) / len(sample)
+    return sys.getsizeof(container) + int(per_item * n)
+
+def _tasks_by_coro():
+    counts = Counter()
+    for task in asyncio.all_tasks():
+        coro = task.get_coro()
+        counts[getattr(coro, "__qualname__", type(coro).__name__)] += 1
+    return counts
+
+# name -> () -> (entries, object to size or None)
+MEMORY_REGISTRIES = {
+    "server_data": lambda: (len(server_data), server_data),
+    "last_deleted_message": lambda: (len(last_deleted_message), last_deleted_message),
+    "active_wordles": lambda: (len(active_wordles), active_wordles),
+    "oembed_cache_mem": lambda: (len(oembed_cache._mem), oembed_cache._mem),
+    "music_stats": lambda: (len(music_stats.guilds), music_stats.guilds),
+    "opus_cache": lambda: (len(opus_cache._tracks), None),
+    "music_players": lambda: (len(music_players), music_players),
+    "log_queue": lambda: (log_sink.pending, log_sink._queues),
+    "command_perf": lambda: (len(command_perf.wall) + len(command_perf.waits), None),
+    "scheduler": lambda: (len(scheduler), scheduler._heap),
+    "reminder_index": lambda: (len(reminders._by_user), reminders._by_user),
+}
+
+class MemoryAccountant:
+    def __init__(self, interval: int):
+        self.interval = interval
+        self.entries = {}
+        self.bytes = {}
+        self.tasks = Counter()
+        self.refreshed_at = None
+        self._snapshot = None
+        self._snapshot_lock = asyncio.Lock()
+
+    def refresh(self):
+        for name, fn in MEMORY_REGISTRIES.items():
+            try:
+                n, obj = fn()
+            except Exception:
+                continue
+            self.entries[name] = n
+            if name == "opus_cache":
+                self.bytes[name] = opus_cache._bytes
+            elif name == "command_perf":
+                self.bytes[name] = (len(command_perf.wall) + len(command_perf.waits)) * HdrHistogram.SIZE * 8
+            elif obj is not None:
+                self.bytes[name] = approx_sizeof(obj)
+        self.tasks = _tasks_by_coro()
+        self.refreshed_at = time.time()
+
+    async def run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"[memory] refresh failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    # tracemalloc snapshots are opt-in: tracing costs memory and CPU while on.
+    # Taking, filtering and comparing a snapshot walks every traced block, so
+    # it runs on an executor thread instead of stalling the loop.
+    @staticmethod
+    def _take_snapshot():
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+
+    async def snapshot_diff(self, limit: int = 10):
+        loop = asyncio.get_running_loop()
+        async with self._snapshot_lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(10)
+                self._snapshot = await loop.run_in_executor(None, self._take_snapshot)
+                return None
+            current = await loop.run_in_executor(None, self._take_snapshot)
+            previous, self._snapshot = self._snapshot, current
+            if previous is None:
+                return None
+            return (await loop.run_in_executor(None, current.compare_to, previous, "lineno"))[:limit]
+
+    def stop_tracing(self):
+        self._snapshot = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+memory_accountant = MemoryAccountant(MEMORY_REFRESH_INTERVAL)
+_memory_task = None
+
+# ---------------- SCHEDULER ----------------
+# One min-heap of timed jobs driven by a single task, instead of one sleeping
+# task per unban/unmute/reminder. Jobs are small __slots__ records keyed by a
+# unique job id; insert is O(log n), cancel marks the job and drops it lazily
+# when it reaches the top (the heap is rebuilt once cancelled entries dominate).
+#
+# Jobs are durable: every insert is an upsert into a SQLite job store keyed by
+# the job id, so scheduling the same id twice never duplicates it. A row is
+# deleted only after its handler returns, which makes execution at-least-once;
+# handlers must therefore be idempotent. A handler that raises is retried with
+# backoff up to JOB_MAX_ATTEMPTS times. Rows are single-row upserts on a WAL
+# database (cheaper than the servers.json rewrite they replace), so they run
+# inline; startup loads the table in batches through the executor.
+SCHEDULER_MAX_SLEEP = 60.0  # re-check the wall clock at least this often
+SCHEDULER_TICK = 0.25       # jobs due this close together are dispatched together
+JOB_STORE_FILE = os.getenv("JOB_STORE_FILE", "jobs.sqlite3")
+JOB_LOAD_BATCH = 1000
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BASE = 30.0  # seconds, doubled per attempt, capped at an hour
+
+class Job:
+    __slots__ = ("due", "seq", "kind", "key", "args", "attempts", "cancelled")
+
+    def __init__(self, due: float, seq: int, kind: str, key: str, args: tuple, attempts: int = 0):
+        self.due = due
+        self.seq = seq
+        self.kind = kind
+        self.key = key
+        self.args = args
+        self.attempts = attempts
+        self.cancelled = False
+
+    def __lt__(self, other):
+        if self.due != other.due:
+            return self.due < other.due
+        return self.seq < other.seq
+
+class JobStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._db = None
+        self._db_failed = False
+        self._lock = threading.Lock()  # load() runs on executor threads
+
+    def _open(self):
+        if self._db is not None or self._db_failed:
+            return self._db
+        try:
+            db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, due REAL NOT NULL, "
+                "args TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._db = db
+        except Exception as e:
+            print(f"[job_store] persistence disabled: {e}")
+            self._db_failed = True
+        return self._db
+
+    def put(self, job: Job):
+        with self._lock:
+            db = self._open()
+            if db is None:
+                return
+            db.execute(
+                "INSERT INTO jobs (id, kind, due, args, attempts) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET kind = excluded.kind, due = excluded.due, "
+                "args = excluded.args, attempts = excluded.attempts",
+                (job.key, job.kind, job.due, json.dumps(job.args, separators=(",", ":")), job.attempts),
+            )
+
+    def delete(self, key: str, due: float | None = None):
+        # `due` guards against deleting a newer job that reused the id while
+        # the old one was running
+        with self._lock:
+            db = self._open()
+            if db is None:
+                return
+            if due is None:
+                db.execute("DELETE FROM jobs WHERE id = ?", (key,))
+            else:
+                db.execute("DELETE FROM jobs WHERE id = ? AND due = ?", (key, due))
+
+    def delete_many(self, jobs: list):
+        with self._lock:
+            db = self._open()
+            if db is None:
+                return
+            db.executemany("DELETE FROM jobs WHERE id = ? AND due = ?", [(j.key, j.due) for j in jobs])
+
+    def _fetch(self, after_id: str, limit: int) -> list:
+        with self._lock:
+            db = self._open()
+            if db is None:
+                return []
+            return db.execute(
+                "SELECT id, kind, due, args, attempts FROM jobs WHERE id > ? ORDER BY id LIMIT ?",
+                (after_id, limit),
+            ).fetchall()
+
+    async def load(self, batch: int = JOB_LOAD_BATCH):
+        # keyset pagination so each batch is an index range scan
+        loop = asyncio.get_running_loop()
+        after = ""
+        while True:
+            rows = await loop.run_in_executor(None, self._fetch, after, batch)
+            if not rows:
+                return
+            yield rows
+            after = rows[-1][0]
+
+class Scheduler:
+    def __init__(self, store: JobStore | None = None):
+        self.store = store
+        self._heap = []
+        self._by_key = {}
+        self._handlers = {}
+        self._seq = 0
+        self._cancelled = 0
+        self._wake = asyncio.Event()
+        self._running = set()
+        self._inflight = set()   # keys of jobs whose handler is running
+        self.counts = Counter()  # kind -> live jobs
+
+    def register(self, kind: str, handler, batch: bool = False):
+        # handler: async fn(job), or async fn(jobs) with batch=True to get every
+        # job of this kind that fell due in the same tick (kinds registered with
+        # the same batch handler share one batch). A batch handler may return
+        # (job, error) pairs to retry; the rest count as done. Handlers must be
+        # safe to run more than once.
+        self._handlers[kind] = (handler, batch)
+
+    def __len__(self):
+        return len(self._by_key)
+
+    def schedule(self, kind: str, when, key: str | None = None, args: tuple = ()) -> Job:
+        # `when` is a naive-UTC datetime or an epoch timestamp; an existing job
+        # with the same key is replaced
+        due = when.replace(tzinfo=timezone.utc).timestamp() if isinstance(when, datetime) else float(when)
+        key = key or f"{kind}:{os.urandom(8).hex()}"
+        self._drop(key)
+        job = self._push(Job(due, 0, kind, key, tuple(args)))
+        if self.store is not None:
+            try:
+                self.store.put(job)
+            except Exception as e:
+                print(f"[scheduler] could not persist {key}: {e}")
+        return job
+
+    def _push(self, job: Job) -> Job:
+        self._seq += 1
+        job.seq = self._seq
+        heapq.heappush(self._heap, job)
+        self._by_key[job.key] = job
+        self.counts[job.kind] += 1
+        if self._heap[0] is job:
+            self._wake.set()
+        return job
+
+    def get(self, key: str) -> Job | None:
+        return self._by_key.get(key)
+
+    def busy(self, key: str) -> bool:
+        # the job's handler is running; it is in neither the heap nor _by_key
+        return key in self._inflight
+
+    def _drop(self, key: str) -> Job | None:
+        job = self._by_key.pop(key, None)
+        if job is None:
+            return None
+        job.cancelled = True
+        self.counts[job.kind] -= 1
+        self._cancelled += 1
+        if self._cancelled > 64 and self._cancelled > len(self._heap) // 2:
+            self._heap = [j for j in self._heap if not j.cancelled]
+            heapq.heapify(self._heap)
+            self._cancelled = 0
+        return job
+
+    def cancel(self, key: str) -> bool:
+        job = self._drop(key)
+        if job is not None and self.store is not None:
+            self.store.delete(key)
+        return job is not None
+
+    async def load(self) -> int:
+        # bring persisted jobs back after a restart; ids already in memory win
+        if self.store is None:
+            return 0
+        loaded = 0
+        async for rows in self.store.load():
+            for key, kind, due, args, attempts in rows:
+                if key in self._by_key or key in self._inflight:
+                    continue
+                self._seq += 1
+                job = Job(due, self._seq, kind, key, tuple(json.loads(args)), attempts)
+                self._heap.append(job)
+                self._by_key[key] = job
+                self.counts[kind] += 1
+                loaded += 1
+        heapq.heapify(self._heap)
+        self._wake.set()
+        return loaded
+
+    def _pop_due(self, now: float) -> list:
+        due = []
+        heap = self._heap
+        while heap and (heap[0].cancelled or heap[0].due <= now):
+            job = heapq.heappop(heap)
+            if job.cancelled:
+                self._cancelled -= 1
+                continue
+            del self._by_key[job.key]
+            self.counts[job.kind] -= 1
+            due.append(job)
+        return due
+
+    def _dispatch(self, jobs: list):
+        batches = {}
+        for job in jobs:
+            entry = self._handlers.get(job.kind)
+            if entry is None:
+                print(f"[scheduler] no handler for job kind {job.kind!r}")
+                continue
+            self._inflight.add(job.key)
+            handler, batch = entry
+            if batch:
+                batches.setdefault(handler, []).append(job)
+            else:
+                self._spawn(self._invoke(handler, [job], job))
+        for handler, group in batches.items():
+            self._spawn(self._invoke(handler, group, group))
+
+    def _spawn(self, coro):
+        task = asyncio.ensure_future(coro)
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _invoke(self, handler, jobs: list, arg):
+        try:
+            failed = await handler(arg) or ()
+        except Exception as e:
+            failed = [(job, e) for job in jobs]
+        for job in jobs:
+            self._inflight.discard(job.key)
+        retried = set()
+        for job, error in failed:
+            retried.add(job.key)
+            self._retry(job, error)
+        done = [job for job in jobs if job.key not in retried]
+        if done and self.store is not None:
+            self.store.delete_many(done)
+
+    def _retry(self, job: Job, error: Exception):
+        if job.key in self._by_key:
+            return  # rescheduled while running; the newer job owns the id
+        attempts = job.attempts + 1
+        if attempts >= JOB_MAX_ATTEMPTS:
+            print(f"[scheduler] {job.kind} job {job.key} failed, giving up: {error}")
+            elog("scheduler", outcome="failed", kind=job.kind, key=job.key, attempts=attempts, error=str(error))
+            if self.store is not None:
+                self.store.delete(job.key, job.due)
+            return
+        delay = min(3600.0, JOB_RETRY_BASE * (2 ** job.attempts))
+        print(f"[scheduler] {job.kind} job {job.key} failed (attempt {attempts}), retrying in {delay:.0f}s: {error}")
+        elog("scheduler", outcome="retry", kind=job.kind, key=job.key, attempts=attempts, error=str(error))
+        if self.store is not None:
+            self.store.delete(job.key, job.due)
+        retry = self._push(Job(time.time() + delay, 0, job.kind, job.key, job.args, attempts))
+        if self.store is not None:
+            self.store.put(retry)
+
+    async def run(self):
+        while True:
+            self._wake.clear()
+            now = time.time()
+            due = self._pop_due(now + SCHEDULER_TICK)
+            if due:
+                self._dispatch(due)
+            delay = SCHEDULER_MAX_SLEEP
+            while self._heap and self._heap[0].cancelled:
+                heapq.heappop(self._heap)
+                self._cancelled -= 1
+            if self._heap:
+                delay = min(delay, max(0.0, self._heap[0].due - time.time()))
+            try:
+                await asyncio.wait_for(self._wake.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+scheduler = Scheduler(JobStore(JOB_STORE_FILE))
+_scheduler_task = None
+
+# ---------------- METRICS (gauges) ----------------
+
+def _pending_jobs():
+    counts = scheduler.counts
+    return {"unban": counts["unban"], "unmute": counts["unmute"], "reminder": counts["reminder"], "announce": counts["announce"]}
+
+metrics.gauge("hazsbot_gateway_latency_seconds", "Discord gateway heartbeat latency.",
+              lambda: bot.latency if math.isfinite(bot.latency) else None)
+metrics.gauge("hazsbot_event_loop_lag_last_seconds", "Most recent event loop lag sample.", lambda: _last_loop_lag[0])
+metrics.counter_fn("hazsbot_oembed_cache_total", "oEmbed cache lookups by outcome.", lambda: dict(oembed_cache.hits), "tier")
+metrics.gauge("hazsbot_scheduled_jobs_pending", "Pending scheduled jobs by type.", _pending_jobs, "type")
+metrics.gauge("hazsbot_log_queue_pending", "Log lines waiting for the next flush.", lambda: log_sink.pending)
+metrics.counter_fn("hazsbot_log_lines_shed_total", "Low-priority log lines shed under load.", lambda: log_sink.shed_total)
+metrics.counter_fn("hazsbot_log_lines_dropped_total", "Log lines dropped because the queue was full.", lambda: log_sink.dropped)
+metrics.gauge("hazsbot_guilds", "Guilds the bot is in.", lambda: len(bot.guilds))
+metrics.gauge("hazsbot_registry_entries", "Entries per in-memory registry.", lambda: dict(memory_accountant.entries), "registry")
+metrics.gauge("hazsbot_registry_bytes", "Approximate deep size per in-memory registry.", lambda: dict(memory_accountant.bytes), "registry")
+metrics.gauge("hazsbot_tasks", "Live asyncio tasks by coroutine.", lambda: dict(memory_accountant.tasks), "coro")
+
+_loop_monitor_task = None
+
+# ---------------- COMMAND PERF ----------------
+# Log-linear ("HDR-style") histograms over microseconds: exact below 64us, then
+# 32 sub-buckets per power of two (~3% relative error) up to ~19h. Each one is a
+# fixed 1.1k-slot array, so memory does not grow with the number of samples.
+class HdrHistogram:
+    SUB_BITS = 6
+    MAX_EXP = 30
+    SIZE = (1 << SUB_BITS) + MAX_EXP * (1 << (SUB_BITS - 1))
+    __slots__ = ("counts", "count", "total_us", "max_us")
+
+    def __init__(self):
+        self.counts = array("Q", bytes(8 * self.SIZE))
+        self.count = 0
+        self.total_us = 0
+        self.max_us = 0
+
+    @classmethod
+    def _index(cls, us: int) -> int:
+        if us < (1 << cls.SUB_BITS):
+            return us
+        e = us.bit_length() - cls.SUB_BITS
+        if e > cls.MAX_EXP:
+            return cls.SIZE - 1
+        half = 1 << (cls.SUB_BITS - 1)
+        return (1 << cls.SUB_BITS) + (e - 1) * half + ((us >> e) - half)
+
+    @classmethod
+    def _upper(cls, idx: int) -> int:
+        if idx < (1 << cls.SUB_BITS):
+            return idx
+        half = 1 << (cls.SUB_BITS - 1)
+        e, m = divmod(idx - (1 << cls.SUB_BITS), half)
+        e += 1
+        return ((m + half + 1) << e) - 1
+
+    def record(self, seconds: float):
+        us = max(0, int(seconds * 1_000_000))
+        self.counts[self._index(us)] += 1
+        self.count += 1
+        self.total_us += us
+        if us > self.max_us:
+            self.max_us = us
+
+    def percentiles(self, *qs) -> list:
+        # qs in 0..100, returned in milliseconds
+        if not self.count:
+            return [0.0 for _ in qs]
+        targets = sorted((max(1, math.ceil(q / 100 * self.count)), i) for i, q in enumerate(qs))
+        out = [0.0] * len(qs)
+        seen = 0
+        t = 0
+        for idx, n in enumerate(self.counts):
+            if not n:
+                continue
+            seen += n
+            while t < len(targets) and seen >= targets[t][0]:
+                out[targets[t][1]] = min(self._upper(idx), self.max_us) / 1000
+                t += 1
+            if t == len(targets):
+                break
+        return out
+
+    @property
+    def mean_ms(self) -> float:
+        return self.total_us / self.count / 1000 if self.count else 0.0
+
+PERF_TOP_SLOW = 10
+
+class CommandPerf:
+    def __init__(self):
+        self.wall = {}   # command -> HdrHistogram
+        self.waits = {}  # (command, "rest"|"io"|"ai") -> HdrHistogram, created on first non-zero wait
+        self.slowest = []  # min-heap of (wall seconds, seq, summary dict)
+        self._seq = 0
+
+    def record(self, trace: CommandTrace, ctx):
+        wall = trace.wall
+        hist = self.wall.get(trace.command)
+        if hist is None:
+            hist = self.wall[trace.command] = HdrHistogram()
+        hist.record(wall)
+        for field in ("rest", "io", "ai"):
+            value = getattr(trace, field)
+            if value:
+                key = (trace.command, field)
+                w = self.waits.get(key)
+                if w is None:
+                    w = self.waits[key] = HdrHistogram()
+                w.record(value)
+        if len(self.slowest) < PERF_TOP_SLOW or wall > self.slowest[0][0]:
+            self._seq += 1
+            summary = {
+                "command": trace.command, "wall_ms": wall * 1000, "rest_ms": trace.rest * 1000,
+                "rest_calls": trace.rest_calls, "io_ms": trace.io * 1000, "ai_ms": trace.ai * 1000,
+                "guild": ctx.guild.id if ctx.guild else None, "when": datetime.utcnow().strftime("%H:%M:%S"),
+            }
+            item = (wall, self._seq, summary)
+            if len(self.slowest) < PERF_TOP_SLOW:
+                heapq.heappush(self.slowest, item)
+            else:
+                heapq.heapreplace(self.slowest, item)
+
+    def wait_share(self, command: str, field: str) -> float:
+        w = self.waits.get((command, field))
+        return w.total_us / 1000 / w.count if w and w.count else 0.0
+
+command_perf = CommandPerf()
+
+_http_request = bot.http.request
+
+async def _traced_http_request(route, **kwargs):
+    t = _current_trace.get()
+    if t is None or t.done:
+        return await _http_request(route, **kwargs)
+    started = time.perf_counter()
+    try:
+        return await _http_request(route, **kwargs)
+    finally:
+        t.rest += time.perf_counter() - started
+        t.rest_calls += 1
+
+bot.http.request = _traced_http_request
+
+@bot.before_invoke
+async def _perf_before_invoke(ctx):
+    ctx.hz_trace = CommandTrace(ctx.command.qualified_name if ctx.command else "?")
+    _current_trace.set(ctx.hz_trace)
+
+@bot.after_invoke
+async def _perf_after_invoke(ctx):
+    trace = getattr(ctx, "hz_trace", None)
+    if trace is None:
+        return
+    trace.done = True
+    trace.wall = time.perf_counter() - trace.started
+    M_COMMAND_LATENCY.labels(trace.command, "error" if ctx.command_failed else "ok").observe(trace.wall)
+    command_perf.record(trace, ctx)
+
+# ---------------- PROFILER ----------------
+# Wall-clock stack sampler for ?profile: a thread samples the event-loop
+# thread's currently executing stack PROFILE_HZ times per second and folds it
+# into collapsed-stack lines ("root;caller;callee count") that flamegraph.pl
+# and speedscope both import. Only the task that holds the loop at that moment
+# shows up (its coroutine frames sit under Task.__step); suspended coroutines
+# are not on any thread's stack and are never seen, and idle time shows up as
+# the selector wait. The sampler only walks f_back pointers and never reads
+# source, keeping overhead to roughly 1%.
+PROFILE_HZ = 100
+PROFILE_MAX_SECONDS = 120
+PROFILE_MAX_DEPTH = 64
+
+class StackProfiler:
+    def __init__(self, thread_id: int, hz: int = PROFILE_HZ):
+        self.thread_id = thread_id
+        self.interval = 1.0 / hz
+        self.stacks = Counter()
+        self.samples = 0
+        self.cpu_seconds = 0.0
+        self.wall_seconds = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _label(code) -> str:
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        names = []
+        depth = 0
+        while frame is not None and depth < PROFILE_MAX_DEPTH:
+            names.append(self._label(frame.f_code))
+            frame = frame.f_back
+            depth += 1
+        del frame
+        names.reverse()
+        self.stacks[";".join(names)] += 1
+        self.samples += 1
+
+    def _run(self):
+        started = time.perf_counter()
+        cpu_started = time.thread_time()
+        next_at = started
+        while not self._stop.is_set():
+            self._sample()
+            next_at += self.interval
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                self._stop.wait(delay)
+            else:
+                next_at = time.perf_counter()
+        self.cpu_seconds = time.thread_time() - cpu_started
+        self.wall_seconds = time.perf_counter() - started
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+    def top_leaves(self, n: int = 5):
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        return leaves.most_common(n)
+
+    @property
+    def overhead(self) -> float:
+        return self.cpu_seconds / self.wall_seconds if self.wall_seconds else 0.0
+
+_active_profiler = None
+
+# ---------------- HEALTH SERVER ----------------
+# aiohttp app on the bot's own loop (replaces the Flask keep-alive thread).
+# Started from setup_hook, stopped from bot.close.
+#   /         plain "alive" string for uptime pingers
+#   /healthz  process is up and the loop is answering
+#   /readyz   200 only if the gateway is connected, storage is writable and
+#             the queues are below their thresholds; 503 otherwise
+#   /status   JSON status document
+#   /metrics  Prometheus text exposition
+HEALTH_HOST = os.getenv("HEALTH_HOST", "0.0.0.0")
+HEALTH_PORT = _int_env("HEALTH_PORT", 8080)
+READY_LOG_QUEUE_FRACTION = 0.9          # of LOG_QUEUE_MAX
+READY_EVENT_LOG_BACKLOG = 50_000        # records waiting for the writer thread
+READY_MAX_LOOP_LAG = 2.0                # seconds
+
+_gateway_connected = [False]
+
+def _storage_writable() -> bool:
+    directory = os.path.dirname(os.path.abspath(DATA_FILE))
+    if not os.access(directory, os.W_OK):
+        return False
+    return not os.path.exists(DATA_FILE) or os.access(DATA_FILE, os.W_OK)
+
+def readiness_checks() -> dict:
+    return {
+        "gateway": _gateway_connected[0] and bot.is_ready() and not bot.is_closed(),
+        "storage": _storage_writable(),
+        "log_queue": log_sink.pending < LOG_QUEUE_MAX * READY_LOG_QUEUE_FRACTION,
+        "event_log": event_log.backlog < READY_EVENT_LOG_BACKLOG,
+        "loop_lag": _last_loop_lag[0] < READY_MAX_LOOP_LAG,
+    }
+
+def status_document() -> dict:
+    checks = readiness_checks()
+    rss_mb = system_sampler.latest("rss_mb")
+    return {
+        "version": VERSION,
+        "python": platform.python_version(),
+        "discord_py": discord.__version__,
+        "uptime_seconds": int(time.time() - start_time),
+        "ready": all(checks.values()),
+        "checks": checks,
+        "gateway": {
+            "connected": _gateway_connected[0],
+            "latency_ms": round(bot.latency * 1000, 1) if math.isfinite(bot.latency) else None,
+            "user": str(bot.user) if bot.user else None,
+        },
+        "guilds": len(bot.guilds),
+        "members": sum((g.member_count or 0) for g in bot.guilds),
+        "loop_lag_ms": round(_last_loop_lag[0] * 1000, 2),
+        "rss_mb": round(rss_mb, 1) if rss_mb is not None else None,
+        "log_queue": {"pending": log_sink.pending, "dropped": log_sink.dropped, "shed_rate": round(log_sink.shed_rate(), 4)},
+        "event_log_backlog": event_log.backlog,
+        "scheduled_jobs": _pending_jobs(),
+        "music_players": len(music_players),
+    }
+
+class HealthServer:
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._runner = None
+
+    def _app(self):
+        web = aiohttp_web
+        app = web.Application()
+
+        async def home(request):
+            return web.Response(text="Hazsbot is alive!")
+
+        async def healthz(request):
+            return web.json_response({"status": "ok", "uptime_seconds": int(time.time() - start_time)})
+
+        async def readyz(request):
+            checks = readiness_checks()
+            ready = all(checks.values())
+            return web.json_response({"ready": ready, "checks": checks}, status=200 if ready else 503)
+
+        async def status(request):
+            return web.json_response(status_document())
+
+        async def metrics_route(request):
+            return web.Response(body=metrics.render().encode(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+        app.router.add_get("/", home)
+        app.router.add_get("/healthz", healthz)
+        app.router.add_get("/readyz", readyz)
+        app.router.add_get("/status", status)
+        app.router.add_get("/metrics", metrics_route)
+        return app
+
+    async def start(self):
+        if self._runner is not None:
+            return
+        if aiohttp_web is None:
+            print("[health] aiohttp.web not available; health server disabled")
+            return
+        runner = aiohttp_web.AppRunner(self._app(), access_log=None)
+        await runner.setup()
+        try:
+            await aiohttp_web.TCPSite(runner, self.host, self.port).start()
+        except OSError as e:
+            print(f"[health] could not bind {self.host}:{self.port}: {e}")
+            await runner.cleanup()
+            return
+        self._runner = runner
+        print(f"[health] serving on http://{self.host}:{self.port}")
+
+    async def stop(self):
+        if self._runner is None:
+            return
+        runner, self._runner = self._runner, None
+        await runner.cleanup()
+
+health_server = HealthServer(HEALTH_HOST, HEALTH_PORT)  # started/stopped by HazsBot
+
 # ---------------- EVENTS ----------------
 @bot.event
 async def on_ready():
     print(f"(＾▽＾) Bot online as {bot.user} — Version {VERSION}")
     print(f"(＾▽＾) Python {platform.python_version()}, discord.py {discord.__version__}")
     print(f"(＾▽＾) DeepSeek model: {DEFAULT_MODEL} | DeepSeek key present: {'yes' if bool(DEEPSEEK_API_KEY) else 'no'}")
+    _gateway_connected[0] = True
     for g in bot.guilds:
         ensure_guild(g.id)
     try:
@@ -296,19 +2481,57 @@ async def on_ready():
     except Exception:
         pass
     bot.loop.create_task(resume_schedules())
+    mute_provisioner.resume()
+    audit_index.start(bot.guilds)
+    global _music_stats_task, _loop_monitor_task, _system_sampler_task, _memory_task, _scheduler_task
+    if _scheduler_task is None or _scheduler_task.done():
+        _scheduler_task = bot.loop.create_task(scheduler.run())
+    if _music_stats_task is None or _music_stats_task.done():
+        _music_stats_task = bot.loop.create_task(_music_stats_flusher())
+    if _loop_monitor_task is None or _loop_monitor_task.done():
+        _loop_monitor_task = bot.loop.create_task(loop_monitor.run())
+    if _system_sampler_task is None or _system_sampler_task.done():
+        _system_sampler_task = bot.loop.create_task(system_sampler.run())
+    if _memory_task is None or _memory_task.done():
+        _memory_task = bot.loop.create_task(memory_accountant.run())
+
+@bot.event
+async def on_disconnect():
+    _gateway_connected[0] = False
+
+@bot.event
+async def on_resumed():
+    _gateway_connected[0] = True
 
 @bot.event
 async def on_command(ctx):
     try:
         await log_event(
             "commands",
-            f"\u23F0 {datetime.utcnow().isoformat()} | {ctx.author} in #{ctx.channel} (g:{ctx.guild.id if ctx.guild else 'DM'}) ran: {ctx.message.content[:1800]}"
+            f"\u23F0 {datetime.utcnow().isoformat()} | {ctx.author} in #{ctx.channel} (g:{ctx.guild.id if ctx.guild else 'DM'}) ran: {ctx.message.content[:1800]}",
+            guild_id=ctx.guild.id if ctx.guild else None,
         )
     except Exception:
         pass
 
+def _command_latency_ms(ctx):
+    # stamped by the before/after_invoke hooks; None when the command failed
+    # before it was invoked (checks, argument conversion)
+    trace = getattr(ctx, "hz_trace", None)
+    return trace.wall * 1000 if trace is not None and trace.wall is not None else None
+
+@bot.event
+async def on_command_completion(ctx):
+    elog("command", ctx.guild.id if ctx.guild else None,
+         latency_ms=_command_latency_ms(ctx),
+         command=ctx.command.qualified_name if ctx.command else None, user_id=ctx.author.id)
+
 @bot.event
 async def on_command_error(ctx, error):
+    elog("command", ctx.guild.id if ctx.guild else None,
+         latency_ms=_command_latency_ms(ctx),
+         outcome="error", command=ctx.command.qualified_name if ctx.command else None,
+         user_id=ctx.author.id, error=f"{type(error).__name__}: {error}")
     try:
         await safe_send(ctx, f"(･_･;) Error: {error}")
     except Exception:
@@ -316,7 +2539,7 @@ async def on_command_error(ctx, error):
     try:
         tb = "".join(traceback.format_exception(type(error), error, error.__traceback__))
         snippet = tb[-1900:]
-        await log_event("errors", f"\u274C {datetime.utcnow().isoformat()} | {ctx.author} in #{ctx.channel}:\n```py\n{snippet}\n```")
+        await log_event("errors", f"\u274C {datetime.utcnow().isoformat()} | {ctx.author} in #{ctx.channel}:\n```py\n{snippet}\n```", guild_id=ctx.guild.id if ctx.guild else None)
     except Exception:
         pass
 
@@ -326,6 +2549,41 @@ async def on_message_delete(message):
         last_deleted_message[message.channel.id] = {"author": str(message.author), "content": message.content}
     await bot.process_commands(message)
 
+@bot.event
+async def on_audit_log_entry_create(entry):
+    audit_index.add(entry)
+
+@bot.event
+async def on_guild_join(guild):
+    audit_index.start([guild])
+
+@bot.event
+async def on_guild_channel_create(channel):
+    await mute_provisioner.on_channel_create(channel)
+
+@bot.event
+async def on_guild_role_delete(role):
+    mute_provisioner.forget_role(role)
+
+@bot.event
+async def on_guild_channel_delete(channel):
+    invalidate_log_channels(channel.guild.id)
+    webhook_pool.discard(channel.id)
+
+@bot.event
+async def on_guild_unavailable(guild):
+    invalidate_log_channels(guild.id)
+
+@bot.event
+async def on_guild_available(guild):
+    invalidate_log_channels(guild.id)
+
+@bot.event
+async def on_guild_remove(guild):
+    invalidate_log_channels(guild.id)
+    webhook_pool.discard_guild(guild)
+    await audit_index.forget_guild(guild.id)
+
 @bot.event
 async def on_member_join(member):
     ensure_guild(member.guild.id)
@@ -356,37 +2614,50 @@ async def on_message(message):
     # unified on_message: automod + music detection + command processing
     if message.author.bot:
         return
+    _m_stage["received"].inc()
     if not message.guild:
+        _m_stage["commands"].inc()
         await bot.process_commands(message)
         return
     gdata = ensure_guild(message.guild.id)
     if gdata.get("auto_mod_enabled", True):
+        _m_stage["automod"].inc()
         if check_profanity(message.content):
             try:
                 await message.delete()
                 await safe_send(message.channel, f"(╯︵╰,) {message.author.mention}, your message was removed for profanity.")
+                elog("automod", message.guild.id, outcome="deleted", rule="profanity", user_id=message.author.id)
+                _m_automod["profanity"].inc()
             except Exception as e:
                 print(f"[automod] delete/send failed: {e}")
+                elog("automod", message.guild.id, outcome="error", rule="profanity", error=str(e))
             return
         if check_caps(message.content):
             try:
                 await message.delete()
                 await safe_send(message.channel, f"(¬_¬) {message.author.mention}, please avoid excessive caps.")
+                elog("automod", message.guild.id, outcome="deleted", rule="caps", user_id=message.author.id)
+                _m_automod["caps"].inc()
             except Exception as e:
                 print(f"[automod] delete/send failed: {e}")
+                elog("automod", message.guild.id, outcome="error", rule="caps", error=str(e))
             return
         if check_invite(message.content):
             try:
                 await message.delete()
                 await safe_send(message.channel, f"(・_・;) {message.author.mention}, invite links are not allowed here.")
+                elog("automod", message.guild.id, outcome="deleted", rule="invite", user_id=message.author.id)
+                _m_automod["invite"].inc()
             except Exception as e:
                 print(f"[automod] delete/send failed: {e}")
+                elog("automod", message.guild.id, outcome="error", rule="invite", error=str(e))
             return
 
     # music link detection
     try:
         urls = URL_REGEX.findall(message.content or "")
         if urls:
+            _m_stage["music"].inc()
             for url in urls:
                 parsed = urlparse(url)
                 host = parsed.netloc.lower()
@@ -396,6 +2667,7 @@ async def on_message(message):
                     if host == domain or host.endswith('.' + domain):
                         oembed_data = await _fetch_oembed(url, provider.get('oembed'))
                         embed = discord.Embed(title=f"{provider['name']} link detected", url=url, color=discord.Color.purple(), timestamp=discord.utils.utcnow())
+                        title = None
                         if oembed_data:
                             title = oembed_data.get('title') or oembed_data.get('name')
                             author = oembed_data.get('author_name') or oembed_data.get('provider_name')
@@ -406,7 +2678,9 @@ async def on_message(message):
                                 embed.add_field(name='Author', value=author[:1024], inline=True)
                             if thumb:
                                 embed.set_thumbnail(url=thumb)
-                        await log_event('music', f"{message.author} posted a {provider['name']} link: {url}", embed)
+                        music_stats.record(message.guild.id, provider['name'], canonical_track(provider['name'], url), message.author.id, title)
+                        elog("music_link", message.guild.id, provider=provider['name'], oembed=bool(oembed_data))
+                        await log_event('music', f"{message.author} posted a {provider['name']} link: {url}", embed, guild_id=message.guild.id)
                         try:
                             await message.add_reaction("\U0001F3B5")
                         except Exception:
@@ -415,6 +2689,7 @@ async def on_message(message):
     except Exception as e:
         print(f"[on_message music detect] {e}")
 
+    _m_stage["commands"].inc()
     await bot.process_commands(message)
 
 # ---------------- AI ASK ----------------
@@ -423,6 +2698,7 @@ async def get_ai_response(prompt, max_tokens=800, temperature=0.7):
         return "(⚠) No DeepSeek API key configured. Set DEEPSEEK_API_KEY environment variable."
     if client is None:
         return "(⚠) AI client not initialized (OpenAI/OpenRouter lib missing or init failed)."
+    started = time.perf_counter()
     try:
         loop = asyncio.get_event_loop()
         completion = await loop.run_in_executor(
@@ -447,6 +2723,8 @@ async def get_ai_response(prompt, max_tokens=800, temperature=0.7):
     except Exception as e:
         print(f"[get_ai_response] OpenRouter/OpenAI client error: {e}")
         return f"(･_･;) DeepSeek request failed: {e}"
+    finally:
+        _trace_add("ai", time.perf_counter() - started)
 
 @bot.command(name="ask")
 async def cmd_ask(ctx, *, question: str = None):
@@ -489,6 +2767,9 @@ async def cmd_version(ctx):
         "`?ban @user [minutes] <reason>` - ban (temp or perm)",
         "`?kick @user <reason>` - kick user",
         "`?mute @user [minutes] <reason>` - mute temporarily",
+        "`?massban <id> <id> ... [| reason]` - ban many ids in bulk (mod + Ban Members)",
+        "`?mutemode <role|timeout>` - Muted role or Discord timeout (admin only)",
+        "`?audit [bans|kicks|<action>] [by:@mod] [target:@user] [before:<id>]` - indexed audit log (admin only)",
     ]
     fun = [
         "`?wordle` / `?guess <word>` - play Wordle",
@@ -501,16 +2782,27 @@ async def cmd_version(ctx):
     utility = [
         "`?snipe` - show last deleted message",
         "`?pin <id>` / `?unpin <id>` / `?bulkpin <limit>`",
+        "`?purge <n> [user:@x] [contains:word] [bots|humans|links|attachments|embeds]` - bulk delete (mod)",
+        "`?bulkjobs` / `?bulkcancel <id>` - running bulk jobs (mod)",
         "`?setslowmode <seconds>` - set slowmode",
         "`?remindme <10s|5m|2h> <msg>` - reminder",
+        "`?reminders` / `?cancelreminder <id>` - list / cancel your reminders",
+        "`?schedule add #channel <cron|6h> | <msg>` / `list` / `remove <id>` - recurring announcements (admin only, UTC)",
         "`?userinfo [@user]` - user info",
         "`?avatar [@user]` - show avatar",
         "`?test` - run diagnostics",
     ]
-    music = ["`?WIP` - dude idk WIP"]
+    music = [
+        "`?play <file>` - queue a track from the local library",
+        "`?skip` / `?queue` / `?stop` - control playback",
+        "`?musicstats [provider|track|poster] [day|month]` - top music links",
+    ]
     panel = [
         "`?dashboard` - control panel (owner only)",
-        "`?setlogchannel <type> #channel` - set log channel",
+        "`?perf [command]` - command latency percentiles (owner only)",
+        "`?profile [seconds]` - sample the event loop and upload a flamegraph file (owner only)",
+        "`?memory [snapshot|stop]` - registry sizes / tracemalloc growth (owner only)",
+        "`?setlogchannel <type> #channel` - set log channel (any server, admin)",
         "`?setprefix <prefix>` - set command prefix",
         "`?togglecategory <music|fun|utility>` - enable/disable features",
         "`?setwelcome <msg>` / `?setleave <msg>` - welcome/leave messages",
@@ -556,43 +2848,138 @@ async def cmd_dashboard(ctx):
     uptime = int(time.time() - start_time)
     h, rem = divmod(uptime, 3600)
     m, s = divmod(rem, 60)
-    latency_ms = int(bot.latency * 1000)
-    cpu = mem_used = mem_total = mem_pct = "N/A"
-    try:
-        if psutil:
-            cpu = f"{psutil.cpu_percent(interval=0.3)}%"
-            vm = psutil.virtual_memory()
-            mem_used = f"{vm.used // (1024*1024)} MB"
-            mem_total = f"{vm.total // (1024*1024)} MB"
-            mem_pct = f"{vm.percent}%"
-    except Exception:
-        pass
-    guilds = len(bot.guilds)
-    members = sum((g.member_count or 0) for g in bot.guilds)
+    latency_ms = int(bot.latency * 1000) if math.isfinite(bot.latency) else -1
+    sampler = system_sampler
+    if not sampler.series["guilds"]:
+        sampler.sample()  # first request before the sampler's first tick
+    cpu = sampler.latest("cpu_pct")
+    rss = sampler.latest("rss_mb")
+    mem_pct = sampler.latest("sys_mem_pct")
     voices = len(bot.voice_clients)
     embed = discord.Embed(title="Hazsbot Dashboard", color=discord.Color.blurple(), timestamp=discord.utils.utcnow())
-    embed.add_field(name="Status", value=f"Online | Ping {latency_ms}ms", inline=False)
+    embed.add_field(name="Status", value=f"Online | Ping {latency_ms}ms\n{sampler.trend('latency_ms')}", inline=False)
     embed.add_field(name="Uptime", value=f"{h}h {m}m {s}s", inline=True)
-    embed.add_field(name="Guilds", value=str(guilds), inline=True)
-    embed.add_field(name="Members", value=str(members), inline=True)
+    embed.add_field(name="Guilds", value=f"{sampler.latest('guilds')}\n{sampler.trend('guilds')}", inline=True)
+    embed.add_field(name="Members", value=f"{sampler.latest('members')}\n{sampler.trend('members')}", inline=True)
     embed.add_field(name="Voice Conns", value=str(voices), inline=True)
-    embed.add_field(name="CPU", value=str(cpu), inline=True)
-    embed.add_field(name="Memory", value=f"{mem_used}/{mem_total} ({mem_pct})", inline=True)
+    embed.add_field(name="CPU", value=f"{cpu:.1f}%\n{sampler.trend('cpu_pct')}" if cpu is not None else "N/A", inline=True)
+    embed.add_field(
+        name="Memory",
+        value=(f"RSS {rss:.0f} MB | system {mem_pct}% of {sampler.sys_mem_total_mb} MB\n{sampler.trend('rss_mb')}" if rss is not None else "N/A"),
+        inline=True,
+    )
+    embed.add_field(name="Queues", value=f"log {sampler.latest('log_queue')} | jobs {sampler.latest('pending_jobs')}\n{sampler.trend('pending_jobs')}", inline=True)
+    embed.set_footer(text=f"Trends: last {min(20, len(sampler.series['guilds'])) * sampler.interval}s, sampled every {sampler.interval}s")
+    embed.add_field(name="Event loop", value=f"lag {_last_loop_lag[0] * 1000:.1f}ms | {loop_monitor.slow_callbacks} stalls, worst {loop_monitor.worst_block * 1000:.0f}ms", inline=False)
+    embed.add_field(name="Log shedding", value=f"{log_sink.shed_rate():.1%} (last min) | {log_sink.shed_total} shed, {log_sink.dropped} dropped", inline=False)
     await safe_send(ctx, embed=embed)
     await log_event("dashboard", "📊 Dashboard requested", embed)
 
-@bot.command(name="setlogchannel")
+@bot.command(name="perf")
+@panel_only()
+async def cmd_perf(ctx, command_name: str = None):
+    names = [command_name] if command_name else sorted(command_perf.wall, key=lambda n: -command_perf.wall[n].percentiles(95)[0])
+    rows = []
+    for name in names[:15]:
+        hist = command_perf.wall.get(name)
+        if not hist or not hist.count:
+            continue
+        p50, p95, p99 = hist.percentiles(50, 95, 99)
+        rows.append(
+            f"{name[:12]:<12} {hist.count:>6} {p50:>8.1f} {p95:>8.1f} {p99:>8.1f} "
+            f"{command_perf.wait_share(name, 'rest'):>7.1f} {command_perf.wait_share(name, 'io'):>6.1f} {command_perf.wait_share(name, 'ai'):>7.1f}"
+        )
+    if not rows:
+        return await safe_send(ctx, "(･_･) No command timings recorded yet.")
+    header = f"{'command':<12} {'n':>6} {'p50ms':>8} {'p95ms':>8} {'p99ms':>8} {'rest':>7} {'io':>6} {'ai':>7}"
+    await safe_send(ctx, "```\n" + header + "\n" + "\n".join(rows) + "\n```\n(rest/io/ai = mean ms waited when the command waited at all)")
+    slow = sorted(command_perf.slowest, reverse=True)
+    if command_name:
+        slow = [item for item in slow if item[2]["command"] == command_name]
+    if slow:
+        lines = [
+            f"{s['when']} {s['command'][:12]:<12} {s['wall_ms']:>8.1f}ms rest {s['rest_ms']:.0f}ms/{s['rest_calls']} io {s['io_ms']:.0f}ms ai {s['ai_ms']:.0f}ms g:{s['guild'] or 'DM'}"
+            for _, _, s in slow
+        ]
+        await safe_send(ctx, "Slowest invocations:\n```\n" + "\n".join(lines) + "\n```")
+
+@bot.command(name="profile")
+@panel_only()
+async def cmd_profile(ctx, seconds: int = 10):
+    global _active_profiler
+    if _active_profiler is not None:
+        return await safe_send(ctx, "(･_･;) A profile is already running.")
+    seconds = max(1, min(PROFILE_MAX_SECONDS, seconds))
+    profiler = StackProfiler(threading.get_ident())
+    _active_profiler = profiler
+    await safe_send(ctx, f"(⌛) Sampling the event loop for {seconds}s at {PROFILE_HZ} Hz…")
+    try:
+        profiler.start()
+        await asyncio.sleep(seconds)
+    finally:
+        await asyncio.get_running_loop().run_in_executor(None, profiler.stop)
+        _active_profiler = None
+    if not profiler.samples:
+        return await safe_send(ctx, "(･_･;) No samples captured.")
+    top = "\n".join(f"{n / profiler.samples:6.1%}  {leaf[:80]}" for leaf, n in profiler.top_leaves())
+    name = f"hazsbot-profile-{datetime.utcnow():%Y%m%d-%H%M%S}.collapsed.txt"
+    data = io.BytesIO(profiler.collapsed().encode("utf-8"))
+    try:
+        await ctx.send(
+            content=(
+                f"(＾▽＾) {profiler.samples} samples over {profiler.wall_seconds:.1f}s, "
+                f"sampler overhead {profiler.overhead:.1%}. Collapsed stacks (open in speedscope or flamegraph.pl).\n"
+                f"Top leaf frames:\n```\n{top}\n```"
+            ),
+            file=discord.File(data, filename=name),
+        )
+    except Exception as e:
+        await safe_send(ctx, f"(･_･;) Could not upload profile: {e}")
+
+@bot.command(name="memory")
 @panel_only()
+async def cmd_memory(ctx, action: str = "report"):
+    action = action.lower()
+    if action == "stop":
+        memory_accountant.stop_tracing()
+        return await safe_send(ctx, "(＾▽＾) tracemalloc stopped.")
+    if action in ("snapshot", "diff"):
+        diff = await memory_accountant.snapshot_diff()
+        if diff is None:
+            return await safe_send(ctx, "(⌛) tracemalloc baseline taken. Run `?memory snapshot` again later to see growth, `?memory stop` to turn tracing off.")
+        lines = [f"{st.size_diff / 1024:+9.1f} KiB {st.count_diff:+7d} blk  {st.traceback[0].filename.rsplit(os.sep, 1)[-1]}:{st.traceback[0].lineno}" for st in diff]
+        return await safe_send(ctx, "Top allocation growth since last snapshot:\n```\n" + "\n".join(lines) + "\n```")
+    if action != "report":
+        return await safe_send(ctx, "(･_･;) Use `?memory`, `?memory snapshot` or `?memory stop`.")
+    memory_accountant.refresh()
+    rows = [
+        f"{name:<22} {memory_accountant.entries.get(name, 0):>8} {memory_accountant.bytes.get(name, 0) / 1024:>10.1f}"
+        for name in MEMORY_REGISTRIES
+    ]
+    tasks = ", ".join(f"{name}={n}" for name, n in memory_accountant.tasks.most_common(6))
+    rss = system_sampler.latest("rss_mb")
+    await safe_send(
+        ctx,
+        f"```\n{'registry':<22} {'entries':>8} {'KiB':>10}\n" + "\n".join(rows) + "\n```"
+        + f"Tasks: {tasks or 'none'}\nRSS: {f'{rss:.0f} MB' if rss is not None else 'N/A'} | tracemalloc: {'on' if tracemalloc.is_tracing() else 'off'}",
+    )
+
+@bot.command(name="setlogchannel")
+@commands.guild_only()
+@commands.has_permissions(administrator=True)
 async def cmd_setlogchannel(ctx, kind: str, channel: discord.TextChannel):
     kind = kind.lower()
     valid = {"commands", "errors", "moderation", "music", "dashboard", "joins"}
     if kind not in valid:
         return await safe_send(ctx, f"(･_･;) kind must be one of: {', '.join(sorted(valid))}")
-    if ctx.guild.id != PANEL_GUILD_ID:
-        return await safe_send(ctx, "(･_･;) Must run in the panel server.")
-    g = ensure_guild(PANEL_GUILD_ID)
+    if ctx.guild.id == PANEL_GUILD_ID and not is_panel_owner_ctx(ctx):
+        raise commands.CheckFailure("Not authorized for panel.")
+    if channel.guild.id != ctx.guild.id:
+        return await safe_send(ctx, "(･_･;) The channel must be in this server.")
+    g = ensure_guild(ctx.guild.id)
     g["log_channels"][kind] = channel.id
     save_data(server_data)
+    invalidate_log_channels(ctx.guild.id)
     await safe_send(ctx, f"(＾▽＾) Set **{kind}** logs to {channel.mention}.")
 
 @bot.command(name="setprefix")
@@ -625,6 +3012,17 @@ async def cmd_setwelcome(ctx, *, message: str):
     save_data(server_data)
     await safe_send(ctx, f"(＾▽＾) Updated welcome message.")
 
+@bot.command(name="mutemode")
+@commands.has_permissions(administrator=True)
+async def cmd_mutemode(ctx, mode: str):
+    mode = mode.lower()
+    if mode not in ("role", "timeout"):
+        return await safe_send(ctx, "(･_･;) Use `role` (Muted role) or `timeout` (Discord timeout, max 28 days).")
+    g = ensure_guild(ctx.guild.id)
+    g["mute_mode"] = mode
+    save_data(server_data)
+    await safe_send(ctx, f"(＾▽＾) `?mute` now uses **{mode}**.")
+
 @bot.command(name="setleave")
 @commands.has_permissions(administrator=True)
 async def cmd_setleave(ctx, *, message: str):
@@ -634,6 +3032,121 @@ async def cmd_setleave(ctx, *, message: str):
     await safe_send(ctx, f"(＾▽＾) Updated leave message.")
 
 # ---------------- Moderation commands ----------------
+# ---- mute role provisioning ----
+# The Muted role needs a deny overwrite on every channel. That runs in the
+# background in concurrent batches of MUTE_PROVISION_CONCURRENCY channels;
+# the finished channel ids are kept under server_data[gid]["mute_provisioning"]
+# and saved at most every MUTE_PROVISION_SAVE_INTERVAL seconds, so a restart
+# resumes close to where it stopped (channels that already carry the deny
+# overwrite are skipped without a REST call). The list is dropped once the
+# guild is complete; channels created later get the overwrite from
+# on_guild_channel_create.
+# Guilds with mute_mode "timeout" use Discord's member timeout instead.
+MUTE_ROLE_NAME = "Muted"
+MUTE_PROVISION_CONCURRENCY = 5
+MUTE_PROVISION_SAVE_INTERVAL = 10.0  # seconds between servers.json saves while provisioning
+MUTE_OVERWRITE = dict(send_messages=False, speak=False, add_reactions=False)
+MUTE_TIMEOUT_MAX = timedelta(days=28)
+
+def _mute_overwrite_ok(channel, role: discord.Role) -> bool:
+    ow = channel.overwrites_for(role)
+    return all(getattr(ow, k) is v for k, v in MUTE_OVERWRITE.items())
+
+class MuteProvisioner:
+    def __init__(self):
+        self._tasks = {}  # guild_id -> Task
+
+    def state(self, guild_id: int) -> dict | None:
+        return server_data.get(str(guild_id), {}).get("mute_provisioning")
+
+    def running(self, guild_id: int) -> bool:
+        t = self._tasks.get(guild_id)
+        return t is not None and not t.done()
+
+    def ensure(self, guild: discord.Guild, role: discord.Role):
+        g = ensure_guild(guild.id)
+        st = g.get("mute_provisioning")
+        if not st or st.get("role_id") != role.id:
+            g["mute_provisioning"] = st = {"role_id": role.id, "done": [], "complete": False}
+            save_data(server_data)
+        if st["complete"] or self.running(guild.id):
+            return
+        self._tasks[guild.id] = bot.loop.create_task(self._provision(guild, role, st))
+
+    async def _provision(self, guild: discord.Guild, role: discord.Role, st: dict):
+        started = saved = time.perf_counter()
+        done = set(st.get("done", ()))
+        pending = [ch for ch in guild.channels if ch.id not in done]
+        applied = skipped = failed = 0
+        for i in range(0, len(pending), MUTE_PROVISION_CONCURRENCY):
+            batch = pending[i:i + MUTE_PROVISION_CONCURRENCY]
+            results = await asyncio.gather(*(self._apply(ch, role) for ch in batch))
+            for ch, result in zip(batch, results):
+                if result == "failed":
+                    failed += 1
+                    continue
+                applied += result == "applied"
+                skipped += result == "skipped"
+                done.add(ch.id)
+            st["done"] = list(done)
+            if time.perf_counter() - saved >= MUTE_PROVISION_SAVE_INTERVAL:
+                save_data(server_data)
+                saved = time.perf_counter()
+        st["complete"] = failed == 0
+        if st["complete"]:
+            st.pop("done", None)
+        save_data(server_data)
+        elapsed = time.perf_counter() - started
+        elog("mute_provision", guild.id, latency_ms=elapsed * 1000, applied=applied, skipped=skipped, failed=failed)
+        if applied or failed:
+            await log_event("moderation", f"🔧 Muted role set up in {guild.name}: {applied} channel(s) updated, "
+                            f"{skipped} already set, {failed} failed ({elapsed:.1f}s)", guild_id=guild.id)
+
+    async def _apply(self, channel, role: discord.Role) -> str:
+        if _mute_overwrite_ok(channel, role):
+            return "skipped"
+        try:
+            await channel.set_permissions(role, reason="Muted role setup", **MUTE_OVERWRITE)
+            return "applied"
+        except discord.NotFound:
+            return "skipped"  # channel deleted meanwhile
+        except Exception as e:
+            print(f"[mute_provision] {channel.guild.id}/{channel.id}: {e}")
+            return "failed"
+
+    async def on_channel_create(self, channel):
+        st = self.state(channel.guild.id)
+        if not st:
+            return
+        role = channel.guild.get_role(st["role_id"])
+        if role is None:
+            return
+        # no save: a restart re-checks the channel, and a channel that already
+        # has the overwrite is skipped without a REST call
+        if await self._apply(channel, role) != "failed" and not st.get("complete"):
+            st.setdefault("done", []).append(channel.id)
+
+    def forget_role(self, role: discord.Role):
+        g = server_data.get(str(role.guild.id))
+        st = g.get("mute_provisioning") if g else None
+        if not st or st.get("role_id") != role.id:
+            return
+        t = self._tasks.pop(role.guild.id, None)
+        if t is not None:
+            t.cancel()
+        del g["mute_provisioning"]
+        save_data(server_data)
+
+    def resume(self):
+        for g in bot.guilds:
+            st = self.state(g.id)
+            if st and not st.get("complete"):
+                role = g.get_role(st["role_id"])
+                if role is not None:
+                    self.ensure(g, role)
+
+mute_provisioner = MuteProvisioner()
+
 def add_warning(guild_id: int, user_id: int, reason: str):
     gid = str(guild_id)
     ensure_guild(guild_id)
@@ -660,7 +3173,7 @@ async def cmd_warn(ctx, member: discord.Member, *, reason: str = "No reason prov
         return await safe_send(ctx, "(╯︵╰,) You do not have permission to warn members.")
     add_warning(ctx.guild.id, member.id, reason)
     await safe_send(ctx, f"(｀・ω・´) {member.mention} warned: {reason}")
-    await log_event("moderation", f"⚠️ {ctx.author} warned {member} in {ctx.guild.name}: {reason}")
+    await log_event("moderation", f"⚠️ {ctx.author} warned {member} in {ctx.guild.name}: {reason}", guild_id=ctx.guild.id)
 
 @bot.command(name="unwarn")
 async def cmd_unwarn(ctx, member: discord.Member, index: int = None):
@@ -669,7 +3182,7 @@ async def cmd_unwarn(ctx, member: discord.Member, index: int = None):
     removed = remove_warning(ctx.guild.id, member.id, index)
     if removed:
         await safe_send(ctx, f"(＾▽＾) Removed warn: {removed['reason']}")
-        await log_event("moderation", f"🗑️ {ctx.author} removed a warn for {member} in {ctx.guild.name}: {removed['reason']}")
+        await log_event("moderation", f"🗑️ {ctx.author} removed a warn for {member} in {ctx.guild.name}: {removed['reason']}", guild_id=ctx.guild.id)
     else:
         await safe_send(ctx, "(･_･) No warn found or invalid index.")
 
@@ -680,10 +3193,10 @@ async def cmd_ban(ctx, member: discord.Member, duration_minutes: int = 0, *, rea
     try:
         await ctx.guild.ban(member, reason=reason, delete_message_days=0)
         await safe_send(ctx, f"(｀・ω・´) {member} banned. Reason: {reason} {'(temporarily)' if duration_minutes>0 else '(permanent)'}")
-        await log_event("moderation", f"⛔ {ctx.author} banned {member} in {ctx.guild.name} ({'temp ' + str(duration_minutes) + 'm' if duration_minutes>0 else 'perm'}): {reason}")
+        await log_event("moderation", f"⛔ {ctx.author} banned {member} in {ctx.guild.name} ({'temp ' + str(duration_minutes) + 'm' if duration_minutes>0 else 'perm'}): {reason}", guild_id=ctx.guild.id)
         if duration_minutes > 0:
             unban_at = datetime.utcnow() + timedelta(minutes=duration_minutes)
-            bot.loop.create_task(schedule_unban(ctx.guild.id, member.id, unban_at))
+            schedule_unban(ctx.guild.id, member.id, unban_at)
     except Exception as e:
         await safe_send(ctx, f"(･_･;) Failed to ban: {e}")
 
@@ -694,7 +3207,7 @@ async def cmd_kick(ctx, member: discord.Member, *, reason: str = "No reason prov
     try:
         await member.kick(reason=reason)
         await safe_send(ctx, f"(｀・ω・´) {member} kicked. Reason: {reason}")
-        await log_event("moderation", f"👢 {ctx.author} kicked {member} in {ctx.guild.name}: {reason}")
+        await log_event("moderation", f"👢 {ctx.author} kicked {member} in {ctx.guild.name}: {reason}", guild_id=ctx.guild.id)
     except Exception as e:
         await safe_send(ctx, f"(･_･;) Failed to kick: {e}")
 
@@ -703,20 +3216,26 @@ async def cmd_mute(ctx, member: discord.Member, minutes: int = 10, *, reason: st
     if not is_mod(ctx):
         return await safe_send(ctx, "(╯︵╰,) You do not have permission to mute members.")
     guild = ctx.guild
-    mute_role = discord.utils.get(guild.roles, name="Muted")
+    if ensure_guild(guild.id).get("mute_mode") == "timeout":
+        duration = min(timedelta(minutes=minutes), MUTE_TIMEOUT_MAX)
+        try:
+            await member.timeout(duration, reason=reason)
+        except Exception as e:
+            return await safe_send(ctx, f"(･_･;) Could not time out: {e}")
+        await safe_send(ctx, f"(ﾉ◕‿◕) {member.mention} timed out for {int(duration.total_seconds() // 60)} minute(s). Reason: {reason}")
+        await log_event("moderation", f"🔇 {ctx.author} timed out {member} for {minutes}m in {ctx.guild.name}: {reason}", guild_id=ctx.guild.id)
+        return
+    mute_role = discord.utils.get(guild.roles, name=MUTE_ROLE_NAME)
     try:
         if not mute_role:
-            mute_role = await guild.create_role(name="Muted", reason="Created by bot for mute command")
-            for ch in guild.channels:
-                try:
-                    await ch.set_permissions(mute_role, send_messages=False, speak=False, add_reactions=False)
-                except Exception:
-                    pass
+            mute_role = await guild.create_role(name=MUTE_ROLE_NAME, reason="Created by bot for mute command")
+        mute_provisioner.ensure(guild, mute_role)
         await member.add_roles(mute_role, reason=reason)
-        await safe_send(ctx, f"(ﾉ◕‿◕) {member.mention} muted for {minutes} minute(s). Reason: {reason}")
-        await log_event("moderation", f"🔇 {ctx.author} muted {member} for {minutes}m in {ctx.guild.name}: {reason}")
+        setup = " (channel permissions are being set up in the background)" if mute_provisioner.running(guild.id) else ""
+        await safe_send(ctx, f"(ﾉ◕‿◕) {member.mention} muted for {minutes} minute(s). Reason: {reason}{setup}")
+        await log_event("moderation", f"🔇 {ctx.author} muted {member} for {minutes}m in {ctx.guild.name}: {reason}", guild_id=ctx.guild.id)
         unmute_at = datetime.utcnow() + timedelta(minutes=minutes)
-        bot.loop.create_task(schedule_unmute(guild.id, member.id, mute_role.id, unmute_at))
+        schedule_unmute(guild.id, member.id, mute_role.id, unmute_at)
     except Exception as e:
         await safe_send(ctx, f"(･_･;) Could not mute: {e}")
 
@@ -742,19 +3261,338 @@ async def cmd_unpin(ctx, message_id: int):
     except Exception as e:
         await safe_send(ctx, f"(･_･;) Could not unpin message: {e}")
 
+# ---- bulk operations ----
+# Long moderation jobs (pin N, purge by filter, mass ban) run as background
+# tasks and report through one status message that is edited at most every
+# BULK_STATUS_INTERVAL seconds. Bulk endpoints are used where Discord has them
+# (bulk message delete, bulk ban); per-item calls run with bounded
+# concurrency. Every call is paced by a client-side limiter per route and
+# major id (channel/guild) so a job stays inside the route's bucket instead of
+# leaning on 429 retries. discord.py already waits out and retries 429s
+# itself; one that still escapes pushes the whole route back by its
+# Retry-After. Only one pin/purge job may run per channel at a time.
+BULK_OP_CONCURRENCY = 3
+BULK_STATUS_INTERVAL = 2.0
+BULK_MAX_PINS = 50          # Discord's per-channel pin limit
+PURGE_SCAN_MAX = 1000
+MASSBAN_MAX = 1000
+MASSBAN_CHUNK = 200         # bulk ban endpoint limit
+BULK_DELETE_CHUNK = 100     # bulk delete endpoint limit
+BULK_DELETE_MAX_AGE = timedelta(days=14)
+BULK_ROUTE_RATES = {        # route -> (requests, per seconds)
+    "pin": (5, 5.0),
+    "delete_message": (5, 5.0),
+    "bulk_delete": (1, 1.0),
+    "bulk_ban": (1, 2.0),
+}
+
+class RouteLimiter:
+    # GCRA per (route, major id): `requests` may go out back to back, after
+    # that one every per/requests seconds
+    def __init__(self, rates: dict):
+        self.rates = rates
+        self._tat = {}  # (route, major) -> theoretical arrival time
+        self.waited = 0.0
+
+    async def acquire(self, route: str, major: int):
+        n, per = self.rates[route]
+        interval = per / n
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        key = (route, major)
+        tat = max(self._tat.get(key, now), now)
+        self._tat[key] = tat + interval
+        wait = tat - now - (per - interval)
+        if len(self._tat) > 1024:
+            self._tat = {k: v for k, v in self._tat.items() if v > now}
+        if wait > 0:
+            self.waited += wait
+            await asyncio.sleep(wait)
+
+    def penalize(self, route: str, major: int, retry_after: float):
+        key = (route, major)
+        now = asyncio.get_running_loop().time()
+        self._tat[key] = max(self._tat.get(key, now), now + retry_after + self.rates[route][1])
+
+class BulkJob:
+    __slots__ = ("id", "kind", "guild_id", "channel_id", "author_id", "total", "done", "failed", "state", "note",
+                 "started", "status_msg", "task")
+
+    def __init__(self, job_id: int, kind: str, guild_id: int, author_id: int, channel_id: int | None = None):
+        self.id = job_id
+        self.kind = kind
+        self.guild_id = guild_id
+        self.channel_id = channel_id  # set for jobs that own a channel (pin, purge)
+        self.author_id = author_id
+        self.total = None
+        self.done = 0
+        self.failed = 0
+        self.state = "running"
+        self.note = ""
+        self.started = time.perf_counter()
+        self.status_msg = None
+        self.task = None
+
+    def status(self) -> str:
+        total = "?" if self.total is None else self.total
+        elapsed = time.perf_counter() - self.started
+        progress = f"{self.done}/{total} done, {self.failed} failed, {elapsed:.0f}s"
+        note = f" — {self.note}" if self.note else ""
+        if self.state == "running":
+            return f"(⌛) Bulk {self.kind} #{self.id}: {progress}{note}. `?bulkcancel {self.id}` to stop."
+        face = {"done": "(＾▽＾)", "cancelled": "(・_・)", "failed": "(･_･;)"}[self.state]
+        return f"{face} Bulk {self.kind} #{self.id} {self.state}: {progress}{note}."
+
+class BulkOps:
+    def __init__(self):
+        self.jobs = {}  # id -> BulkJob (running only)
+        self._seq = 0
+        self.limiter = RouteLimiter(BULK_ROUTE_RATES)
+
+    async def start(self, ctx, kind: str, runner, channel_id: int | None = None) -> BulkJob | None:
+        if channel_id is not None:
+            busy = next((j for j in self.jobs.values() if j.channel_id == channel_id), None)
+            if busy is not None:
+                await safe_send(ctx, f"(･_･;) Bulk {busy.kind} #{busy.id} is already running here. "
+                                     f"Wait for it or `?bulkcancel {busy.id}`.")
+                return None
+        self._seq += 1
+        job = BulkJob(self._seq, kind, ctx.guild.id, ctx.author.id, channel_id)
+        job.status_msg = await safe_send(ctx, job.status())
+        self.jobs[job.id] = job
+        job.task = bot.loop.create_task(self._run(job, runner))
+        return job
+
+    def cancel(self, job_id: int, guild_id: int) -> bool:
+        job = self.jobs.get(job_id)
+        if job is None or job.guild_id != guild_id:
+            return False
+        job.task.cancel()
+        return True
+
+    async def _run(self, job: BulkJob, runner):
+        updater = bot.loop.create_task(self._status_loop(job))
+        try:
+            await runner(job)
+            job.state = "done"
+        except asyncio.CancelledError:
+            job.state = "cancelled"
+        except Exception as e:
+            job.state = "failed"
+            job.note = str(e)[:200]
+            print(f"[bulk] {job.kind} #{job.id} failed: {e}")
+        finally:
+            updater.cancel()
+            self.jobs.pop(job.id, None)
+        await self._edit(job)
+        guild = bot.get_guild(job.guild_id)
+        await log_event("moderation", f"🧹 Bulk {job.kind} #{job.id} by <@{job.author_id}> in {guild.name if guild else job.guild_id}: "
+                        f"{job.state}, {job.done} done, {job.failed} failed", guild_id=job.guild_id)
+        elog("bulk_op", job.guild_id, latency_ms=(time.perf_counter() - job.started) * 1000, outcome=job.state,
+             kind=job.kind, done=job.done, failed=job.failed)
+
+    async def _edit(self, job: BulkJob):
+        if job.status_msg is None:
+            return
+        try:
+            await job.status_msg.edit(content=job.status())
+        except Exception as e:
+            print(f"[bulk] status edit failed: {e}")
+
+    async def _status_loop(self, job: BulkJob):
+        last = None
+        while True:
+            await asyncio.sleep(BULK_STATUS_INTERVAL)
+            snapshot = (job.total, job.done, job.failed, job.note)
+            if snapshot != last:
+                last = snapshot
+                await self._edit(job)
+
+    @staticmethod
+    def _retry_after(e: discord.HTTPException) -> float:
+        headers = getattr(e.response, "headers", None) or {}
+        try:
+            return max(0.0, float(headers.get("Retry-After", 1.0)))
+        except (TypeError, ValueError):
+            return 1.0
+
+    async def call(self, route: str, major: int, fn, *args, **kwargs):
+        # a 429 reaching us means discord.py's own retries ran out: back the
+        # route off by Retry-After and make one last attempt
+        for attempt in range(2):
+            await self.limiter.acquire(route, major)
+            try:
+                return await fn(*args, **kwargs)
+            except discord.HTTPException as e:
+                if e.status != 429 or attempt:
+                    raise
+                self.limiter.penalize(route, major, self._retry_after(e))
+
+    async def each(self, job: BulkJob, items: list, route: str, major: int, fn):
+        sem = asyncio.Semaphore(BULK_OP_CONCURRENCY)
+
+        async def one(item):
+            async with sem:
+                try:
+                    await self.call(route, major, fn, item)
+                    job.done += 1
+                except discord.NotFound:
+                    job.done += 1  # already gone
+                except discord.HTTPException:
+                    job.failed += 1
+        await asyncio.gather(*(one(item) for item in items))
+
+    # --- job bodies ---
+    async def pin(self, job: BulkJob, channel, limit: int):
+        pinned = await channel.pins()
+        room = max(0, BULK_MAX_PINS - len(pinned))
+        status_id = job.status_msg.id if job.status_msg else None
+        targets = [m async for m in channel.history(limit=limit) if not m.pinned and m.id != status_id]
+        if len(targets) > room:
+            job.note = f"only {room} pin slot(s) left"
+            targets = targets[:room]
+        job.total = len(targets)
+        await self.each(job, targets, "pin", channel.id, lambda m: m.pin())
+
+    async def purge(self, job: BulkJob, channel, limit: int, check, keep: set):
+        cutoff = discord.utils.utcnow() - BULK_DELETE_MAX_AGE + timedelta(minutes=1)
+        recent, old = [], []
+        if job.status_msg is not None:
+            keep = keep | {job.status_msg.id}
+        async for m in channel.history(limit=limit):
+            if m.id in keep or m.pinned or not check(m):
+                continue
+            (recent if m.created_at > cutoff else old).append(m)
+        job.total = len(recent) + len(old)
+        for i in range(0, len(recent), BULK_DELETE_CHUNK):
+            chunk = recent[i:i + BULK_DELETE_CHUNK]
+            try:
+                if len(chunk) == 1:
+                    await self.call("delete_message", channel.id, chunk[0].delete)
+                else:
+                    await self.call("bulk_delete", channel.id, channel.delete_messages, chunk, reason=f"Bulk purge #{job.id}")
+                job.done += len(chunk)
+            except discord.HTTPException as e:
+                job.failed += len(chunk)
+                print(f"[bulk] purge chunk failed: {e}")
+        if old:
+            job.note = f"{len(old)} message(s) older than 14 days deleted one by one"
+            await self.each(job, old, "delete_message", channel.id, lambda m: m.delete())
+
+    async def massban(self, job: BulkJob, guild: discord.Guild, user_ids: list, reason: str):
+        job.total = len(user_ids)
+        for i in range(0, len(user_ids), MASSBAN_CHUNK):
+            chunk = [discord.Object(id=uid) for uid in user_ids[i:i + MASSBAN_CHUNK]]
+            try:
+                result = await self.call("bulk_ban", guild.id, guild.bulk_ban, chunk, reason=reason, delete_message_seconds=0)
+                job.done += len(result.banned)
+                job.failed += len(result.failed)
+            except discord.HTTPException as e:
+                job.failed += len(chunk)
+                job.note = str(e)[:120]
+
+bulk_ops = BulkOps()
+
+_PURGE_LINK_RE = re.compile(r"https?://", re.IGNORECASE)
+
+def _purge_filter(tokens: list, message: discord.Message):
+    # tokens: bots, humans, links, attachments, embeds, user:<@id|id>, contains:<text>
+    users, needles, flags = set(), [], set()
+    for tok in tokens:
+        key, _, value = tok.partition(":")
+        key = key.lower()
+        if key == "user" and value:
+            uid = value.strip("<@!>")
+            if not uid.isdigit():
+                raise ValueError(f"bad user `{value}`")
+            users.add(int(uid))
+        elif key == "contains" and value:
+            needles.append(value.lower())
+        elif key in ("bots", "humans", "links", "attachments", "embeds") and not value:
+            flags.add(key)
+        else:
+            raise ValueError(f"unknown filter `{tok}`")
+    users |= {m.id for m in message.mentions}
+
+    def check(m: discord.Message) -> bool:
+        if users and m.author.id not in users:
+            return False
+        if "bots" in flags and not m.author.bot:
+            return False
+        if "humans" in flags and m.author.bot:
+            return False
+        if "links" in flags and not _PURGE_LINK_RE.search(m.content or ""):
+            return False
+        if "attachments" in flags and not m.attachments:
+            return False
+        if "embeds" in flags and not m.embeds:
+            return False
+        if needles:
+            text = (m.content or "").lower()
+            if not any(n in text for n in needles):
+                return False
+        return True
+    return check
+
 @bot.command(name="bulkpin")
 async def cmd_bulkpin(ctx, limit: int = 10):
     if not is_mod(ctx):
         return await safe_send(ctx, "(╯︵╰,) You do not have permission to bulk pin.")
-    pinned = 0
+    limit = max(1, min(limit, PURGE_SCAN_MAX))
+    await bulk_ops.start(ctx, "pin", lambda job: bulk_ops.pin(job, ctx.channel, limit), ctx.channel.id)
+
+@bot.command(name="purge")
+@commands.guild_only()
+async def cmd_purge(ctx, limit: int, *filters: str):
+    if not is_mod(ctx):
+        return await safe_send(ctx, "(╯︵╰,) You do not have permission to purge messages.")
+    limit = max(1, min(limit, PURGE_SCAN_MAX))
     try:
-        async for m in ctx.channel.history(limit=limit):
-            if not m.pinned:
-                await m.pin()
-                pinned += 1
-        await safe_send(ctx, f"(＾▽＾) Pinned {pinned} messages.")
-    except Exception as e:
-        await safe_send(ctx, f"(･_･;) Bulk pin failed: {e}")
+        check = _purge_filter([f for f in filters if not f.startswith("<@")], ctx.message)
+    except ValueError as e:
+        return await safe_send(ctx, f"(･_･;) {e}. Filters: `user:@x`, `contains:word`, `bots`, `humans`, `links`, `attachments`, `embeds`.")
+    keep = {ctx.message.id}
+    await bulk_ops.start(ctx, "purge", lambda job: bulk_ops.purge(job, ctx.channel, limit, check, keep), ctx.channel.id)
+
+@bot.command(name="massban")
+@commands.guild_only()
+async def cmd_massban(ctx, *, args: str):
+    if not is_mod(ctx) or not ctx.author.guild_permissions.ban_members:
+        return await safe_send(ctx, "(╯︵╰,) You need mod and Ban Members permissions to mass ban.")
+    ids_part, _, reason = args.partition("|")
+    ids = []
+    seen = set()
+    for tok in re.split(r"[\s,]+", ids_part.strip()):
+        uid = tok.strip("<@!>")
+        if uid.isdigit() and int(uid) not in seen and int(uid) != ctx.author.id:
+            seen.add(int(uid))
+            ids.append(int(uid))
+    if not ids:
+        return await safe_send(ctx, "(･_･;) Use `?massban <id> <id> ... [| reason]`.")
+    if len(ids) > MASSBAN_MAX:
+        return await safe_send(ctx, f"(･_･;) At most {MASSBAN_MAX} ids per mass ban.")
+    reason = (reason.strip() or "Mass ban")[:400]
+    await bulk_ops.start(ctx, "ban", lambda job: bulk_ops.massban(job, ctx.guild, ids, f"{reason} (by {ctx.author})"))
+
+@bot.command(name="bulkjobs")
+@commands.guild_only()
+async def cmd_bulkjobs(ctx):
+    if not is_mod(ctx):
+        return await safe_send(ctx, "(╯︵╰,) You do not have permission to view bulk jobs.")
+    jobs = [j for j in bulk_ops.jobs.values() if j.guild_id == ctx.guild.id]
+    if not jobs:
+        return await safe_send(ctx, "(・_・) No bulk jobs running.")
+    await safe_send(ctx, "\n".join(j.status() for j in jobs))
+
+@bot.command(name="bulkcancel")
+@commands.guild_only()
+async def cmd_bulkcancel(ctx, job_id: str):
+    if not is_mod(ctx):
+        return await safe_send(ctx, "(╯︵╰,) You do not have permission to cancel bulk jobs.")
+    jid = job_id.lstrip("#")
+    if not jid.isdigit() or not bulk_ops.cancel(int(jid), ctx.guild.id):
+        return await safe_send(ctx, f"(･_･) No running bulk job #{jid}. See `?bulkjobs`.")
+    await safe_send(ctx, f"(＾▽＾) Cancelling bulk job #{jid}.")
 
 @bot.command(name="setslowmode")
 async def cmd_setslowmode(ctx, seconds: int):
@@ -768,26 +3606,260 @@ async def cmd_setslowmode(ctx, seconds: int):
     except Exception as e:
         await safe_send(ctx, f"(･_･;) Could not set slowmode: {e}")
 
+# ---- audit log index ----
+# ?audit used to fetch the newest 20 entries over REST on every call. The index
+# keeps a per-guild copy in SQLite instead, fed live by on_audit_log_entry_create
+# (moderation intent, on by default) plus a backfill on ready/join that pages
+# forward with after= from the newest stored entry, so reconnects only fetch the
+# gap. Rows are keyed by (guild, entry id), so live events and backfill pages
+# overlap harmlessly. Action, actor and target each have an index ending in the
+# entry id, so every query is a keyset range scan and paging uses before:<id>.
+AUDIT_INDEX_FILE = os.getenv("AUDIT_INDEX_FILE", "audit.sqlite3")
+AUDIT_RETENTION_DAYS = _int_env("AUDIT_RETENTION_DAYS", 90)
+AUDIT_BACKFILL_DAYS = 45  # Discord keeps audit entries for 45 days
+AUDIT_WRITE_BATCH = 100
+AUDIT_PAGE_SIZE = 10
+AUDIT_ALIASES = {
+    "bans": ("ban",),
+    "kicks": ("kick",),
+    "unbans": ("unban",),
+    "roles": ("member_role_update",),
+    "members": ("member_update",),  # includes timeouts
+    "messages": ("message_delete", "message_bulk_delete"),
+    "channels": ("channel_create", "channel_update", "channel_delete"),
+}
+
+class AuditIndex:
+    def __init__(self, path: str):
+        self.path = path
+        self._db = None
+        self._db_failed = False
+        self._lock = threading.Lock()  # backfill writes and queries run on executor threads
+        self._pending = []             # guilds waiting for a backfill
+        self._task = None
+        self._live = []                # rows from live events waiting for the writer
+        self._live_task = None
+        self.backfilling = set()
+
+    def _open(self):
+        if self._db is not None or self._db_failed:
+            return self._db
+        try:
+            db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS audit ("
+                "guild_id INTEGER NOT NULL, id INTEGER NOT NULL, action TEXT NOT NULL, "
+                "actor_id INTEGER, target_id INTEGER, actor TEXT, target TEXT, reason TEXT, "
+                "PRIMARY KEY (guild_id, id)) WITHOUT ROWID"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS audit_action ON audit(guild_id, action, id)")
+            db.execute("CREATE INDEX IF NOT EXISTS audit_actor ON audit(guild_id, actor_id, id)")
+            db.execute("CREATE INDEX IF NOT EXISTS audit_target ON audit(guild_id, target_id, id)")
+            # how far the backfill has got per guild; live rows never move it,
+            # so an event that lands before a guild's turn cannot hide the gap
+            db.execute("CREATE TABLE IF NOT EXISTS audit_backfill (guild_id INTEGER PRIMARY KEY, last_id INTEGER NOT NULL)")
+            floor = discord.utils.time_snowflake(discord.utils.utcnow() - timedelta(days=AUDIT_RETENTION_DAYS))
+            db.execute("DELETE FROM audit WHERE id < ?", (floor,))
+            self._db = db
+        except Exception as e:
+            print(f"[audit_index] persistence disabled: {e}")
+            self._db_failed = True
+        return self._db
+
+    @property
+    def available(self) -> bool:
+        # no lock: the database is opened lazily on an executor thread
+        return not self._db_failed
+
+    @staticmethod
+    def _row(entry: discord.AuditLogEntry) -> tuple:
+        user, target = entry.user, entry.target
+        actor = str(user) if user is not None and not isinstance(user, discord.Object) else None
+        target_id = getattr(target, "id", None)
+        label = str(target) if target is not None and not isinstance(target, discord.Object) else None
+        return (entry.guild.id, entry.id, entry.action.name, entry.user_id, target_id,
+                actor, label[:100] if label else None, (entry.reason or "")[:300] or None)
+
+    def _write_many(self, rows: list, guild_id: int | None = None, mark: int | None = None):
+        # `mark` advances the guild's backfill watermark in the same transaction
+        with self._lock:
+            db = self._open()
+            if db is None:
+                return
+            with db:
+                db.execute("BEGIN")
+                db.executemany("INSERT OR REPLACE INTO audit VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                if mark is not None:
+                    db.execute(
+                        "INSERT INTO audit_backfill (guild_id, last_id) VALUES (?, ?) "
+                        "ON CONFLICT(guild_id) DO UPDATE SET last_id = MAX(last_id, excluded.last_id)",
+                        (guild_id, mark),
+                    )
+
+    def add(self, entry: discord.AuditLogEntry):
+        # the writer shares the lock with backfill pages and queries on executor
+        # threads, so live rows are queued and written from there too
+        self._live.append(self._row(entry))
+        if self._live_task is None or self._live_task.done():
+            self._live_task = bot.loop.create_task(self._write_live())
+
+    async def _write_live(self):
+        loop = asyncio.get_running_loop()
+        while self._live:
+            rows, self._live = self._live, []
+            try:
+                await loop.run_in_executor(None, self._write_many, rows)
+            except Exception as e:
+                print(f"[audit_index] dropped {len(rows)} live entries: {e}")
+
+    def _forget(self, guild_id: int):
+        with self._lock:
+            db = self._open()
+            if db is not None:
+                db.execute("DELETE FROM audit WHERE guild_id = ?", (guild_id,))
+                db.execute("DELETE FROM audit_backfill WHERE guild_id = ?", (guild_id,))
+
+    async def forget_guild(self, guild_id: int):
+        await asyncio.get_running_loop().run_in_executor(None, self._forget, guild_id)
+
+    def _watermark(self, guild_id: int) -> int | None:
+        with self._lock:
+            db = self._open()
+            if db is None:
+                return None
+            row = db.execute("SELECT last_id FROM audit_backfill WHERE guild_id = ?", (guild_id,)).fetchone()
+            return row[0] if row else None
+
+    def _query(self, guild_id: int, actions, actor_id, target_id, before, limit: int) -> list:
+        sql = "SELECT id, action, actor_id, target_id, actor, target, reason FROM audit WHERE guild_id = ?"
+        params = [guild_id]
+        if actions:
+            sql += f" AND action IN ({', '.join('?' * len(actions))})"
+            params += actions
+        if actor_id is not None:
+            sql += " AND actor_id = ?"
+            params.append(actor_id)
+        if target_id is not None:
+            sql += " AND target_id = ?"
+            params.append(target_id)
+        if before is not None:
+            sql += " AND id < ?"
+            params.append(before)
+        sql += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            db = self._open()
+            if db is None:
+                return []
+            return db.execute(sql, params).fetchall()
+
+    async def search(self, guild_id: int, actions=(), actor_id=None, target_id=None, before=None, limit: int = AUDIT_PAGE_SIZE) -> list:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._query, guild_id, list(actions), actor_id, target_id, before, limit)
+
+    # --- backfill ---
+    def start(self, guilds):
+        for g in guilds:
+            if g.id not in self.backfilling:
+                self.backfilling.add(g.id)
+                self._pending.append(g)
+        if self._pending and (self._task is None or self._task.done()):
+            self._task = bot.loop.create_task(self._run())
+
+    async def _run(self):
+        # one guild at a time: the audit log route is rate limited per guild,
+        # but there is no reason to contend with the bot's other REST traffic
+        while self._pending:
+            guild = self._pending.pop(0)
+            started = time.perf_counter()
+            try:
+                n = await self.backfill(guild)
+                if n:
+                    print(f"[audit_index] {guild.name}: {n} entries backfilled in {time.perf_counter() - started:.1f}s")
+            except discord.HTTPException as e:
+                print(f"[audit_index] backfill failed for {guild.id}: {e}")
+            except Exception:
+                traceback.print_exc()
+            finally:
+                self.backfilling.discard(guild.id)
+
+    async def backfill(self, guild: discord.Guild) -> int:
+        if guild.me is None or not guild.me.guild_permissions.view_audit_log:
+            return 0
+        loop = asyncio.get_running_loop()
+        mark = await loop.run_in_executor(None, self._watermark, guild.id)
+        floor = discord.utils.time_snowflake(discord.utils.utcnow() - timedelta(days=AUDIT_BACKFILL_DAYS))
+        written = 0
+        rows = []
+        # oldest_first so each request asks for the 100 entries after the last
+        # one seen; without it discord.py walks newest-first down to `after`
+        after = discord.Object(id=max(mark or 0, floor))
+        async for entry in guild.audit_logs(limit=None, after=after, oldest_first=True):
+            rows.append(self._row(entry))
+            if len(rows) >= AUDIT_WRITE_BATCH:
+                await loop.run_in_executor(None, self._write_many, rows, guild.id, rows[-1][1])
+                written += len(rows)
+                rows = []
+        if rows:
+            await loop.run_in_executor(None, self._write_many, rows, guild.id, rows[-1][1])
+            written += len(rows)
+        return written
+
+audit_index = AuditIndex(AUDIT_INDEX_FILE)
+
+def _audit_name(guild: discord.Guild, uid, label) -> str:
+    # cache or stored label only; ?audit never goes to REST
+    if uid is None:
+        return label or "?"
+    who = guild.get_member(uid) or bot.get_user(uid)
+    return str(who) if who else (label or str(uid))
+
 @bot.command(name="audit")
+@commands.guild_only()
 @commands.has_permissions(administrator=True)
-async def cmd_audit(ctx, action: str = None):
-    if action not in ("bans", "kicks", None):
-        return await safe_send(ctx, "(¬_¬) Use `?audit bans` or `?audit kicks`.")
-    entries = []
-    try:
-        async for entry in ctx.guild.audit_logs(limit=20):
-            if action is None:
-                entries.append(f"{entry.action.name} | {entry.target} by {entry.user} at {entry.created_at.isoformat()}")
-            elif action == "bans" and entry.action.name.lower() == "ban":
-                entries.append(f"{entry.target} banned by {entry.user} at {entry.created_at.isoformat()}")
-            elif action == "kicks" and entry.action.name.lower() == "kick":
-                entries.append(f"{entry.target} kicked by {entry.user} at {entry.created_at.isoformat()}")
-        if not entries:
-            return await safe_send(ctx, "(･_･) No audit entries found.")
-        for i in range(0, len(entries), 8):
-            await safe_send(ctx, "```\n" + "\n".join(entries[i:i+8]) + "\n```")
-    except Exception as e:
-        await safe_send(ctx, f"(･_･;) Could not fetch audit logs: {e}")
+async def cmd_audit(ctx, *args: str):
+    usage = ("(¬_¬) Use `?audit [bans|kicks|unbans|roles|members|messages|channels|<action>] "
+             "[by:@mod] [target:@user] [before:<id>]`.")
+    actions, actor_id, target_id, before = (), None, None, None
+    for tok in args:
+        key, _, value = tok.partition(":")
+        key = key.lower()
+        if key in ("by", "target", "before") and value:
+            num = value.strip("<@!&#>")
+            if not num.isdigit():
+                return await safe_send(ctx, usage)
+            if key == "by":
+                actor_id = int(num)
+            elif key == "target":
+                target_id = int(num)
+            else:
+                before = int(num)
+        elif not value and key in AUDIT_ALIASES:
+            actions = AUDIT_ALIASES[key]
+        elif not value and key in discord.AuditLogAction.__members__:
+            actions = (key,)
+        else:
+            return await safe_send(ctx, usage)
+    if not audit_index.available:
+        return await safe_send(ctx, "(･_･;) The audit index is unavailable; check the bot logs.")
+    rows = await audit_index.search(ctx.guild.id, actions, actor_id, target_id, before, AUDIT_PAGE_SIZE + 1)
+    note = " (backfill still running)" if ctx.guild.id in audit_index.backfilling else ""
+    if not rows:
+        return await safe_send(ctx, f"(･_･) No audit entries found{note}.")
+    more = len(rows) > AUDIT_PAGE_SIZE
+    rows = rows[:AUDIT_PAGE_SIZE]
+    lines = []
+    for eid, action, uid, tid, actor, target, reason in rows:
+        when = discord.utils.snowflake_time(eid).strftime("%Y-%m-%d %H:%M")
+        line = f"{when} {action} | {_audit_name(ctx.guild, tid, target)} by {_audit_name(ctx.guild, uid, actor)}"
+        lines.append(line + (f" — {reason}" if reason else ""))
+    text = "```\n" + "\n".join(lines)[:1800] + "\n```"
+    if more:
+        rest = " ".join(a for a in args if not a.lower().startswith("before:"))
+        text += f"Older: `?audit {rest + ' ' if rest else ''}before:{rows[-1][0]}`"
+    await safe_send(ctx, text + note)
 
 # Games & utilities (dice/coin/rps etc.)
 @bot.command(name="dice")
@@ -981,17 +4053,158 @@ async def cmd_remindme(ctx, when: str, *, message: str):
         return await safe_send(ctx, "(･_･;) Use format like 10s, 5m, 2h.")
     num = int(num)
     seconds = num if unit == "s" else num*60 if unit == "m" else num*3600
-    await safe_send(ctx, f"(＾▽＾) Reminder set. I will remind you in {when}.")
-    async def do_remind():
-        await asyncio.sleep(seconds)
+    if not reminders.loaded:
+        return await safe_send(ctx, "(⌛) Reminders are still loading, try again in a moment.")
+    if reminders.count(ctx.author.id) >= REMINDERS_PER_USER:
+        return await safe_send(ctx, f"(･_･;) You already have {REMINDERS_PER_USER} reminders. Cancel one with `?cancelreminder <id>`.")
+    rid = reminders.add(ctx.author.id, ctx.channel.id, time.time() + seconds, message)
+    await safe_send(ctx, f"(＾▽＾) Reminder #{rid} set. I will remind you in {when}.")
+
+@bot.command(name="reminders")
+async def cmd_reminders(ctx):
+    pending = reminders.list(ctx.author.id)
+    if not pending:
+        return await safe_send(ctx, "(・_・) You have no pending reminders.")
+    now = time.time()
+    lines = []
+    for rid, due, text in pending[:20]:
+        left = int(max(0, due - now))
+        h, rem = divmod(left, 3600)
+        m, sec = divmod(rem, 60)
+        eta = f"{h}h {m}m" if h else f"{m}m {sec}s" if m else f"{sec}s"
+        lines.append(f"`#{rid}` in {eta} — {text[:80]}")
+    more = f"\n…and {len(pending) - 20} more" if len(pending) > 20 else ""
+    await safe_send(ctx, "(＾▽＾) Your reminders:\n" + "\n".join(lines) + more)
+
+@bot.command(name="cancelreminder")
+async def cmd_cancelreminder(ctx, reminder_id: str):
+    rid = reminder_id.lstrip("#")
+    if not rid.isdigit() or not reminders.cancel(ctx.author.id, int(rid)):
+        return await safe_send(ctx, f"(･_･) No pending reminder #{rid}. See `?reminders`.")
+    await safe_send(ctx, f"(＾▽＾) Reminder #{rid} cancelled.")
+
+@bot.command(name="schedule")
+@commands.guild_only()
+@commands.has_permissions(administrator=True)
+async def cmd_schedule(ctx, action: str = "list", *, rest: str = ""):
+    action = action.lower()
+    if action == "list":
+        anns = _announcements(ctx.guild.id)
+        if not anns:
+            return await safe_send(ctx, "(・_・) No scheduled announcements. Add one with `?schedule add #channel <cron|interval> | <message>`.")
+        lines = []
+        for aid, ann in sorted(anns.items(), key=lambda kv: int(kv[0])):
+            job = scheduler.get(f"announce:{ctx.guild.id}:{aid}")
+            nxt = f"<t:{int(job.due)}:R>" if job else "not scheduled"
+            lines.append(f"`#{aid}` <#{ann['channel_id']}> `{ann['spec']}` next {nxt} — {ann['message'][:60]}")
+        for chunk in _chunk_lines(["(＾▽＾) Scheduled announcements:"] + lines):
+            await safe_send(ctx, chunk)
+        return
+    if action == "add":
+        target, _, body = rest.partition(" ")
+        spec, sep, message = body.partition("|")
+        channel = ctx.message.channel_mentions[0] if ctx.message.channel_mentions else None
+        if channel is None or not target.startswith("<#") or not sep or not spec.strip() or not message.strip():
+            return await safe_send(ctx, "(･_･;) Use `?schedule add #channel <cron|interval> | <message>`, "
+                                        "e.g. `?schedule add #general 0 9 * * 1 | Weekly meeting!` or `?schedule add #general 6h | Drink water`.")
+        if len(_announcements(ctx.guild.id)) >= ANNOUNCEMENTS_PER_GUILD:
+            return await safe_send(ctx, f"(･_･;) This server already has {ANNOUNCEMENTS_PER_GUILD} scheduled announcements.")
         try:
-            await safe_send(ctx.author, f"(🔔) Reminder: {message}")
-        except Exception:
-            try:
-                await safe_send(ctx, f"(🔔) Reminder for {ctx.author.mention}: {message}")
-            except Exception as e:
-                print(f"[remindme] failed to deliver reminder: {e}")
-    bot.loop.create_task(do_remind())
+            aid, due = add_announcement(ctx.guild.id, channel.id, spec.strip(), message.strip()[:2000], ctx.author.id)
+        except ValueError as e:
+            return await safe_send(ctx, f"(･_･;) Invalid schedule: {e}")
+        await safe_send(ctx, f"(＾▽＾) Announcement #{aid} scheduled in {channel.mention}, first post <t:{int(due)}:R>.")
+        await log_event("moderation", f"📅 {ctx.author} scheduled announcement #{aid} (`{spec.strip()}`) in {ctx.guild.name}", guild_id=ctx.guild.id)
+        return
+    if action in ("remove", "delete", "cancel"):
+        aid = rest.strip().lstrip("#")
+        if not aid.isdigit() or not remove_announcement(ctx.guild.id, int(aid)):
+            return await safe_send(ctx, f"(･_･) No announcement #{aid}. See `?schedule list`.")
+        return await safe_send(ctx, f"(＾▽＾) Announcement #{aid} removed.")
+    await safe_send(ctx, "(･_･;) Use `?schedule list`, `?schedule add ...` or `?schedule remove <id>`.")
+
+def _music_enabled(ctx) -> bool:
+    return ctx.guild is not None and ensure_guild(ctx.guild.id)["categories"].get("music", True)
+
+@bot.command(name="play")
+async def cmd_play(ctx, *, query: str):
+    if not _music_enabled(ctx):
+        return await safe_send(ctx, "(･_･) Music is disabled in this server.")
+    voice_state = getattr(ctx.author, "voice", None)
+    if not voice_state or not voice_state.channel:
+        return await safe_send(ctx, "(･_･;) Join a voice channel first.")
+    path = await find_library_track(query)
+    if not path:
+        return await safe_send(ctx, f"(・_・;) No track in the library matches `{query}`.")
+    player = get_player(ctx.guild.id)
+    try:
+        if player.voice is None or not player.voice.is_connected():
+            player.voice = ctx.guild.voice_client or await voice_state.channel.connect()
+        elif player.voice.channel != voice_state.channel:
+            await player.voice.move_to(voice_state.channel)
+    except Exception as e:
+        return await safe_send(ctx, f"(･_･;) Could not join voice: {e}")
+    player.enqueue(path)
+    await safe_send(ctx, f"(♪) Queued **{os.path.splitext(os.path.basename(path))[0]}**.")
+
+@bot.command(name="skip")
+async def cmd_skip(ctx):
+    player = music_players.get(ctx.guild.id) if ctx.guild else None
+    if not player or not player.skip():
+        return await safe_send(ctx, "(･_･) Nothing is playing.")
+    await safe_send(ctx, "(⏭) Skipped.")
+
+@bot.command(name="queue")
+async def cmd_queue(ctx):
+    player = music_players.get(ctx.guild.id) if ctx.guild else None
+    if not player or (player.now_playing is None and not player.up_next and not player.queue):
+        return await safe_send(ctx, "(･_･) The queue is empty.")
+    lines = []
+    if player.now_playing:
+        lines.append(f"▶ **{player.now_playing.title}**")
+    if player.up_next:
+        lines.append(f"⏭ {player.up_next}")
+    for i, path in enumerate(list(player.queue)[:15], 1):
+        lines.append(f"{i}. {os.path.splitext(os.path.basename(path))[0]}")
+    if len(player.queue) > 15:
+        lines.append(f"… and {len(player.queue) - 15} more")
+    await safe_send(ctx, "\n".join(lines))
+
+@bot.command(name="stop")
+async def cmd_stop(ctx):
+    player = music_players.pop(ctx.guild.id, None) if ctx.guild else None
+    if not player:
+        return await safe_send(ctx, "(･_･) Nothing is playing.")
+    await player.stop()
+    await safe_send(ctx, "(＾▽＾) Stopped and left voice.")
+
+@bot.command(name="musicstats")
+async def cmd_musicstats(ctx, dimension: str = "track", window: str = "day", count: int = 10):
+    if ctx.guild is None:
+        return await safe_send(ctx, "(･_･) Music stats only work in servers.")
+    dimension = dimension.lower()
+    window = window.lower()
+    if dimension not in MUSIC_STATS_DIMENSIONS:
+        return await safe_send(ctx, f"(･_･;) Use one of: {', '.join(MUSIC_STATS_DIMENSIONS)}.")
+    if window not in MUSIC_STATS_WINDOWS:
+        return await safe_send(ctx, f"(･_･;) Window must be one of: {', '.join(MUSIC_STATS_WINDOWS)}.")
+    count = max(1, min(25, count))
+    rows = music_stats.top(ctx.guild.id, dimension, window, count)
+    if not rows:
+        return await safe_send(ctx, "(・_・;) No music links recorded yet.")
+    lines = []
+    for i, (key, n) in enumerate(rows, 1):
+        if dimension == "poster":
+            member = ctx.guild.get_member(int(key))
+            label = member.display_name if member else f"<@{key}>"
+        elif dimension == "track":
+            label = music_stats.titles.get(key, key)
+        else:
+            label = key
+        lines.append(f"**{i}.** {label} — {n}")
+    span = "last 24h" if window == "day" else "last 30d"
+    embed = discord.Embed(title=f"Top {dimension}s ({span})", description="\n".join(lines)[:4000], color=discord.Color.purple())
+    await safe_send(ctx, embed=embed)
 
 @bot.command(name="userinfo")
 async def cmd_userinfo(ctx, member: discord.Member = None):
@@ -1023,87 +4236,486 @@ async def cmd_avatar(ctx, member: discord.Member = None):
     await safe_send(ctx, embed=embed)
 
 # ---------------- SCHEDULED TASKS ----------------
-async def schedule_unban(guild_id: int, user_id: int, unban_at: datetime):
-    gid = str(guild_id)
-    ensure_guild(guild_id)
-    server_data[gid]["scheduled_unbans"].append({"user_id": str(user_id), "unban_iso": unban_at.isoformat()})
-    save_data(server_data)
-    now = datetime.utcnow()
-    delay = (unban_at - now).total_seconds()
-    if delay <= 0:
-        delay = 1
-    await asyncio.sleep(delay)
+# Handlers run at least once (see SCHEDULER): an unban of someone who is no
+# longer banned or an unmute of someone without the role counts as done.
+# Transient failures propagate so the scheduler retries them.
+def _announce_channel(guild: discord.Guild):
+    return guild.system_channel or next((c for c in guild.text_channels if c.permissions_for(guild.me).send_messages), None)
+
+def schedule_unban(guild_id: int, user_id: int, unban_at: datetime):
+    scheduler.schedule("unban", unban_at, key=f"unban:{guild_id}:{user_id}", args=(guild_id, user_id))
+
+async def _unban_one(guild: discord.Guild, job: Job, announce: bool) -> str:
+    _, user_id = job.args
     try:
-        guild = bot.get_guild(guild_id)
-        if guild:
-            user = await bot.fetch_user(user_id)
-            await guild.unban(user)
-            channel = guild.system_channel or next((c for c in guild.text_channels if c.permissions_for(guild.me).send_messages), None)
-            if channel:
-                await safe_send(channel, f"(＾▽＾) {user} has been unbanned automatically.")
-            await log_event("moderation", f"✅ Auto-unbanned {user} in {guild.name}")
-    except Exception as e:
-        print(f"[schedule_unban] Error unbanning {user_id} from guild {guild_id}: {e}")
+        # an Object is all the endpoint needs; no fetch_user round trip
+        await guild.unban(discord.Object(id=user_id), reason="Temporary ban expired")
+    except discord.NotFound:
+        elog("schedule_unban", guild.id, outcome="not_banned", user_id=user_id)
+        return "skipped"
+    except discord.Forbidden as e:
+        print(f"[schedule_unban] Missing permissions to unban {user_id} in guild {guild.id}: {e}")
+        elog("schedule_unban", guild.id, outcome="forbidden", user_id=user_id, error=str(e))
+        return "failed"
+    user = bot.get_user(user_id) or f"<@{user_id}>"
+    if announce:
+        channel = _announce_channel(guild)
+        if channel:
+            await safe_send(channel, f"(＾▽＾) {user} has been unbanned automatically.")
+        await log_event("moderation", f"✅ Auto-unbanned {user} in {guild.name}", guild_id=guild.id)
+    elog("schedule_unban", guild.id, user_id=user_id, late_s=round(time.time() - job.due, 3))
+    return "unbanned"
+
+def schedule_unmute(guild_id: int, user_id: int, role_id: int, unmute_at: datetime):
+    scheduler.schedule("unmute", unmute_at, key=f"unmute:{guild_id}:{user_id}", args=(guild_id, user_id, role_id))
+
+async def _unmute_one(guild: discord.Guild, job: Job, announce: bool) -> str:
+    _, user_id, role_id = job.args
+    member = guild.get_member(user_id)
+    role = guild.get_role(role_id)
+    if not (member and role and role in member.roles):
+        elog("schedule_unmute", guild.id, outcome="skipped", user_id=user_id)
+        return "skipped"
     try:
-        server_data[gid]["scheduled_unbans"] = [u for u in server_data[gid]["scheduled_unbans"] if not (u["user_id"] == str(user_id) and u["unban_iso"] == unban_at.isoformat())]
-        save_data(server_data)
-    except Exception as e:
-        print(f"[schedule_unban] Error cleaning scheduled_unbans: {e}")
+        await member.remove_roles(role, reason="Temporary mute expired")
+    except (discord.NotFound, discord.Forbidden) as e:
+        print(f"[schedule_unmute] Could not unmute {user_id} in guild {guild.id}: {e}")
+        elog("schedule_unmute", guild.id, outcome="error", user_id=user_id, error=str(e))
+        return "failed"
+    if announce:
+        channel = _announce_channel(guild)
+        if channel:
+            await safe_send(channel, f"(｡◕‿◕｡) {member.mention} has been unmuted automatically.")
+        await log_event("moderation", f"✅ Auto-unmuted {member} in {guild.name}", guild_id=guild.id)
+    elog("schedule_unmute", guild.id, user_id=user_id, late_s=round(time.time() - job.due, 3))
+    return "unmuted"
 
-async def schedule_unmute(guild_id: int, user_id: int, role_id: int, unmute_at: datetime):
-    gid = str(guild_id)
-    ensure_guild(guild_id)
-    server_data[gid]["scheduled_unmutes"].append({"user_id": str(user_id), "role_id": role_id, "unmute_iso": unmute_at.isoformat()})
+# ---- bulk executor for expiring bans/mutes ----
+# Everything that falls due in one scheduler tick (e.g. the backlog after an
+# outage) arrives here as one batch. Jobs are grouped by guild; a bounded
+# number of guilds run at once, and inside a guild each route (bans, member
+# roles) has its own small in-flight limit, so one guild's backlog stays
+# inside that route's rate-limit bucket instead of bursting into 429s. The
+# limits live on the executor, so overlapping ticks for the same guild share
+# them (one pair per guild that ever had an expiring punishment).
+# discord.py still honours the bucket headers on every call. Large batches
+# report progress to the moderation log instead of announcing every user.
+BULK_GUILD_CONCURRENCY = 3
+BULK_ROUTE_CONCURRENCY = 2
+BULK_SUMMARY_MIN = 5       # jobs in one guild before switching to a summary report
+BULK_PROGRESS_EVERY = 25
+
+class ModerationExecutor:
+    def __init__(self):
+        self._guilds = asyncio.Semaphore(BULK_GUILD_CONCURRENCY)
+        self._routes = {}  # (guild_id, kind) -> Semaphore
+        self.totals = Counter()
+
+    def _route(self, guild_id: int, kind: str) -> asyncio.Semaphore:
+        sem = self._routes.get((guild_id, kind))
+        if sem is None:
+            sem = self._routes[(guild_id, kind)] = asyncio.Semaphore(BULK_ROUTE_CONCURRENCY)
+        return sem
+
+    async def run(self, jobs: list):
+        by_guild = {}
+        for job in jobs:
+            by_guild.setdefault(job.args[0], []).append(job)
+        results = await asyncio.gather(*(self._run_guild(gid, items) for gid, items in by_guild.items()))
+        return [f for failed in results for f in failed]
+
+    async def _run_guild(self, guild_id: int, jobs: list) -> list:
+        async with self._guilds:
+            guild = bot.get_guild(guild_id)
+            if guild is None:
+                for job in jobs:
+                    elog(f"schedule_{job.kind}", guild_id, outcome="guild_missing", user_id=job.args[1])
+                return []
+            bulk = len(jobs) >= BULK_SUMMARY_MIN
+            outcomes = Counter()
+            failed = []
+            started = time.perf_counter()
+            if bulk:
+                kinds = Counter(job.kind for job in jobs)
+                await log_event("moderation", f"⏳ Processing {len(jobs)} expired punishment(s) in {guild.name} "
+                                f"({kinds['unban']} unban, {kinds['unmute']} unmute)", guild_id=guild.id)
+
+            async def one(job: Job):
+                async with self._route(guild_id, job.kind):
+                    try:
+                        if job.kind == "unban":
+                            outcome = await _unban_one(guild, job, not bulk)
+                        else:
+                            outcome = await _unmute_one(guild, job, not bulk)
+                    except Exception as e:
+                        failed.append((job, e))
+                        outcome = "retry"
+                outcomes[outcome] += 1
+                done = sum(outcomes.values())
+                if bulk and done % BULK_PROGRESS_EVERY == 0 and done < len(jobs):
+                    await log_event("moderation", f"⏳ {guild.name}: {done}/{len(jobs)} expired punishments processed", guild_id=guild.id)
+
+            await asyncio.gather(*(one(job) for job in jobs))
+            self.totals.update(outcomes)
+            if bulk:
+                summary = ", ".join(f"{n} {k}" for k, n in sorted(outcomes.items()))
+                await log_event("moderation", f"✅ {guild.name}: {len(jobs)} expired punishment(s) processed in "
+                                f"{time.perf_counter() - started:.1f}s ({summary})", guild_id=guild.id)
+            elog("moderation_bulk", guild_id, latency_ms=(time.perf_counter() - started) * 1000, jobs=len(jobs), **outcomes)
+            return failed
+
+moderation_executor = ModerationExecutor()
+
+# ---- reminders ----
+# Reminder jobs carry (user_id, channel_id, text); the id shown to users is a
+# small per-user number kept in the job key (reminder:<user>:<n>). The per-user
+# index maps those numbers to job keys, so listing and cancelling never scan
+# other users' reminders. A reminder leaves the index only once it has been
+# delivered, so one that is being retried can still be listed, cancelled and
+# never has its number handed out again. Reminders that fall due in the same
+# tick are delivered together: one DM per user, or one fallback message per
+# channel.
+REMINDERS_PER_USER = 25
+REMINDER_TEXT_MAX = 1500
+REMINDER_DELIVERY_CONCURRENCY = 5
+
+class ReminderBook:
+    def __init__(self, scheduler: Scheduler):
+        self.scheduler = scheduler
+        self._by_user = {}  # user_id -> {n: job key}
+        self.loaded = False  # set by rebuild(); adds before that could reuse a persisted id
+
+    @staticmethod
+    def _key(user_id: int, rid: int) -> str:
+        return f"reminder:{user_id}:{rid}"
+
+    def count(self, user_id: int) -> int:
+        return len(self._by_user.get(user_id, ()))
+
+    def add(self, user_id: int, channel_id: int, due: float, text: str) -> int:
+        ids = self._by_user.setdefault(user_id, {})
+        rid = max(ids, default=0) + 1
+        key = self._key(user_id, rid)
+        while self.scheduler.get(key) is not None or self.scheduler.busy(key):
+            rid += 1
+            key = self._key(user_id, rid)
+        self.scheduler.schedule("reminder", due, key=key, args=(user_id, channel_id, text[:REMINDER_TEXT_MAX]))
+        ids[rid] = key
+        return rid
+
+    def list(self, user_id: int) -> list:
+        out = []
+        for rid, key in self._by_user.get(user_id, {}).items():
+            job = self.scheduler.get(key)
+            if job is not None:
+                out.append((rid, job.due, job.args[2]))
+        out.sort(key=lambda r: r[1])
+        return out
+
+    def cancel(self, user_id: int, rid: int) -> bool:
+        ids = self._by_user.get(user_id)
+        key = ids.get(rid) if ids else None
+        if key is None or self.scheduler.busy(key):
+            return False  # unknown, or being delivered right now
+        self._forget(key)
+        return self.scheduler.cancel(key)
+
+    def _forget(self, key: str):
+        _, uid, rid = key.split(":")
+        ids = self._by_user.get(int(uid))
+        if ids is not None:
+            ids.pop(int(rid), None)
+            if not ids:
+                del self._by_user[int(uid)]
+
+    def rebuild(self):
+        # after scheduler.load(); one pass over the reminder jobs
+        # includes jobs already dispatched, which the scheduler holds outside _by_key
+        self._by_user.clear()
+        keys = [key for key, job in self.scheduler._by_key.items() if job.kind == "reminder"]
+        keys += [key for key in self.scheduler._inflight if key.startswith("reminder:")]
+        for key in keys:
+            _, uid, rid = key.split(":")
+            self._by_user.setdefault(int(uid), {})[int(rid)] = key
+        self.loaded = True
+
+    async def deliver(self, jobs: list):
+        by_user = {}
+        for job in jobs:
+            by_user.setdefault(job.args[0], []).append(job)
+        sem = asyncio.Semaphore(REMINDER_DELIVERY_CONCURRENCY)
+        fallback = {}  # channel_id -> [(user_id, text)]
+        failed = []    # (job, error) pairs handed back to the scheduler for a retry
+
+        async def to_user(user_id, items):
+            async with sem:
+                user = bot.get_user(user_id)
+                if user is None:
+                    try:
+                        user = await bot.fetch_user(user_id)
+                    except discord.NotFound:
+                        user = None
+                    except discord.HTTPException as e:
+                        failed.extend((j, e) for j in items)
+                        return
+                texts = [j.args[2] for j in sorted(items, key=lambda j: j.due)]
+                if len(texts) == 1:
+                    chunks = [f"(🔔) Reminder: {texts[0]}"]
+                else:
+                    chunks = _chunk_lines(["(🔔) Reminders:"] + [f"• {t}" for t in texts])
+                sent = user is not None
+                for chunk in chunks if sent else ():
+                    if await safe_send(user, chunk) is None:
+                        sent = False
+                        break
+                if not sent:
+                    for j in items:
+                        fallback.setdefault(j.args[1], []).append((user_id, j.args[2]))
+
+        await asyncio.gather(*(to_user(uid, items) for uid, items in by_user.items()))
+        for channel_id, items in fallback.items():
+            channel = bot.get_channel(channel_id)
+            sent = channel is not None
+            lines = [f"(🔔) Reminder for <@{uid}>: {text}" for uid, text in items]
+            for chunk in _chunk_lines(lines) if sent else ():
+                if await safe_send(channel, chunk) is None:
+                    sent = False
+                    break
+            if not sent:
+                print(f"[remindme] failed to deliver {len(items)} reminder(s) in channel {channel_id}")
+        # jobs on their last attempt are dropped by the scheduler, so forget them too
+        retried = {j.key for j, _ in failed if j.attempts + 1 < JOB_MAX_ATTEMPTS}
+        for job in jobs:
+            if job.key not in retried:
+                self._forget(job.key)
+        if len(jobs) > 1:
+            elog("reminders", outcome="delivered", count=len(jobs) - len(retried), users=len(by_user),
+                 fallback=sum(map(len, fallback.values())), retried=len(retried))
+        return failed
+
+def _chunk_lines(lines: list, limit: int = 2000) -> list:
+    chunks, cur = [], ""
+    for line in lines:
+        line = line[:limit]
+        if cur and len(cur) + 1 + len(line) > limit:
+            chunks.append(cur)
+            cur = line
+        else:
+            cur = f"{cur}\n{line}" if cur else line
+    if cur:
+        chunks.append(cur)
+    return chunks
+
+reminders = ReminderBook(scheduler)
+
+# ---- recurring announcements ----
+# Definitions live in server_data[gid]["announcements"][n]; each one has a
+# single scheduler job (announce:<guild>:<n>) holding its next fire time, so
+# thousands of schedules share the scheduler's one timer task. After a fire
+# the next time is computed from *now*: runs missed during downtime collapse
+# into one post instead of being replayed. Cron expressions are evaluated in
+# UTC.
+ANNOUNCEMENTS_PER_GUILD = 25
+ANNOUNCE_MIN_INTERVAL = 300  # seconds
+ANNOUNCE_CONCURRENCY = 5
+_INTERVAL_RE = re.compile(r"^(?:every\s+)?(\d+)\s*([smhdw])$", re.IGNORECASE)
+_INTERVAL_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+class CronSpec:
+    __slots__ = ("minutes", "hours", "days", "months", "weekdays", "dom_any", "dow_any")
+    ALIASES = {"@hourly": "0 * * * *", "@daily": "0 0 * * *", "@weekly": "0 0 * * 0",
+               "@monthly": "0 0 1 * *", "@yearly": "0 0 1 1 *"}
+    SEARCH_STEPS = 20000
+
+    def __init__(self, expr: str):
+        expr = self.ALIASES.get(expr.strip().lower(), expr)
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError("cron needs 5 fields: minute hour day-of-month month day-of-week")
+        self.minutes = self._field(fields[0], 0, 59)
+        self.hours = self._field(fields[1], 0, 23)
+        self.days = self._field(fields[2], 1, 31)
+        self.months = self._field(fields[3], 1, 12)
+        self.weekdays = frozenset(d % 7 for d in self._field(fields[4], 0, 7))  # 0 and 7 are Sunday
+        self.dom_any = fields[2] == "*"
+        self.dow_any = fields[4] == "*"
+
+    @staticmethod
+    def _field(text: str, lo: int, hi: int) -> tuple:
+        values = set()
+        for part in text.split(","):
+            rng, _, step = part.partition("/")
+            step = int(step) if step else 1
+            if rng == "*":
+                a, b = lo, hi
+            elif "-" in rng:
+                a, b = (int(x) for x in rng.split("-", 1))
+            else:
+                a = b = int(rng)
+                if step > 1:
+                    b = hi
+            if step < 1 or a < lo or b > hi or a > b:
+                raise ValueError(f"`{part}` is out of range {lo}-{hi}")
+            values.update(range(a, b + 1, step))
+        return tuple(sorted(values))
+
+    def _day_ok(self, t: datetime) -> bool:
+        dom = t.day in self.days
+        dow = (t.weekday() + 1) % 7 in self.weekdays
+        if self.dom_any and self.dow_any:
+            return True
+        if self.dom_any:
+            return dow
+        if self.dow_any:
+            return dom
+        return dom or dow  # cron: either restriction matches
+
+    def next_after(self, ts: float) -> float:
+        t = datetime.fromtimestamp(ts, timezone.utc).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        for _ in range(self.SEARCH_STEPS):
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+                continue
+            if not self._day_ok(t):
+                t = (t + timedelta(days=1)).replace(hour=0, minute=0)
+                continue
+            if t.hour not in self.hours:
+                i = bisect_right(self.hours, t.hour)
+                if i == len(self.hours):
+                    t = (t + timedelta(days=1)).replace(hour=0, minute=0)
+                else:
+                    t = t.replace(hour=self.hours[i], minute=0)
+                continue
+            if t.minute not in self.minutes:
+                i = bisect_right(self.minutes, t.minute)
+                if i == len(self.minutes):
+                    t = (t + timedelta(hours=1)).replace(minute=0)
+                else:
+                    t = t.replace(minute=self.minutes[i])
+                continue
+            return t.timestamp()
+        raise ValueError("cron expression never fires")
+
+@lru_cache(maxsize=1024)
+def parse_schedule_spec(spec: str):
+    # -> ("interval", seconds) or ("cron", CronSpec)
+    m = _INTERVAL_RE.match(spec.strip())
+    if m:
+        seconds = int(m.group(1)) * _INTERVAL_UNITS[m.group(2).lower()]
+        if seconds < ANNOUNCE_MIN_INTERVAL:
+            raise ValueError(f"interval must be at least {ANNOUNCE_MIN_INTERVAL // 60} minutes")
+        return "interval", seconds
+    cron = CronSpec(spec)
+    cron.next_after(time.time())  # rejects expressions that never match
+    return "cron", cron
+
+def next_fire(spec: str, now: float, last_due: float | None = None) -> float:
+    kind, value = parse_schedule_spec(spec)
+    if last_due is not None:
+        # the scheduler may hand a job over up to SCHEDULER_TICK early; measured
+        # from `now` the slot that just fired would come out as next again
+        now = max(now, last_due)
+    if kind == "cron":
+        return value.next_after(now)
+    if last_due is None:
+        return now + value
+    # stay on the original cadence; skipped slots are coalesced
+    return last_due + value * (int((now - last_due) // value) + 1)
+
+def _announcements(guild_id: int) -> dict:
+    return ensure_guild(guild_id).setdefault("announcements", {})
+
+def add_announcement(guild_id: int, channel_id: int, spec: str, message: str, author_id: int) -> tuple:
+    parse_schedule_spec(spec)
+    anns = _announcements(guild_id)
+    aid = max((int(k) for k in anns), default=0) + 1
+    anns[str(aid)] = {"channel_id": channel_id, "spec": spec, "message": message, "author_id": author_id}
     save_data(server_data)
-    now = datetime.utcnow()
-    delay = (unmute_at - now).total_seconds()
-    if delay <= 0:
-        delay = 1
-    await asyncio.sleep(delay)
-    try:
-        guild = bot.get_guild(guild_id)
-        if guild:
-            member = guild.get_member(user_id)
-            role = guild.get_role(role_id)
-            if member and role and role in member.roles:
-                await member.remove_roles(role, reason="Temporary mute expired")
-                channel = guild.system_channel or next((c for c in guild.text_channels if c.permissions_for(guild.me).send_messages), None)
-                if channel:
-                    await safe_send(channel, f"(｡◕‿◕｡) {member.mention} has been unmuted automatically.")
-                await log_event("moderation", f"✅ Auto-unmuted {member} in {guild.name}")
-    except Exception as e:
-        print(f"[schedule_unmute] Error unmuting {user_id} in guild {guild_id}: {e}")
-    try:
-        server_data[gid]["scheduled_unmutes"] = [u for u in server_data[gid]["scheduled_unmutes"] if not (u["user_id"] == str(user_id) and u["role_id"] == role_id and u["unmute_iso"] == unmute_at.isoformat())]
-        save_data(server_data)
-    except Exception as e:
-        print(f"[schedule_unmute] Error cleaning scheduled_unmutes: {e}")
+    due = next_fire(spec, time.time())
+    scheduler.schedule("announce", due, key=f"announce:{guild_id}:{aid}", args=(guild_id, aid))
+    return aid, due
 
-async def resume_schedules():
-    await bot.wait_until_ready()
-    now = datetime.utcnow()
+def remove_announcement(guild_id: int, aid: int) -> bool:
+    anns = _announcements(guild_id)
+    if anns.pop(str(aid), None) is None:
+        return False
+    save_data(server_data)
+    scheduler.cancel(f"announce:{guild_id}:{aid}")
+    return True
+
+async def _run_announcements(jobs: list):
+    sem = asyncio.Semaphore(ANNOUNCE_CONCURRENCY)
+
+    async def one(job: Job):
+        guild_id, aid = job.args
+        ann = server_data.get(str(guild_id), {}).get("announcements", {}).get(str(aid))
+        if ann is None:
+            return  # removed while due
+        async with sem:
+            channel = bot.get_channel(ann["channel_id"])
+            if channel is not None:
+                await safe_send(channel, ann["message"])
+            else:
+                elog("announce", guild_id, outcome="channel_missing", announcement=aid)
+        now = time.time()
+        try:
+            due = next_fire(ann["spec"], now, job.due)
+        except ValueError as e:
+            print(f"[announce] {guild_id}/{aid} stopped: {e}")
+            return
+        scheduler.schedule("announce", due, key=job.key, args=job.args)
+        elog("announce", guild_id, announcement=aid, late_s=round(now - job.due, 3))
+
+    await asyncio.gather(*(one(job) for job in jobs))
+
+def _resume_announcements() -> int:
+    # definitions without a job (e.g. job store lost) get one again
+    added = 0
+    for gid, data in server_data.items():
+        for aid, ann in (data.get("announcements") or {}).items():
+            key = f"announce:{gid}:{aid}"
+            if scheduler.get(key) is None:
+                try:
+                    scheduler.schedule("announce", next_fire(ann["spec"], time.time()), key=key, args=(int(gid), int(aid)))
+                    added += 1
+                except ValueError as e:
+                    print(f"[announce] {gid}/{aid} skipped: {e}")
+    return added
+
+scheduler.register("unban", moderation_executor.run, batch=True)
+scheduler.register("unmute", moderation_executor.run, batch=True)
+scheduler.register("reminder", reminders.deliver, batch=True)
+scheduler.register("announce", _run_announcements, batch=True)
+
+def _migrate_legacy_schedules() -> int:
+    # older versions kept pending unbans/unmutes in servers.json
+    moved = 0
     for gid, data in server_data.items():
-        for u in list(data.get("scheduled_unbans", [])):
+        for u in data.pop("scheduled_unbans", None) or ():
             try:
-                unban_time = datetime.fromisoformat(u["unban_iso"])
-                user_id = int(u["user_id"])
-                if unban_time > now:
-                    bot.loop.create_task(schedule_unban(int(gid), user_id, unban_time))
-                else:
-                    bot.loop.create_task(schedule_unban(int(gid), user_id, datetime.utcnow() + timedelta(seconds=2)))
+                schedule_unban(int(gid), int(u["user_id"]), datetime.fromisoformat(u["unban_iso"]))
+                moved += 1
             except Exception as e:
-                print(f"[resume_schedules] unban schedule error: {e}")
-        for u in list(data.get("scheduled_unmutes", [])):
+                print(f"[resume_schedules] legacy unban skipped: {e}")
+        for u in data.pop("scheduled_unmutes", None) or ():
             try:
-                unmute_time = datetime.fromisoformat(u["unmute_iso"])
-                user_id = int(u["user_id"])
-                role_id = int(u["role_id"])
-                if unmute_time > now:
-                    bot.loop.create_task(schedule_unmute(int(gid), user_id, role_id, unmute_time))
-                else:
-                    bot.loop.create_task(schedule_unmute(int(gid), user_id, role_id, datetime.utcnow() + timedelta(seconds=2)))
+                schedule_unmute(int(gid), int(u["user_id"]), int(u["role_id"]), datetime.fromisoformat(u["unmute_iso"]))
+                moved += 1
             except Exception as e:
-                print(f"[resume_schedules] unmute schedule error: {e}")
+                print(f"[resume_schedules] legacy unmute skipped: {e}")
+    if moved:
+        save_data(server_data)
+    return moved
+
+async def resume_schedules():
+    await bot.wait_until_ready()
+    started = time.perf_counter()
+    loaded = await scheduler.load()
+    reminders.rebuild()
+    _resume_announcements()
+    migrated = _migrate_legacy_schedules()
+    print(f"[resume_schedules] {loaded} job(s) loaded, {migrated} migrated from servers.json")
+    elog("resume_schedules", latency_ms=(time.perf_counter() - started) * 1000, loaded=loaded, migrated=migrated)
 
 # ---------------- RUN ----------------
 def print_env_summary():
@@ -1129,7 +4741,6 @@ if __name__ == "__main__":
     try:
         if PANEL_GUILD_ID:
             ensure_guild(PANEL_GUILD_ID)
-        keep_alive()
         print("Launching bot...")
         bot.run(DISCORD_TOKEN)
     except Exception as e:
@@ -0,0 +1,276 @@
+# perfcheck.py — performance regression gate for Hazsbot
+# Runs offline micro/macro benchmarks (automod, storage, ship scoring, Wordle,
+# the full on_message pipeline) against main.py, compares them with the
+# committed baseline in perf_baseline.json and exits 1 on a significant
+# slowdown. Each benchmark is repeated; the median per-op time is compared and
+# noise is estimated with the median absolute deviation (MAD), so a change only
+# fails when it is both THRESHOLD slower and SIGMA noise-widths away.
+#
+# Usage:
+#   python perfcheck.py                      # compare with perf_baseline.json
+#   python perfcheck.py --only ship,wordle   # subset
+#   python perfcheck.py --update-baseline    # re-record (do this on the reference machine)
+#   python perfcheck.py --repeat 25 --threshold 0.15 --json
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import statistics
+import tempfile
+
+from loadtest import SyntheticWorld, load_main, CHAT, COMMANDS, MUSIC_LINKS
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE_FILE = os.path.join(HERE, "perf_baseline.json")
+MAD_SCALE = 1.4826  # MAD -> standard deviation for normally distributed noise
+STORAGE_ROUNDS = 10  # save/load round trips per storage run
+# main.py writes its data files to the cwd; on tmpfs the storage benchmark
+# measures serialisation instead of the disk's flush jitter
+SCRATCH_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+# ---------------- BENCHMARKS ----------------
+# Each factory takes the benchmark context and returns (op, ops_per_run).
+# `op` is called once per run and must perform ops_per_run operations; it may
+# be a coroutine function.
+BENCHMARKS = {}
+
+def benchmark(name: str):
+    def deco(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return deco
+
+class _Ctx:
+    # the slice of commands.Context that cmd_guess touches
+    __slots__ = ("author",)
+
+    def __init__(self, author):
+        self.author = author
+
+    async def send(self, *_, **__):
+        return None
+
+@benchmark("automod")
+def bench_automod(env):
+    main = env.main
+    rng = random.Random(7)
+    corpus = [rng.choice(CHAT) * rng.randint(1, 6) for _ in range(400)]
+    corpus += ["WHY IS EVERYONE SHOUTING", "join discord.gg/abcdef", "badword1 lol"] * 20
+    profanity, caps, invite = main.check_profanity, main.check_caps, main.check_invite
+
+    def op():
+        for text in corpus:
+            profanity(text) or caps(text) or invite(text)
+    return op, len(corpus)
+
+@benchmark("storage")
+def bench_storage(env):
+    main = env.main
+    rng = random.Random(11)
+    data = {}
+    for g in range(200):
+        warns = {str(rng.getrandbits(60)): [{"reason": "spam", "mod": str(rng.getrandbits(60)), "time": "2024-01-01T00:00:00"}]
+                 for _ in range(25)}
+        data[str(rng.getrandbits(60))] = {"auto_mod_enabled": True, "warns": warns, "log_channels": {"moderation": None}}
+
+    def op():
+        for _ in range(STORAGE_ROUNDS):
+            main.save_data(data)
+            main.load_data()
+    return op, STORAGE_ROUNDS
+
+@benchmark("ship")
+def bench_ship(env):
+    main = env.main
+    world = env.world
+    guild = world.guilds[0]
+    members = world.members[0]
+    pairs = [(members[i], members[(i * 7 + 3) % len(members)]) for i in range(len(members))]
+
+    def op():
+        for a, b in pairs:
+            main.compute_ship_score(a, b, guild)
+    return op, len(pairs)
+
+@benchmark("wordle")
+def bench_wordle(env):
+    main = env.main
+    rng = random.Random(5)
+    words = list(main.WORDLE_WORDS)
+    ctxs = [_Ctx(m) for m in env.world.members[0][:50]]
+    guesses = [rng.choice(words) for _ in range(6)]
+
+    async def op():
+        for ctx in ctxs:
+            main.active_wordles[str(ctx.author.id)] = {"word": rng.choice(words), "attempts": 0}
+            for g in guesses:
+                await main.cmd_guess.callback(ctx, g)
+        main.active_wordles.clear()
+    return op, len(ctxs) * len(guesses)
+
+@benchmark("message_pipeline")
+def bench_pipeline(env):
+    main = env.main
+    world = env.world
+    rng = random.Random(3)
+    members = world.members[0]
+    texts = []
+    for _ in range(300):
+        roll = rng.random()
+        if roll < 0.7:
+            texts.append(rng.choice(CHAT))
+        elif roll < 0.9:
+            texts.append(rng.choice(COMMANDS).format(a=rng.choice(members).mention, b=rng.choice(members).mention))
+        elif roll < 0.97:
+            texts.append(f"listen {rng.choice(MUSIC_LINKS)}")
+        else:
+            texts.append("WHY IS EVERYONE SHOUTING")
+    msgs = [world.message(0, i % len(world.channels[0]), rng.randrange(len(members)), t) for i, t in enumerate(texts)]
+
+    async def op():
+        for msg in msgs:
+            await main.on_message(msg)
+    return op, len(msgs)
+
+# ---------------- RUNNER ----------------
+class BenchEnv:
+    def __init__(self, main, world):
+        self.main = main
+        self.world = world
+
+async def _run_one(op, ops: int, is_async: bool) -> float:
+    started = time.perf_counter_ns()
+    if is_async:
+        await op()
+    else:
+        op()
+    return (time.perf_counter_ns() - started) / ops
+
+async def measure(env: BenchEnv, names, repeat: int, warmup: int) -> dict:
+    # Runs are interleaved round-robin across benchmarks so slow drift in the
+    # machine (thermal, noisy neighbours) spreads over all of them instead of
+    # landing on whichever benchmark happened to run during it.
+    ops = {}
+    for name in names:
+        op, n = BENCHMARKS[name](env)
+        ops[name] = (op, n, asyncio.iscoroutinefunction(op))
+    samples = {name: [] for name in names}
+    for round_ in range(warmup + repeat):
+        for name, (op, n, is_async) in ops.items():
+            per_op = await _run_one(op, n, is_async)
+            if round_ >= warmup:
+                samples[name].append(per_op)
+    results = {}
+    for name, values in samples.items():
+        median = statistics.median(values)
+        mad = statistics.median(abs(v - median) for v in values)
+        results[name] = {"median_ns": round(median, 1), "mad_ns": round(mad, 1), "runs": repeat, "ops_per_run": ops[name][1]}
+    return results
+
+def compare(name: str, base: dict | None, cur: dict, threshold: float, sigma: float) -> dict:
+    row = {"name": name, "current_ns": cur["median_ns"], "baseline_ns": None, "delta_pct": None, "verdict": "new"}
+    if not base:
+        return row
+    b, c = base["median_ns"], cur["median_ns"]
+    noise = MAD_SCALE * (base.get("mad_ns", 0.0) ** 2 + cur["mad_ns"] ** 2) ** 0.5
+    delta = c - b
+    row.update(baseline_ns=b, delta_pct=round(100.0 * delta / b, 1) if b else None, noise_ns=round(noise, 1))
+    if delta > b * threshold and delta > sigma * noise:
+        row["verdict"] = "SLOWER"
+    elif -delta > b * threshold and -delta > sigma * noise:
+        row["verdict"] = "faster"
+    else:
+        row["verdict"] = "ok"
+    return row
+
+def _fmt_ns(ns) -> str:
+    if ns is None:
+        return "-"
+    if ns >= 1e6:
+        return f"{ns / 1e6:.2f}ms"
+    if ns >= 1e3:
+        return f"{ns / 1e3:.2f}µs"
+    return f"{ns:.0f}ns"
+
+def print_diff(rows, baseline_meta: dict | None):
+    if baseline_meta:
+        print(f"baseline: {baseline_meta.get('created', '?')} on {baseline_meta.get('machine', '?')} (python {baseline_meta.get('python', '?')})")
+    print(f"{'benchmark':<18} {'baseline/op':>12} {'current/op':>12} {'delta':>8} {'noise':>10}  verdict")
+    for r in rows:
+        delta = f"{r['delta_pct']:+.1f}%" if r["delta_pct"] is not None else "-"
+        print(f"{r['name']:<18} {_fmt_ns(r['baseline_ns']):>12} {_fmt_ns(r['current_ns']):>12} {delta:>8} "
+              f"{_fmt_ns(r.get('noise_ns')):>10}  {r['verdict']}")
+
+def _meta() -> dict:
+    return {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}",
+    }
+
+async def _amain(args) -> int:
+    args.baseline = os.path.abspath(args.baseline)  # load_main changes the cwd
+    main = load_main(tempfile.mkdtemp(prefix="hazsbot-perfcheck-", dir=SCRATCH_DIR))
+    await main.bot._async_setup_hook()
+    world = SyntheticWorld(main, guilds=3, members=200, channels=5, rest_latency=0.0)
+
+    async def fake_oembed(url, template, timeout=6.0):
+        return {"title": "Track", "author_name": "Artist"}
+    main._fetch_oembed = fake_oembed
+    env = BenchEnv(main, world)
+
+    names = [n.strip() for n in args.only.split(",")] if args.only else list(BENCHMARKS)
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        print(f"unknown benchmark(s): {', '.join(unknown)}; available: {', '.join(BENCHMARKS)}")
+        return 2
+
+    results = await measure(env, names, args.repeat, args.warmup)
+
+    if args.update_baseline:
+        existing = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                existing = json.load(f).get("benchmarks", {})
+        existing.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"meta": _meta(), "benchmarks": existing}, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baseline written to {args.baseline}")
+        print_diff([compare(n, None, r, args.threshold, args.sigma) for n, r in results.items()], None)
+        return 0
+
+    baseline = {"meta": None, "benchmarks": {}}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    rows = [compare(n, baseline["benchmarks"].get(n), r, args.threshold, args.sigma) for n, r in results.items()]
+    if args.json:
+        print(json.dumps({"results": rows, "baseline": baseline.get("meta")}, indent=2))
+    else:
+        print_diff(rows, baseline.get("meta"))
+    slower = [r["name"] for r in rows if r["verdict"] == "SLOWER"]
+    if slower:
+        print(f"\nperformance regression in: {', '.join(slower)}")
+        return 1
+    return 0
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Benchmark Hazsbot offline and compare with the stored baseline.")
+    p.add_argument("--baseline", default=BASELINE_FILE, help="baseline JSON file")
+    p.add_argument("--update-baseline", action="store_true", help="record the current results as the new baseline")
+    p.add_argument("--only", help="comma-separated benchmark names")
+    p.add_argument("--repeat", type=int, default=15, help="measured runs per benchmark")
+    p.add_argument("--warmup", type=int, default=2, help="unmeasured runs per benchmark")
+    p.add_argument("--threshold", type=float, default=0.10, help="minimum relative slowdown that can fail (0.10 = 10%%)")
+    p.add_argument("--sigma", type=float, default=3.0, help="slowdown must also exceed this many noise widths")
+    p.add_argument("--json", action="store_true", help="print the comparison as JSON")
+    return p.parse_args(argv)
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(_amain(parse_args())))
@@ -0,0 +1,60 @@
+# test_schedule.py — CronSpec / next_fire checks for recurring announcements
+# Run with: python -m pytest -q test_schedule.py
+import tempfile
+from datetime import datetime, timezone
+
+import pytest
+
+from loadtest import load_main
+
+main = load_main(tempfile.mkdtemp(prefix="hazsbot-test-"))
+
+def ts(*args) -> float:
+    return datetime(*args, tzinfo=timezone.utc).timestamp()
+
+def test_cron_next_after_is_strictly_later():
+    cron = main.CronSpec("0 * * * *")
+    assert cron.next_after(ts(2024, 5, 1, 10, 0)) == ts(2024, 5, 1, 11, 0)
+    assert cron.next_after(ts(2024, 5, 1, 10, 59, 59)) == ts(2024, 5, 1, 11, 0)
+
+def test_cron_fields_and_aliases():
+    assert main.CronSpec("*/15 9-17 * * 1-5").next_after(ts(2024, 5, 3, 17, 50)) == ts(2024, 5, 6, 9, 0)  # Fri -> Mon
+    assert main.CronSpec("@monthly").next_after(ts(2024, 1, 31, 12, 0)) == ts(2024, 2, 1, 0, 0)
+    assert main.CronSpec("0 0 * * 7").next_after(ts(2024, 5, 1)) == ts(2024, 5, 5)  # 7 is Sunday
+
+def test_cron_day_of_month_or_day_of_week():
+    # both restricted: either one matching is enough
+    assert main.CronSpec("0 12 13 * 5").next_after(ts(2024, 9, 1)) == ts(2024, 9, 6, 12, 0)
+
+def test_cron_feb_29_and_never():
+    assert main.CronSpec("0 0 29 2 *").next_after(ts(2024, 3, 1)) == ts(2028, 2, 29)
+    with pytest.raises(ValueError):
+        main.CronSpec("0 0 31 2 *").next_after(ts(2024, 1, 1))
+    with pytest.raises(ValueError):
+        main.parse_schedule_spec("0 0 30 2 *")
+
+def test_cron_rejects_bad_fields():
+    for expr in ("60 * * * *", "* * *", "5-1 * * * *", "*/0 * * * *"):
+        with pytest.raises(ValueError):
+            main.CronSpec(expr)
+
+@pytest.mark.parametrize("spec", ["1h", "0 * * * *"])
+def test_next_fire_early_dispatch_moves_forward(spec):
+    due = ts(2024, 5, 1, 10, 0)
+    assert main.next_fire(spec, due - 0.1, due) == due + 3600
+
+@pytest.mark.parametrize("spec", ["1h", "0 * * * *"])
+def test_next_fire_late_dispatch(spec):
+    due = ts(2024, 5, 1, 10, 0)
+    assert main.next_fire(spec, due + 5, due) == due + 3600
+
+def test_next_fire_coalesces_missed_slots():
+    due = ts(2024, 5, 1, 10, 0)
+    # down for 5.5 hours: one post now, then back on the original cadence
+    assert main.next_fire("1h", due + 5.5 * 3600, due) == due + 6 * 3600
+    assert main.next_fire("0 * * * *", due + 5.5 * 3600, due) == due + 6 * 3600
+
+def test_interval_minimum():
+    with pytest.raises(ValueError):
+        main.parse_schedule_spec("every 2m")
+    assert main.parse_schedule_spec("every 6h") == ("interval", 6 * 3600)